@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from metrics import AI_CACHE_SAVED_COST, AI_CACHE_SAVED_SECONDS, AI_CACHE_SAVED_TOKENS
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s₹%]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Case, punctuation and spacing don't change the answer"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", question.lower())).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class AIResponseCache:
+    """Mongo-backed cache of AI answers to standalone analytics questions.
+
+    Entries are keyed on the normalized question, the business data snapshot
+    digest and the model, so an answer is only reused while the data it was
+    based on is unchanged. Old entries expire through a TTL index on
+    `expires_at`, and the least recently hit ones are trimmed once the
+    collection exceeds `max_entries`.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_entries: int = 1000, cost_per_1k_tokens: float = 0.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency_ms = 0.0
+        self.saved_tokens = 0
+
+    def cache_key(self, question: str, snapshot: str, model: str) -> str:
+        raw = f"{normalize_question(question)}\x00{snapshot}\x00{model}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def ensure_indexes(self, db):
+        await db.ai_response_cache.create_index("key", unique=True)
+        await db.ai_response_cache.create_index("expires_at", expireAfterSeconds=0)
+        await db.ai_response_cache.create_index("last_hit_at")
+
+    async def get(self, db, question: str, snapshot: str, model: str) -> Optional[str]:
+        """Cached answer, or None (counted as a miss)"""
+        now = datetime.now(timezone.utc)
+        doc = None
+        try:
+            doc = await db.ai_response_cache.find_one_and_update(
+                {"key": self.cache_key(question, snapshot, model), "expires_at": {"$gt": now}},
+                {"$set": {"last_hit_at": now}, "$inc": {"hits": 1}},
+                projection={"_id": 0, "response": 1, "latency_ms": 1, "tokens": 1}
+            )
+        except Exception as e:
+            logger.error(f"AI cache lookup error: {e}")
+
+        if not doc:
+            self.misses += 1
+            return None
+        latency_ms = doc.get("latency_ms") or 0
+        tokens = doc.get("tokens") or 0
+        self.hits += 1
+        self.saved_latency_ms += latency_ms
+        self.saved_tokens += tokens
+        AI_CACHE_SAVED_SECONDS.inc(latency_ms / 1000)
+        AI_CACHE_SAVED_TOKENS.inc(tokens)
+        AI_CACHE_SAVED_COST.inc(tokens / 1000 * self.cost_per_1k_tokens)
+        return doc["response"]
+
+    async def put(self, db, question: str, snapshot: str, model: str, prompt: str, response: str, latency_ms: float):
+        now = datetime.now(timezone.utc)
+        try:
+            await db.ai_response_cache.update_one(
+                {"key": self.cache_key(question, snapshot, model)},
+                {"$set": {
+                    "question": normalize_question(question),
+                    "model": model,
+                    "snapshot": snapshot,
+                    "response": response,
+                    "latency_ms": latency_ms,
+                    "tokens": estimate_tokens(prompt) + estimate_tokens(response),
+                    "created_at": now,
+                    "last_hit_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl_seconds)
+                }, "$setOnInsert": {"hits": 0}},
+                upsert=True
+            )
+            await self._trim(db)
+        except Exception as e:
+            logger.error(f"AI cache store error: {e}")
+
+    async def _trim(self, db):
+        """Drop the least recently hit entries beyond max_entries"""
+        excess = await db.ai_response_cache.count_documents({}) - self.max_entries
+        if excess <= 0:
+            return
+        stale = await db.ai_response_cache.find({}, {"_id": 0, "key": 1}).sort("last_hit_at", 1).limit(excess).to_list(excess)
+        await db.ai_response_cache.delete_many({"key": {"$in": [doc["key"] for doc in stale]}})
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_latency_ms": round(self.saved_latency_ms, 1),
+            "saved_tokens": self.saved_tokens,
+            "saved_cost": round(self.saved_tokens / 1000 * self.cost_per_1k_tokens, 4)
+        }
+
+
+# Global instance
+ai_response_cache = AIResponseCache(
+    ttl_seconds=int(os.environ.get("AI_CACHE_TTL_SECONDS", 3600)),
+    max_entries=int(os.environ.get("AI_CACHE_MAX_ENTRIES", 1000)),
+    cost_per_1k_tokens=float(os.environ.get("AI_COST_PER_1K_TOKENS", 0))
+)
@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from change_queue import ChangeQueue
+from sheet_dates import date_normalizer, to_date
+
+logger = logging.getLogger(__name__)
+
+# Column names differ slightly between tabs and branches
+DATE_FIELDS = ['Sales Date', 'Date', 'Enquiry Date', 'Booking Date']
+EXECUTIVE_FIELDS = ['Executive Name', 'Executive']
+MODEL_FIELDS = ['Vehicle Model', 'Model', 'Model Name']
+
+
+def _first(record: Dict[str, Any], fields: List[str]) -> str:
+    for field in fields:
+        value = record.get(field)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+def _to_number(value: Any) -> float:
+    try:
+        return float(str(value).replace(',', '').replace('₹', '').strip() or 0)
+    except ValueError:
+        return 0.0
+
+
+class BusinessContextBuilder:
+    """Precomputed, token-budgeted business summary for grounding the AI chat.
+
+    Per-(branch, tab) summaries are recomputed only when SheetsService reports
+    that tab changed (or a service PDF is uploaded), so answering a chat
+    message never downloads a sheet - it reuses the assembled snapshot.
+    Tabs are summarized in a worker thread and swapped in on the loop.
+    """
+
+    def __init__(self, token_budget: int = 1200):
+        self.token_budget = token_budget
+        self.version = 0
+        self._tabs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._service: Dict[str, Dict[str, Any]] = {}
+        self._service_loaded = False
+        self._text: Optional[str] = None
+        self._built_at: Optional[datetime] = None
+        self._changes = ChangeQueue('Business context', self._summarize, self._swap)
+
+    # ---- incremental updates ----
+
+    def on_sheet_change(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """SheetsService listener: resummarize only the tab that changed, off the event loop"""
+        self._changes.push(branch, tab, rows)
+
+    async def settled(self):
+        """Wait for queued tab summaries to be swapped in"""
+        await self._changes.settled()
+
+    def _summarize(self, branch: str, tab: str, rows: Optional[List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        if rows is None:
+            return None
+        return self._summarize_stock(rows) if tab == 'Stock' else self._summarize_sales(rows)
+
+    def _swap(self, branch: str, tab: str, summary: Optional[Dict[str, Any]]):
+        if summary is None:
+            self._tabs.pop((branch, tab), None)
+        else:
+            self._tabs[(branch, tab)] = summary
+        self._invalidate()
+
+    def update_service_reports(self, branch: str, reports: List[Dict[str, Any]]):
+        """Resummarize technician productivity for one branch"""
+        if not reports:
+            self._service.pop(branch, None)
+        else:
+            latest = max(r.get('date', '') for r in reports)
+            rows = [r for r in reports if r.get('date', '') == latest]
+            technicians = sorted(
+                ((r.get('Technician', ''), _to_number(r.get('Veh Tot'))) for r in rows),
+                key=lambda t: t[1],
+                reverse=True
+            )
+            self._service[branch] = {'date': latest, 'technicians': technicians}
+        self._invalidate()
+
+    async def ensure_service_loaded(self, db):
+        """Load the latest service reports once; later uploads update incrementally"""
+        if self._service_loaded:
+            return
+        self._service_loaded = True
+        try:
+            reports = await db.service_reports.find({}, {"_id": 0}).to_list(None)
+        except Exception as e:
+            logger.error(f"Failed to load service reports for AI context: {e}")
+            return
+        by_branch: Dict[str, List[Dict[str, Any]]] = {}
+        for report in reports:
+            by_branch.setdefault(report.get('branch') or report.get('Branch', ''), []).append(report)
+        for branch, branch_reports in by_branch.items():
+            self.update_service_reports(branch, branch_reports)
+
+    def _invalidate(self):
+        self.version += 1
+        self._text = None
+
+    # ---- summaries ----
+
+    def _summarize_sales(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        today = datetime.now(timezone.utc).date()
+        month = today.strftime('%Y-%m')
+        # Dates read in each column's detected format (see sheet_dates)
+        formats = date_normalizer.detect_formats(rows, DATE_FIELDS)
+        month_rows = [
+            r for r in rows
+            if (day := to_date(date_normalizer.row_day(r, DATE_FIELDS, formats)))
+            and (day.year, day.month) == (today.year, today.month)
+        ]
+        executives = Counter(_first(r, EXECUTIVE_FIELDS) for r in month_rows or rows)
+        executives.pop('', None)
+        return {
+            'month': month,
+            'total': len(rows),
+            'month_total': len(month_rows),
+            'top_executives': executives.most_common(3),
+            'executives_period': 'month' if month_rows else 'all time'
+        }
+
+    def _summarize_stock(self, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        models = Counter(_first(r, MODEL_FIELDS) for r in rows)
+        models.pop('', None)
+        return {'total': len(rows), 'top_models': models.most_common(5)}
+
+    # ---- snapshot ----
+
+    def _lines(self) -> List[str]:
+        branches = sorted({branch for branch, _ in self._tabs} | set(self._service))
+        kpis, executives, stock, service = [], [], [], []
+
+        for branch in branches:
+            sold = self._tabs.get((branch, 'Sold'))
+            enquiry = self._tabs.get((branch, 'Enquiry'))
+            bookings = self._tabs.get((branch, 'Bookings'))
+            parts = []
+            for label, summary in (('sold', sold), ('enquiries', enquiry), ('bookings', bookings)):
+                if summary:
+                    parts.append(f"{label} {summary['month_total']} this month / {summary['total']} total")
+            if sold and enquiry and enquiry['total']:
+                parts.append(f"conversion {sold['total'] / enquiry['total'] * 100:.1f}%")
+            if parts:
+                kpis.append(f"- {branch}: " + ", ".join(parts))
+
+            if sold and sold['top_executives']:
+                names = ", ".join(f"{name} ({count})" for name, count in sold['top_executives'])
+                executives.append(f"- {branch} ({sold['executives_period']}): {names}")
+
+            stock_summary = self._tabs.get((branch, 'Stock'))
+            if stock_summary:
+                models = ", ".join(f"{name} ({count})" for name, count in stock_summary['top_models'])
+                stock.append(f"- {branch}: {stock_summary['total']} vehicles" + (f"; top models {models}" if models else ""))
+
+            service_summary = self._service.get(branch)
+            if service_summary:
+                techs = ", ".join(f"{name} {count:g} vehicles" for name, count in service_summary['technicians'][:3])
+                service.append(f"- {branch} ({service_summary['date']}): {techs}")
+
+        lines = []
+        for title, section in (
+            ("Branch KPIs:", kpis),
+            ("Top sales executives:", executives),
+            ("Stock on hand:", stock),
+            ("Technician productivity (latest service report):", service)
+        ):
+            if section:
+                lines.append(title)
+                lines.extend(section)
+        return lines
+
+    def snapshot(self) -> Tuple[int, str]:
+        """(version, text) of the current summary, trimmed to the token budget"""
+        if self._text is None:
+            budget = self.token_budget * 4  # ~4 characters per token
+            kept, used = [], 0
+            for line in self._lines():
+                if used + len(line) + 1 > budget:
+                    break
+                kept.append(line)
+                used += len(line) + 1
+            self._text = "\n".join(kept)
+            self._built_at = datetime.now(timezone.utc)
+        return self.version, self._text
+
+    @property
+    def digest(self) -> str:
+        """Content hash of the snapshot - stable across restarts, unlike `version`"""
+        _, text = self.snapshot()
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def ground(self, message: str, session) -> str:
+        """Prefix the message with the snapshot when the session hasn't seen this version yet"""
+        version, text = self.snapshot()
+        if not text or getattr(session, 'context_version', None) == version:
+            return message
+        session.context_version = version
+        built_at = self._built_at.strftime('%Y-%m-%d %H:%M UTC')
+        return (
+            f"Current business data (snapshot v{version}, {built_at}). "
+            f"Use it to answer; say so if it doesn't cover the question.\n"
+            f"{text}\n\nQuestion: {message}"
+        )
+
+
+# Global instance
+business_context = BusinessContextBuilder(
+    token_budget=int(os.environ.get('AI_CONTEXT_TOKEN_BUDGET', 1200))
+)
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Type
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_MESSAGE = """You are a helpful AI assistant for Dharani TVS Business Manager.
+            You help analyze sales data, provide insights on dealership performance, and answer questions about:
+            - Sales metrics and trends
+            - Vehicle sales data analysis
+            - Service department performance
+            - Inventory management
+            - Executive/staff performance
+            Be concise and helpful. Use Indian Rupee (₹) for currency."""
+
+DEFAULT_AI_PROVIDER = "gemini"
+DEFAULT_AI_MODEL = "gemini-2.5-flash"
+
+
+class ChatBackend:
+    """Base class for the LLM backends behind the AI chat endpoints"""
+
+    def __init__(self, api_key: str, session_id: str, system_message: str, provider: str, model: str):
+        self.api_key = api_key
+        self.session_id = session_id
+        self.system_message = system_message
+        self.provider = provider
+        self.model = model
+
+    async def send(self, text: str) -> str:
+        """Send a user message and return the complete response"""
+        raise NotImplementedError
+
+    async def stream(self, text: str) -> AsyncIterator[str]:
+        """Yield response chunks as they arrive (one chunk if the backend cannot stream)"""
+        yield await self.send(text)
+
+    def remember(self, text: str, reply: str):
+        """Record an exchange answered without the model (e.g. from the response cache)"""
+
+    def restore(self, summary: Optional[str], turns: List[Dict[str, str]]):
+        """Replace the conversation state with a summary of older turns plus recent ones"""
+
+    def _conversation_context(self, summary: Optional[str], turns: List[Dict[str, str]]) -> str:
+        parts = [self.system_message]
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}")
+        if turns:
+            transcript = "\n".join(f"User: {t['user_message']}\nAssistant: {t['ai_response']}" for t in turns)
+            parts.append(f"Most recent messages:\n{transcript}")
+        return "\n\n".join(parts)
+
+
+class EmergentChatBackend(ChatBackend):
+    """LlmChat from emergentintegrations, used with the Emergent universal key"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # LlmChat's own history can't be appended to, so keep a copy to rebuild it from
+        self.summary: Optional[str] = None
+        self.turns: List[Dict[str, str]] = []
+        self.chat = self._new_chat(self.system_message)
+
+    def _new_chat(self, system_message: str):
+        from emergentintegrations.llm.chat import LlmChat
+
+        return LlmChat(
+            api_key=self.api_key,
+            session_id=self.session_id,
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+
+    def remember(self, text: str, reply: str):
+        self.turns.append({"user_message": text, "ai_response": reply})
+        self.chat = self._new_chat(self._conversation_context(self.summary, self.turns))
+
+    def restore(self, summary: Optional[str], turns: List[Dict[str, str]]):
+        # LlmChat keeps its history internally, so carry the context in a fresh system message
+        self.summary, self.turns = summary, list(turns)
+        self.chat = self._new_chat(self._conversation_context(summary, turns))
+
+    async def send(self, text: str) -> str:
+        from emergentintegrations.llm.chat import UserMessage
+
+        reply = await self.chat.send_message(UserMessage(text=text))
+        self.turns.append({"user_message": text, "ai_response": reply})
+        return reply
+
+
+class LiteLLMChatBackend(ChatBackend):
+    """Direct provider access through litellm, with real token streaming.
+
+    An exchange joins `messages` only once its reply is complete, so a failed
+    or cancelled call leaves no unanswered user message in the history.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages: List[Dict[str, str]] = [{"role": "system", "content": self.system_message}]
+
+    @property
+    def model_name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+    def remember(self, text: str, reply: str):
+        self.messages.append({"role": "user", "content": text})
+        self.messages.append({"role": "assistant", "content": reply})
+
+    def restore(self, summary: Optional[str], turns: List[Dict[str, str]]):
+        self.messages = [{"role": "system", "content": self._conversation_context(summary, [])}]
+        for turn in turns:
+            self.remember(turn["user_message"], turn["ai_response"])
+
+    async def send(self, text: str) -> str:
+        import litellm
+
+        response = await litellm.acompletion(
+            model=self.model_name,
+            messages=self.messages + [{"role": "user", "content": text}],
+            api_key=self.api_key
+        )
+        content = response.choices[0].message.content or ""
+        self.remember(text, content)
+        return content
+
+    async def stream(self, text: str) -> AsyncIterator[str]:
+        import litellm
+
+        response = await litellm.acompletion(
+            model=self.model_name,
+            messages=self.messages + [{"role": "user", "content": text}],
+            api_key=self.api_key,
+            stream=True
+        )
+        parts = []
+        async for chunk in response:
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+        self.remember(text, "".join(parts))
+
+
+# Provider-specific backends (e.g. a local fake provider in tests) take
+# precedence over the key-based default below.
+_BACKENDS: Dict[str, Type[ChatBackend]] = {}
+
+
+def register_backend(provider: str, backend_cls: Type[ChatBackend]):
+    """Route chats for `provider` to a specific backend class"""
+    _BACKENDS[provider] = backend_cls
+
+
+def unregister_backend(provider: str):
+    _BACKENDS.pop(provider, None)
+
+
+def create_backend(
+    api_key: str,
+    session_id: str,
+    provider: str = DEFAULT_AI_PROVIDER,
+    model: str = DEFAULT_AI_MODEL,
+    system_message: str = SYSTEM_MESSAGE
+) -> ChatBackend:
+    """Pick the chat backend for a provider/key combination"""
+    backend_cls = _BACKENDS.get(provider)
+    if backend_cls is None:
+        # The Emergent universal key only works through LlmChat; provider keys
+        # configured in Settings go straight to the provider so they can stream.
+        if api_key.startswith("sk-emergent-"):
+            backend_cls = EmergentChatBackend
+        else:
+            backend_cls = LiteLLMChatBackend
+    return backend_cls(api_key, session_id, system_message, provider, model)
+
+
+async def load_ai_config(db, fallback_api_key: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Read provider/model/key from app settings, falling back to the Emergent key"""
+    settings_doc = await db.app_settings.find_one({"setting_id": "global"}, {"_id": 0})
+
+    api_key = None
+    ai_provider = DEFAULT_AI_PROVIDER
+    ai_model = DEFAULT_AI_MODEL
+
+    if settings_doc:
+        api_key = settings_doc.get("ai_api_key")
+        if settings_doc.get("ai_provider"):
+            ai_provider = settings_doc["ai_provider"]
+        if settings_doc.get("ai_model"):
+            ai_model = settings_doc["ai_model"]
+
+    return {
+        "api_key": api_key or fallback_api_key,
+        "provider": ai_provider,
+        "model": ai_model
+    }
+
+
+class SessionForbidden(Exception):
+    """The session id is held by a live session of another user"""
+
+
+class ChatSession:
+    """A live chat backend kept between messages of one conversation"""
+
+    def __init__(self, backend: ChatBackend, user_id: str, generation: int):
+        self.backend = backend
+        self.user_id = user_id
+        self.generation = generation
+        self.last_used = time.monotonic()
+        # Business data snapshot version last sent to the model in this session
+        self.context_version: Optional[int] = None
+        self.turns = 0
+        # One exchange at a time per session so the backend's history stays ordered
+        self.lock = asyncio.Lock()
+
+
+class ChatSessionRegistry:
+    """Bounded LRU of chat sessions keyed by session_id, with idle eviction.
+
+    Follow-up messages reuse the backend (and its provider client) instead of
+    rebuilding it, and the AI settings are read once per `config_ttl` rather
+    than on every message. `invalidate()` drops everything when the AI
+    settings change.
+    """
+
+    def __init__(self, max_sessions: int = 256, idle_ttl: float = 1800, config_ttl: float = 60):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.config_ttl = config_ttl
+        self.generation = 0
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._config: Optional[Dict[str, Optional[str]]] = None
+        self._config_loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    async def get_config(self, db, fallback_api_key: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """AI settings, cached for `config_ttl` seconds (other workers' changes show up within that)"""
+        now = time.monotonic()
+        if self._config is None or now - self._config_loaded_at > self.config_ttl:
+            config = await load_ai_config(db, fallback_api_key)
+            if self._config is not None and config != self._config:
+                self._drop_sessions()
+            self._config = config
+            self._config_loaded_at = now
+        return self._config
+
+    async def acquire(self, db, session_id: str, user_id: str, fallback_api_key: Optional[str] = None) -> ChatSession:
+        """Return the live session for `session_id`, creating it if needed (SessionForbidden if another user's)"""
+        config = await self.get_config(db, fallback_api_key)
+        if not config["api_key"]:
+            raise ValueError("No AI API key configured. Please add one in Settings.")
+
+        self.evict_idle()
+        session = self._sessions.get(session_id)
+        if session and session.user_id != user_id:
+            raise SessionForbidden(f"Chat session {session_id} belongs to another user")
+        if session and session.generation == self.generation:
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+        backend = create_backend(
+            config["api_key"],
+            session_id,
+            provider=config["provider"],
+            model=config["model"]
+        )
+        session = ChatSession(backend, user_id, self.generation)
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            logger.info(f"Evicted chat session {evicted_id} (registry full)")
+        return session
+
+    def peek(self, session_id: str) -> Optional[ChatSession]:
+        """The live session for `session_id`, if any, without touching LRU order"""
+        return self._sessions.get(session_id)
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl
+        for session_id in [sid for sid, s in self._sessions.items() if s.last_used < cutoff]:
+            del self._sessions[session_id]
+
+    def invalidate(self):
+        """Forget cached settings and all live sessions (AI settings changed)"""
+        self._config = None
+        self._drop_sessions()
+
+    def _drop_sessions(self):
+        self.generation += 1
+        self._sessions.clear()
+
+
+# Global instance
+chat_sessions = ChatSessionRegistry(
+    max_sessions=int(os.environ.get("AI_SESSION_MAX", 256)),
+    idle_ttl=float(os.environ.get("AI_SESSION_IDLE_SECONDS", 1800)),
+    config_ttl=float(os.environ.get("AI_CONFIG_TTL_SECONDS", 60))
+)
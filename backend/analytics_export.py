@@ -0,0 +1,366 @@
+"""Columnar exports of the synced sheets and service_reports for analysts.
+
+Data is written as Parquet (or Arrow IPC) files in a Hive-style layout,
+partitioned by branch and month, so the whole tree reads as one dataset:
+
+    <dir>/sheets/tab=Sold/branch=Bhavani/month=2026-03/part.parquet
+    <dir>/service_reports/branch=Bhavani/month=2026-03/part.parquet
+
+Exports are incremental. A sheet tab whose digest hasn't changed since the
+last run is skipped outright; otherwise its rows are grouped by month and
+only months whose content fingerprint changed are rewritten, so a sync that
+touched this month's rows rewrites one small file, not years of history.
+Partitions that no longer have rows are removed. `manifest.json` records
+every partition (rows, bytes, fingerprint, when it was written) and is
+what the download endpoints list and stream from. Files and the manifest
+are replaced atomically, and a worker re-reads the manifest when another
+one has rewritten it.
+
+pyarrow is optional: it is imported on first export and without it the
+export reports ExportUnavailable instead of breaking startup.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+from metrics import EXPORT_PARTITIONS
+from sheet_dates import NO_DATE, date_normalizer
+from sheet_queries import DATE_FIELDS
+from sheets_service import SheetsService, sheets_service
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}  # format -> file extension
+MEDIA_TYPES = {'parquet': 'application/vnd.apache.parquet', 'arrow': 'application/vnd.apache.arrow.file'}
+UNDATED = 'undated'
+# Day number of each row as an Arrow date column next to the sheet's own text columns
+DAY_COLUMN = 'row_date'
+MANIFEST = 'manifest.json'
+ARCHIVE_CHUNK_BYTES = 256 * 1024
+
+Rows = List[Dict[str, Any]]
+
+
+class ExportUnavailable(RuntimeError):
+    """Exports are disabled or pyarrow is not installed"""
+
+
+def _month(day: int) -> str:
+    return date.fromordinal(day).strftime('%Y-%m') if day != NO_DATE else UNDATED
+
+
+def _fingerprint(rows: Rows, fmt: str) -> str:
+    digest = hashlib.sha1(fmt.encode('utf-8'))
+    for row in rows:
+        digest.update(json.dumps(row, sort_keys=True, default=str, separators=(',', ':')).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _atomic_write(path: Path, write):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.export-')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class _Sink(io.RawIOBase):
+    """Unseekable file zipfile writes into; the archive generator drains it as it goes"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self.chunks = self.chunks, []
+        return iter(chunks)
+
+
+class AnalyticsExport:
+    """Incremental Parquet/Arrow export partitioned by branch and month"""
+
+    def __init__(
+        self,
+        sheets: SheetsService,
+        directory: str,
+        fmt: str = 'parquet',
+        compression: str = 'zstd',
+        interval: float = 3600.0
+    ):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt!r}")
+        self.sheets = sheets
+        self.directory = directory
+        self.fmt = fmt
+        self.compression = compression
+        self.interval = interval
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_mtime: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    # ---- manifest ----
+
+    def manifest(self) -> Dict[str, Any]:
+        path = Path(self.directory) / MANIFEST
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            mtime = None
+        # Another worker's export replaced the file (not while this one is mid-export)
+        if self._manifest is None or (mtime != self._manifest_mtime and not self._lock.locked()):
+            try:
+                self._manifest = json.loads(path.read_text('utf-8'))
+            except FileNotFoundError:
+                self._manifest = {'sources': {}, 'partitions': {}}
+            except Exception as e:
+                logger.warning(f"Unreadable export manifest {path}, starting over: {e}")
+                self._manifest = {'sources': {}, 'partitions': {}}
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _save_manifest(self):
+        data = json.dumps(self.manifest(), indent=1, sort_keys=True)
+        path = Path(self.directory) / MANIFEST
+        _atomic_write(path, lambda tmp: Path(tmp).write_text(data, 'utf-8'))
+        self._manifest_mtime = path.stat().st_mtime
+
+    def partitions(
+        self,
+        dataset: Optional[str] = None,
+        tab: Optional[str] = None,
+        branch: Optional[str] = None,
+        from_month: Optional[str] = None,
+        to_month: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Manifest entries matching the filters (months compare as YYYY-MM; undated ones only without a range)"""
+        selected = []
+        # A copy: an export may be updating the manifest from its thread
+        for path, entry in sorted(list(self.manifest()['partitions'].items())):
+            if dataset and entry['dataset'] != dataset:
+                continue
+            if tab and entry.get('tab') != tab:
+                continue
+            if branch and entry['branch'] != branch:
+                continue
+            if (from_month or to_month) and entry['month'] == UNDATED:
+                continue
+            if from_month and entry['month'] < from_month:
+                continue
+            if to_month and entry['month'] > to_month:
+                continue
+            selected.append({'path': path, **entry})
+        return selected
+
+    def file_path(self, path: str) -> Optional[Path]:
+        """Absolute file of a partition listed in the manifest (None for anything else)"""
+        if path not in self.manifest()['partitions']:
+            return None
+        return Path(self.directory) / path
+
+    # ---- writing ----
+
+    def _partition_path(self, dataset: str, tab: Optional[str], branch: str, month: str) -> str:
+        parts = [dataset]
+        if tab:
+            parts.append(f"tab={quote(tab, safe='')}")
+        parts += [f"branch={quote(branch, safe='')}", f"month={month}", f"part.{FORMATS[self.fmt]}"]
+        return '/'.join(parts)
+
+    def _write_table(self, path: Path, rows: Rows, days: Optional[List[int]]) -> int:
+        import pyarrow as pa  # optional: only needed once something is exported
+
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        arrays = {
+            column: pa.array([None if row.get(column) is None else str(row.get(column)) for row in rows], pa.string())
+            for column in columns
+        }
+        if days is not None and DAY_COLUMN not in arrays:
+            arrays[DAY_COLUMN] = pa.array([date.fromordinal(d) if d != NO_DATE else None for d in days], pa.date32())
+        table = pa.table(arrays)
+
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+
+            _atomic_write(path, lambda tmp: pq.write_table(table, tmp, compression=self.compression or 'none'))
+        else:
+            def write_ipc(tmp):
+                options = pa.ipc.IpcWriteOptions(compression=self.compression or None)
+                with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+            _atomic_write(path, write_ipc)
+        return path.stat().st_size
+
+    def _sync_partitions(
+        self,
+        dataset: str,
+        tab: Optional[str],
+        branch: Optional[str],
+        groups: Dict[Tuple[str, str], Tuple[Rows, Optional[List[int]]]]
+    ) -> Dict[str, int]:
+        """Rewrite changed partitions of one source and drop its partitions that are gone.
+
+        `groups` maps (branch, month) to the rows (and their day numbers);
+        `branch` limits which existing partitions belong to this source.
+        """
+        partitions = self.manifest()['partitions']
+        counts = {'written': 0, 'unchanged': 0, 'removed': 0}
+        current = set()
+        for (name, month), (rows, days) in groups.items():
+            path = self._partition_path(dataset, tab, name, month)
+            current.add(path)
+            fingerprint = _fingerprint(rows, self.fmt)
+            entry = partitions.get(path)
+            if entry and entry['fingerprint'] == fingerprint and (Path(self.directory) / path).exists():
+                counts['unchanged'] += 1
+                continue
+            size = self._write_table(Path(self.directory) / path, rows, days)
+            partitions[path] = {
+                'dataset': dataset, 'tab': tab, 'branch': name, 'month': month, 'format': self.fmt,
+                'rows': len(rows), 'bytes': size, 'fingerprint': fingerprint,
+                'updated_at': datetime.now(timezone.utc).isoformat()
+            }
+            counts['written'] += 1
+
+        for path, entry in list(partitions.items()):
+            if entry['dataset'] != dataset or entry.get('tab') != tab or path in current:
+                continue
+            if branch is not None and entry['branch'] != branch:
+                continue
+            (Path(self.directory) / path).unlink(missing_ok=True)
+            del partitions[path]
+            counts['removed'] += 1
+
+        for result, count in counts.items():
+            if count:
+                EXPORT_PARTITIONS.inc(count, dataset=dataset, result=result)
+        return counts
+
+    def _export_tab(self, branch: str, tab: str, rows: Rows) -> Dict[str, int]:
+        fields = DATE_FIELDS.get(tab, ())
+        days = list(date_normalizer.row_days(rows, fields)) if fields else None
+        groups: Dict[Tuple[str, str], Tuple[Rows, Optional[List[int]]]] = {}
+        for i, row in enumerate(rows):
+            month = _month(days[i]) if days is not None else UNDATED
+            group = groups.setdefault((branch, month), ([], [] if days is not None else None))
+            group[0].append(row)
+            if days is not None:
+                group[1].append(days[i])
+        return self._sync_partitions('sheets', tab, branch, groups)
+
+    def _export_service_reports(self, docs: Rows) -> Dict[str, int]:
+        groups: Dict[Tuple[str, str], Tuple[Rows, Optional[List[int]]]] = {}
+        for doc in docs:
+            day = date_normalizer.parse(doc.get('date'))
+            group = groups.setdefault((doc.get('branch') or doc.get('Branch') or '', _month(day)), ([], []))
+            group[0].append(doc)
+            group[1].append(day)
+        return self._sync_partitions('service_reports', None, None, groups)
+
+    async def export(self, db) -> Dict[str, Any]:
+        """Bring the export up to date with the sheet cache and service_reports; returns partition counts"""
+        if not self.enabled:
+            raise ExportUnavailable("Analytics export is disabled (ANALYTICS_EXPORT_DIR is empty)")
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportUnavailable("pyarrow is not installed")
+
+        async with self._lock:
+            started = time.monotonic()
+            manifest = self.manifest()
+            totals = {'written': 0, 'unchanged': 0, 'removed': 0, 'skipped_tabs': 0}
+            for branch, tab in self.sheets.registry.tabs():
+                rows = self.sheets.peek_tab(branch, tab)
+                if rows is None:
+                    continue  # never synced here: keep what was exported
+                source = f"sheets/{tab}/{branch}"
+                stamp = f"{self.fmt}:{self.sheets.tab_digest(branch, tab)}"
+                if manifest['sources'].get(source) == stamp:
+                    totals['skipped_tabs'] += 1
+                    continue
+                counts = await asyncio.to_thread(self._export_tab, branch, tab, rows)
+                manifest['sources'][source] = stamp
+                for key, count in counts.items():
+                    totals[key] += count
+
+            docs = await db.service_reports.find({}, {'_id': 0}).to_list(None)
+            counts = await asyncio.to_thread(self._export_service_reports, docs)
+            for key, count in counts.items():
+                totals[key] += count
+
+            await asyncio.to_thread(self._save_manifest)
+            totals['seconds'] = round(time.monotonic() - started, 3)
+            self.last_run = {**totals, 'finished_at': datetime.now(timezone.utc).isoformat()}
+            logger.info(f"Analytics export: {totals}")
+            return totals
+
+    async def run(self, db):
+        """Export every `interval` seconds until cancelled"""
+        if not self.enabled or self.interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.export(db)
+            except ExportUnavailable as e:
+                logger.warning(f"Analytics export skipped: {e}")
+                return
+            except Exception as e:
+                logger.error(f"Analytics export failed: {e}")
+
+    # ---- downloads ----
+
+    def iter_archive(self, entries: List[Dict[str, Any]]) -> Iterator[bytes]:
+        """A zip (stored, the files are already compressed) of the given partitions, produced as it is read"""
+        sink = _Sink()
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for entry in entries:
+                path = Path(self.directory) / entry['path']
+                try:
+                    source = open(path, 'rb')
+                except FileNotFoundError:
+                    continue  # rewritten away since it was listed
+                with source, archive.open(entry['path'], 'w', force_zip64=True) as target:
+                    while True:
+                        block = source.read(ARCHIVE_CHUNK_BYTES)
+                        if not block:
+                            break
+                        target.write(block)
+                        yield from sink.drain()
+        yield from sink.drain()
+
+
+# Global instance
+analytics_export = AnalyticsExport(
+    sheets_service,
+    directory=os.environ.get('ANALYTICS_EXPORT_DIR', str(Path(__file__).parent / 'exports')),
+    fmt=os.environ.get('ANALYTICS_EXPORT_FORMAT', 'parquet'),
+    compression=os.environ.get('ANALYTICS_EXPORT_COMPRESSION', 'zstd'),
+    interval=float(os.environ.get('ANALYTICS_EXPORT_INTERVAL_SECONDS', 3600))
+)
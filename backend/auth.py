@@ -6,7 +6,9 @@ import os
 from models import User
 from motor.motor_asyncio import AsyncIOMotorClient
 
-JWT_SECRET = os.getenv("JWT_SECRET", "dharani-tvs-secret-key-2025")
+# Committed fallback: anyone can sign with it, so signed access tokens refuse it (see session_tokens)
+DEFAULT_JWT_SECRET = "dharani-tvs-secret-key-2025"
+JWT_SECRET = os.getenv("JWT_SECRET", DEFAULT_JWT_SECRET)
 JWT_ALGORITHM = "HS256"
 
 # Get db connection - will be initialized in server.py
@@ -0,0 +1,103 @@
+"""Date-range filtering: the linear filter loop against the date-ordered index.
+
+Builds one synthetic Sold tab with `--years` of history, indexes it the way
+the sheet cache does on load, then times typical dashboard ranges both
+ways. The linear loop checks every row; the index answers with two binary
+searches and a slice, so its cost follows the size of the range, not the
+size of the sheet.
+
+    cd backend
+    python -m benchmarks.date_range                       # 100k rows over 5 years
+    python -m benchmarks.date_range --rows 1000000 --years 10
+"""
+import argparse
+import asyncio
+import csv
+import io
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("SHEETS_SNAPSHOT_PATH", "")
+os.environ.setdefault("SHEETS_SHARED_CACHE_DIR", "")
+
+from benchmarks.fake_sheets import synthetic_csv  # noqa: E402
+from sheet_dates import DateNormalizer, TabDates  # noqa: E402
+from sheet_queries import DATE_FIELDS, filter_rows  # noqa: E402
+
+
+def ranges(today: date) -> Dict[str, tuple]:
+    return {
+        "today": (today, today),
+        "this_week": (today - timedelta(days=today.weekday()), today),
+        "this_month": (today.replace(day=1), today),
+        "last_90_days": (today - timedelta(days=89), today),
+        "this_year": (today.replace(month=1, day=1), today),
+    }
+
+
+def _time(fn, repeat: int) -> float:
+    """Best of `repeat` runs, in ms"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 3)
+
+
+def run(rows: int = 100_000, years: int = 5, repeat: int = 5) -> Dict[str, Dict[str, float]]:
+    start = date(2026, 1, 1) - timedelta(days=365 * years)
+    today = date(2025, 12, 31)
+    text = synthetic_csv("Sold", rows, seed="date-range", start=start, days=365 * years).decode("utf-8")
+    data: List[Dict[str, str]] = list(csv.DictReader(io.StringIO(text)))
+
+    normalizer = DateNormalizer()
+    index = TabDates(normalizer, DATE_FIELDS)
+    started = time.perf_counter()
+    index.apply("Bench", "Sold", data)
+    build_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    loop = asyncio.new_event_loop()
+    results = {}
+    try:
+        for name, (first, last) in ranges(today).items():
+            linear_rows = loop.run_until_complete(filter_rows(data, "Sold", start_date=first.isoformat(), end_date=last.isoformat()))
+            indexed_rows = index.select("Bench", "Sold", data, first.toordinal(), last.toordinal())
+            assert indexed_rows == linear_rows
+            linear = _time(lambda: loop.run_until_complete(
+                filter_rows(data, "Sold", start_date=first.isoformat(), end_date=last.isoformat())
+            ), repeat)
+            indexed = _time(lambda: index.select("Bench", "Sold", data, first.toordinal(), last.toordinal()), repeat)
+            results[name] = {
+                "matches": len(indexed_rows),
+                "linear_ms": linear,
+                "indexed_ms": indexed,
+                "speedup": round(linear / indexed, 1) if indexed else None,
+            }
+    finally:
+        loop.close()
+    return {"rows": rows, "years": years, "index_build_ms": build_ms, "results": results}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare linear and indexed date-range filtering")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--years", type=int, default=5, help="years of history in the sheet")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query (best is reported)")
+    args = parser.parse_args(argv)
+
+    report = run(args.rows, args.years, args.repeat)
+    print(f"rows={report['rows']} years={report['years']} index build={report['index_build_ms']} ms")
+    print(f"{'range':<16}{'matches':>9}{'linear ms':>12}{'indexed ms':>12}{'speedup':>9}")
+    for name, r in report["results"].items():
+        print(f"{name:<16}{r['matches']:>9}{r['linear_ms']:>12}{r['indexed_ms']:>12}{r['speedup']:>8}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
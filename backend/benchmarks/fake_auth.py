@@ -0,0 +1,88 @@
+"""Local stand-in for the OAuth session-data endpoint used by /api/auth/session.
+
+`GET /auth/v1/env/oauth/session-data` with an `X-Session-ID` header answers
+the profile the real provider would return. The session id decides the
+identity - "<name>" or "<name>:<anything>" logs in as <name>@example.com -
+so callers control whether a login creates a user or updates one. Counts
+requests and TCP connections so connection reuse can be checked.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+SESSION_PATH = '/auth/v1/env/oauth/session-data'
+
+
+class FakeAuthProvider:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.connections = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{SESSION_PATH}"
+
+    def start(self) -> 'FakeAuthProvider':
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send headers and body in one segment (separate writes hit Nagle + delayed ACK, ~40 ms)
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.requests += 1
+                if fake.latency:
+                    threading.Event().wait(fake.latency)
+                session_id = self.headers.get('X-Session-ID', '')
+                if self.path != SESSION_PATH or not session_id:
+                    self._reply(404, {'detail': 'Session not found'})
+                    return
+                name = session_id.split(':', 1)[0]
+                self._reply(200, {
+                    'id': name,
+                    'email': f"{name}@example.com",
+                    'name': name.title(),
+                    'picture': f"https://example.com/{name}.png",
+                    'session_token': f"st_{session_id}"
+                })
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake-auth', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,58 @@
+"""Synthetic S601 technician productivity reports for the PDF upload benchmark."""
+import random
+from typing import List
+
+HEADER = "SI No Technician Free Paid PSF Major Minor Accident PDI Veh Tot Parts Val Bench work Out Work Water Work Dealer Cat Work"
+NAMES = ['RAVI', 'KUMAR', 'SENTHIL', 'MURUGAN', 'BALA', 'GANESH', 'PRAKASH', 'VIJAY', 'SURESH', 'DINESH']
+LINES_PER_PAGE = 90
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def report_lines(technicians: int, seed: int = 601) -> List[str]:
+    rng = random.Random(seed)
+    lines = ["S601 - Technician Productivity Report", HEADER]
+    for i in range(1, technicians + 1):
+        counts = [rng.randrange(0, 12) for _ in range(7)]
+        lines.append(" ".join([
+            str(i), rng.choice(NAMES), rng.choice(NAMES),
+            *map(str, counts), str(sum(counts)), str(rng.randrange(500, 20000)),
+            *(str(rng.randrange(0, 4)) for _ in range(4))
+        ]))
+    return lines
+
+
+def build_pdf(lines: List[str]) -> bytes:
+    """Minimal multi-page PDF (Helvetica text, one line per row) that PyPDF2 can extract"""
+    pages = [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)] or [[]]
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page_lines in pages:
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in page_lines)
+        stream = f"BT /F1 8 Tf 10 TL 20 1160 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 842 1191] /Contents {content_ref} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>".encode()
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def s601_report(technicians: int = 25, seed: int = 601) -> bytes:
+    return build_pdf(report_lines(technicians, seed))
@@ -0,0 +1,161 @@
+"""Local stand-in for the Google Sheets CSV export endpoint.
+
+Serves deterministic synthetic branch sheets at
+`/spreadsheets/d/<sheet_id>/export?format=csv&gid=<gid>`, the URL shape
+SheetsService requests, so the backend can be benchmarked without network
+access. Each (sheet, gid) is generated once and kept in memory.
+"""
+import io
+import random
+import re
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+MODELS = ['Jupiter', 'Apache RTR 160', 'Raider 125', 'NTorq 125', 'XL100', 'Ronin', 'iQube', 'Radeon', 'Star City+']
+COLOURS = ['Black', 'White', 'Red', 'Blue', 'Grey', 'Matte Green']
+EXECUTIVES = ['Ravi', 'Kumar', 'Priya', 'Senthil', 'Lakshmi', 'Arun', 'Divya', 'Karthik']
+CATEGORIES = ['Scooter', 'Motorcycle', 'Moped', 'EV']
+FIRST_NAMES = ['Arjun', 'Meena', 'Suresh', 'Kavya', 'Vignesh', 'Anitha', 'Gopal', 'Revathi', 'Mani', 'Sangeetha']
+
+# Column layout per tab, matching the columns the dashboard reads
+COLUMNS = {
+    'Sold': ['Sales Date', 'Customer Name', 'Mobile No', 'Vehicle Model', 'Colour', 'Executive Name', 'Category', 'Cash/HP', 'DC Collected', 'Discount'],
+    'Enquiry': ['Enquiry Date', 'Customer Name', 'Mobile No', 'Vehicle Model', 'Executive Name', 'Source'],
+    'Bookings': ['Booking Date', 'Customer Name', 'Mobile No', 'Vehicle Model', 'Colour', 'Executive Name', 'Advance'],
+    'Stock': ['Received Date', 'Vehicle Model', 'Colour', 'Chassis No', 'Engine No', 'Status']
+}
+
+_EXPORT_PATH = re.compile(r'^/spreadsheets/d/([^/]+)/export$')
+
+
+def synthetic_csv(tab: str, rows: int, seed: str, start: date = date(2025, 1, 1), days: int = 365) -> bytes:
+    """`rows` deterministic rows of a branch tab as CSV bytes"""
+    rng = random.Random(seed)
+    columns = COLUMNS.get(tab, COLUMNS['Sold'])
+    out = io.StringIO()
+    out.write(','.join(columns) + '\n')
+    for i in range(rows):
+        day = (start + timedelta(days=rng.randrange(days))).isoformat()
+        mobile = f"9{rng.randrange(10 ** 9):09d}"
+        name = f"{rng.choice(FIRST_NAMES)} {i}"
+        model = rng.choice(MODELS)
+        colour = rng.choice(COLOURS)
+        executive = rng.choice(EXECUTIVES)
+        if tab == 'Enquiry':
+            values = [day, name, mobile, model, executive, rng.choice(['Walk-in', 'Phone', 'Referral', 'Online'])]
+        elif tab == 'Bookings':
+            values = [day, name, mobile, model, colour, executive, str(rng.randrange(1000, 10000, 500))]
+        elif tab == 'Stock':
+            values = [day, model, colour, f"MD6{rng.randrange(10 ** 10):010d}", f"E{rng.randrange(10 ** 8):08d}", 'In Stock']
+        else:
+            values = [
+                day, name, mobile, model, colour, executive, rng.choice(CATEGORIES),
+                rng.choice(['Cash', 'HP']), str(rng.randrange(0, 2000, 100)), str(rng.randrange(0, 5000, 250))
+            ]
+        out.write(','.join(values) + '\n')
+    return out.getvalue().encode('utf-8')
+
+
+class FakeSheetsServer:
+    """Threaded HTTP server answering CSV export requests.
+
+    `tabs` maps (sheet_id, gid) to (branch, tab) - typically built from the
+    branch registry - so each GID gets the right column layout. Unknown
+    sheets get 404 and the `fail` flag makes every request answer 503.
+    """
+
+    def __init__(self, tabs: Dict[Tuple[str, int], Tuple[str, str]], rows: int = 1000, latency: float = 0.0):
+        self.tabs = tabs
+        self.rows = rows
+        self.latency = latency
+        self.fail = False
+        self.requests = 0
+        self.bytes_served = 0
+        self._payloads: Dict[Tuple[str, int], bytes] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_registry(cls, registry, **kwargs) -> 'FakeSheetsServer':
+        tabs = {
+            (registry.sheet_ids[branch], settings['gid']): (branch, tab)
+            for (branch, tab), settings in registry.tabs().items()
+        }
+        return cls(tabs, **kwargs)
+
+    def payload(self, sheet_id: str, gid: int) -> Optional[bytes]:
+        key = (sheet_id, gid)
+        if key not in self.tabs:
+            return None
+        with self._lock:
+            if key not in self._payloads:
+                branch, tab = self.tabs[key]
+                self._payloads[key] = synthetic_csv(tab, self.rows, seed=f"{branch}/{tab}")
+            return self._payloads[key]
+
+    def prepare(self):
+        """Generate every sheet up front so generation time isn't measured"""
+        for sheet_id, gid in self.tabs:
+            self.payload(sheet_id, gid)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeSheetsServer':
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Send headers and body in one segment (separate writes hit Nagle + delayed ACK, ~40 ms)
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                match = _EXPORT_PATH.match(parsed.path)
+                gid = parse_qs(parsed.query).get('gid', ['0'])[0]
+                fake.requests += 1
+                if fake.latency:
+                    threading.Event().wait(fake.latency)
+                body = fake.payload(match.group(1), int(gid)) if match and gid.isdigit() else None
+                if fake.fail:
+                    self._reply(503, b'unavailable', 'text/plain')
+                elif body is None:
+                    self._reply(404, b'not found', 'text/plain')
+                else:
+                    fake.bytes_served += len(body)
+                    self._reply(200, body, 'text/csv; charset=utf-8')
+
+            def _reply(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-sheets', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
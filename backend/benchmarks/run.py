@@ -0,0 +1,402 @@
+"""Reproducible backend benchmarks, run in-process against local fakes.
+
+The FastAPI app is driven through httpx's ASGI transport. Sheets are served
+by a local fake CSV export server (benchmarks.fake_sheets) with synthetic
+branch data of configurable size, logins go to a fake OAuth provider
+(benchmarks.fake_auth), and Mongo is replaced by the in-memory stand-in from
+the test suite (or a real server with --mongo-url).
+
+    cd backend
+    python -m benchmarks.run                                  # 1k rows/tab, all scenarios
+    python -m benchmarks.run --rows 100000 --concurrency 32 --requests 500
+    python -m benchmarks.run --rows 1000000 --branches 1 --scenarios sheets.sales_filtered
+    python -m benchmarks.run --cold                           # re-download on every request
+
+Each run is appended to benchmarks/results/history.jsonl and compared with
+the previous run that used the same parameters; p50/p99 regressions beyond
+--threshold are reported (and fail the run with --fail-on-regression).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Must be set before server.py is imported
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "dharani_bench")
+os.environ.setdefault("SHEETS_SNAPSHOT_PATH", "")
+os.environ.setdefault("SHEETS_SHARED_CACHE_DIR", "")
+os.environ.setdefault("JWT_SECRET", "benchmark-jwt-secret-at-least-32-bytes")
+
+from benchmarks.fake_auth import FakeAuthProvider  # noqa: E402
+from benchmarks.fake_pdf import s601_report  # noqa: E402
+from benchmarks.fake_sheets import FakeSheetsServer  # noqa: E402
+
+BENCH_TOKEN = "bench_session_token"
+BENCH_USER = {"user_id": "user_bench", "email": "bench@example.com", "name": "Bench", "role": "admin"}
+
+
+@dataclass
+class Scenario:
+    name: str
+    call: Callable[[Any, int], Awaitable[List[Any]]]
+    description: str
+
+
+def _get(path: str, **params):
+    async def call(client, i):
+        return [await client.get(path, params=params)]
+    return call
+
+
+def build_scenarios(branches: List[str], technicians: int) -> Dict[str, Scenario]:
+    branch = branches[0]
+    pdf = s601_report(technicians)
+
+    async def dashboard(client, i):
+        # What Dashboard.js does for "All branches": 3 tabs x every branch, concurrently
+        return await asyncio.gather(*[
+            client.get(f"/api/sheets/{path}", params={"branch": b})
+            for b in branches
+            for path in ("sales-data", "enquiry-data", "bookings-data")
+        ])
+
+    async def dashboard_batch(client, i):
+        # The same load as one /api/sheets/batch call
+        return [await client.post("/api/sheets/batch", json={"queries": [
+            {"tab": tab, "branch": b} for b in branches for tab in ("Sold", "Enquiry", "Bookings")
+        ]})]
+
+    async def pdf_upload(client, i):
+        return [await client.post(
+            "/api/service/upload-pdf",
+            params={"branch": branches[i % len(branches)]},
+            files={"file": ("s601.pdf", pdf, "application/pdf")}
+        )]
+
+    async def login(client, i):
+        # 20 recurring users, so most logins update an existing account
+        return [await client.post("/api/auth/session", json={"session_id": f"bench{i % 20}:{i}"})]
+
+    scenarios = [
+        Scenario("auth.me", _get("/api/auth/me"), "signed access token check"),
+        Scenario("auth.login", login, "OAuth exchange + user upsert + session insert"),
+        Scenario("sheets.sales", _get("/api/sheets/sales-data", branch=branch), "one branch, no filters"),
+        Scenario("sheets.sales_filtered", _get(
+            "/api/sheets/sales-data", branch=branch, start_date="2025-03-01", end_date="2025-05-31", executive="Ravi"
+        ), "date range + executive"),
+        Scenario("sheets.sales_search", _get("/api/sheets/sales-data", branch=branch, search="jupiter"), "substring search"),
+        Scenario("sheets.sales_all", _get("/api/sheets/sales-data"), "every branch merged"),
+        Scenario("sheets.enquiry", _get("/api/sheets/enquiry-data", branch=branch), "one branch"),
+        Scenario("sheets.bookings", _get("/api/sheets/bookings-data", branch=branch), "one branch"),
+        Scenario("sheets.stock", _get("/api/sheets/stock-data", branch=branch, search="black"), "stock search"),
+        Scenario("sheets.branches", _get("/api/sheets/branches"), "registry lookup"),
+        Scenario("sheets.executives", _get("/api/sheets/executives", branch=branch), "distinct executives"),
+        Scenario("dashboard.all_branches", dashboard, f"{3 * len(branches)} parallel requests per load"),
+        Scenario("dashboard.batch", dashboard_batch, f"{3 * len(branches)} sub-queries in one request"),
+        Scenario("service.upload_pdf", pdf_upload, f"S601 PDF with {technicians} technicians"),
+        Scenario("service.reports", _get("/api/service/reports", branch=branch), "Mongo read"),
+    ]
+    return {scenario.name: scenario for scenario in scenarios}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), int(round(pct / 100 * len(sorted_values) + 0.5))))
+    return sorted_values[rank - 1]
+
+
+async def measure(client, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in pending:
+            started = time.perf_counter()
+            try:
+                responses = await scenario.call(client, i)
+                if any(r.status_code >= 400 for r in responses):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p90_ms": round(percentile(latencies, 90), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0
+    }
+
+
+async def _seed_db(db):
+    await db.users.update_one({"user_id": BENCH_USER["user_id"]}, {"$set": dict(BENCH_USER)}, upsert=True)
+    await db.user_sessions.update_one(
+        {"session_token": BENCH_TOKEN},
+        {"$set": {
+            "user_id": BENCH_USER["user_id"],
+            "session_token": BENCH_TOKEN,
+            "expires_at": (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+        }},
+        upsert=True
+    )
+
+
+def _bench_credential(server) -> str:
+    """What a logged-in browser sends: the signed access token, or the session token when tokens are off"""
+    if server.session_tokens.enabled:
+        return server.session_tokens.issue(BENCH_USER, BENCH_TOKEN)
+    return BENCH_TOKEN
+
+
+@asynccontextmanager
+async def bench_app(rows: int, branches: int, cold: bool, mongo_url: Optional[str] = None, latency: float = 0.0):
+    """server.app wired to the fakes; everything patched is restored on exit"""
+    import server
+    from branch_registry import DEFAULT_BRANCHES
+    from rate_limit import RouteLimits
+    from sheets_service import UpstreamHealth
+
+    service = server.sheets_service
+    registry = server.branch_registry
+    saved = {
+        "db": server.db,
+        "auth_url": server.AUTH_SESSION_URL,
+        "service": {k: getattr(service, k) for k in ("EXPORT_BASE_URL", "CACHE_TTL", "_cache", "_tab_ttl", "health")},
+        "config_file": registry.config_file,
+        "admission": server.admission.limits
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Path(tmp) / "branches.json"
+        config.write_text(json.dumps(dict(list(DEFAULT_BRANCHES.items())[:branches])))
+        registry.config_file = str(config)
+        await registry.reload()
+
+        fake = FakeSheetsServer.for_registry(registry, rows=rows, latency=latency)
+        fake.prepare()
+        fake.start()
+        auth = FakeAuthProvider(latency=latency).start()
+        server.AUTH_SESSION_URL = auth.session_url
+        await server.close_auth_http_client()
+
+        if mongo_url:
+            from motor.motor_asyncio import AsyncIOMotorClient
+            mongo = AsyncIOMotorClient(mongo_url)
+            db = mongo[os.environ["DB_NAME"]]
+        else:
+            from tests.fakes import FakeDB
+            mongo, db = None, FakeDB()
+        await _seed_db(db)
+
+        server.db = db
+        service.EXPORT_BASE_URL = fake.url
+        service.CACHE_TTL = 0 if cold else 3600
+        service._cache = {}
+        service._tab_ttl = {}
+        service.health = UpstreamHealth()
+        # One bench user drives every request: measure the endpoints, not the rate limiter
+        server.admission.limits = {name: RouteLimits(0, 0, 0, 0) for name in saved["admission"]}
+        try:
+            yield server.app, fake
+        finally:
+            fake.stop()
+            auth.stop()
+            await server.close_auth_http_client()
+            server.AUTH_SESSION_URL = saved["auth_url"]
+            if mongo is not None:
+                mongo.close()
+            server.db = saved["db"]
+            for key, value in saved["service"].items():
+                setattr(service, key, value)
+            registry.config_file = saved["config_file"]
+            await registry.reload()
+            server.admission.limits = saved["admission"]
+
+
+async def run_benchmark(
+    rows: int = 1000,
+    branches: int = 5,
+    requests: int = 100,
+    concurrency: int = 8,
+    warmup: int = 3,
+    cold: bool = False,
+    scenarios: Optional[List[str]] = None,
+    technicians: int = 40,
+    mongo_url: Optional[str] = None,
+    upstream_latency_ms: float = 0.0
+) -> Dict[str, Any]:
+    import httpx
+
+    params = {
+        "rows": rows, "branches": branches, "requests": requests, "concurrency": concurrency,
+        "mode": "cold" if cold else "warm", "technicians": technicians,
+        "mongo": "real" if mongo_url else "fake", "upstream_latency_ms": upstream_latency_ms
+    }
+    results: Dict[str, Any] = {}
+    async with bench_app(rows, branches, cold, mongo_url, upstream_latency_ms / 1000) as (app, fake):
+        import server
+        available = build_scenarios(server.sheets_service.get_branches(), technicians)
+        selected = scenarios or list(available)
+        unknown = [name for name in selected if name not in available]
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(available)})")
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url="http://bench",
+            headers={"Authorization": f"Bearer {_bench_credential(server)}"},
+            timeout=300
+        ) as client:
+            for name in selected:
+                for i in range(warmup):
+                    await available[name].call(client, i)
+                downloads = fake.requests
+                stats = await measure(client, available[name], requests, concurrency)
+                stats["upstream_requests"] = fake.requests - downloads
+                results[name] = stats
+
+    return {
+        "run_at": datetime.now(timezone.utc).isoformat(),
+        "git_sha": _git_sha(),
+        "python": platform.python_version(),
+        "params": params,
+        "results": results
+    }
+
+
+def _git_sha() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+# ---- regression tracking ----
+
+def load_history(path: Path) -> List[Dict[str, Any]]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_baseline(history: List[Dict[str, Any]], params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Most recent earlier run with identical parameters"""
+    for run in reversed(history):
+        if run.get("params") == params:
+            return run
+    return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.15, noise_ms: float = 1.0) -> List[Dict[str, Any]]:
+    """Scenarios whose p50 or p99 got more than `threshold` (and `noise_ms`) slower"""
+    regressions = []
+    for name, stats in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            old, new = before[metric], stats[metric]
+            if new - old > noise_ms and old and new / old - 1 > threshold:
+                regressions.append({
+                    "scenario": name, "metric": metric, "before": old, "after": new,
+                    "change_pct": round((new / old - 1) * 100, 1)
+                })
+    return regressions
+
+
+def format_report(run: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> str:
+    params = run["params"]
+    lines = [
+        f"rows/tab={params['rows']} branches={params['branches']} mode={params['mode']} "
+        f"concurrency={params['concurrency']} requests={params['requests']} mongo={params['mongo']}",
+        f"{'scenario':<24}{'rps':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'errors':>8}{'upstream':>10}{'vs p50':>9}"
+    ]
+    for name, stats in run["results"].items():
+        delta = ""
+        before = baseline["results"].get(name) if baseline else None
+        if before and before["p50_ms"]:
+            delta = f"{(stats['p50_ms'] / before['p50_ms'] - 1) * 100:+.0f}%"
+        lines.append(
+            f"{name:<24}{stats['throughput_rps']:>9}{stats['p50_ms']:>10}{stats['p90_ms']:>10}"
+            f"{stats['p99_ms']:>10}{stats['errors']:>8}{stats['upstream_requests']:>10}{delta:>9}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Dharani backend against local fakes")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per branch tab (1k-1M)")
+    parser.add_argument("--branches", type=int, default=5, help="number of registered branches to serve")
+    parser.add_argument("--requests", type=int, default=100, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--cold", action="store_true", help="disable the sheet cache (download + parse every request)")
+    parser.add_argument("--scenarios", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--technicians", type=int, default=40, help="rows in the synthetic S601 PDF")
+    parser.add_argument("--upstream-latency-ms", type=float, default=0.0, help="added delay per fake sheet download / auth call")
+    parser.add_argument("--mongo-url", help="use a real MongoDB instead of the in-memory stand-in")
+    parser.add_argument("--history", default=str(RESULTS_DIR / "history.jsonl"))
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative p50/p99 slowdown counted as a regression")
+    parser.add_argument("--no-record", action="store_true", help="don't append this run to the history")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    run = asyncio.run(run_benchmark(
+        rows=args.rows, branches=args.branches, requests=args.requests, concurrency=args.concurrency,
+        warmup=args.warmup, cold=args.cold, technicians=args.technicians, mongo_url=args.mongo_url,
+        scenarios=args.scenarios.split(",") if args.scenarios else None,
+        upstream_latency_ms=args.upstream_latency_ms
+    ))
+
+    history_path = Path(args.history)
+    baseline = find_baseline(load_history(history_path), run["params"])
+    print(format_report(run, baseline))
+    regressions = compare(run, baseline, args.threshold) if baseline else []
+    if baseline:
+        print(f"\nCompared with {baseline.get('git_sha') or 'unknown'} ({baseline['run_at']}): "
+              f"{len(regressions)} regression(s)")
+        for r in regressions:
+            print(f"  {r['scenario']} {r['metric']}: {r['before']} -> {r['after']} ms ({r['change_pct']:+}%)")
+    if not args.no_record:
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(history_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run) + "\n")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+# Built-in branch configuration, used until a config file or Mongo registry exists
+DEFAULT_BRANCHES: Dict[str, Dict[str, Any]] = {
+    'Bhavani': {
+        'sheet_id': '1HYtgy4pLdQkCAInxucl3UT08B9afcJwuSrNtCvgDB7g',
+        'tabs': {'Sold': 0, 'Enquiry': 1168200442, 'Bookings': 9828158, 'Stock': 471760422}
+    },
+    'Kumarapalayam': {
+        'sheet_id': '1sVI5CrCVXqT4ZgiEHz-j2LSA-sLHTIE_DcqoRk8UvCM',
+        'tabs': {'Sold': 0, 'Enquiry': 1168200442, 'Bookings': 9828158, 'Stock': 2505719}
+    },
+    'Anthiyur': {
+        'sheet_id': '1MIf_sT6t4F9-2KeKwVylWH4VGKTUNAuxCLB2-COLXkA',
+        'tabs': {'Sold': 0, 'Enquiry': 1168200442, 'Bookings': 9828158, 'Stock': 1670776756}
+    },
+    'Kavindapadi': {
+        'sheet_id': '15W3aqY11b5HdB3KGcurs0MYO_h9r3qtQgQIQSKDjzqo',
+        'tabs': {'Sold': 0, 'Enquiry': 1168200442, 'Bookings': 9828158, 'Stock': 522931946}
+    },
+    'Ammapettai': {
+        'sheet_id': '1dsV2gPw1eP-vaWv9fd25D5qJ9z5uXSd_bKLNvxmLp0I',
+        'tabs': {'Sold': 0, 'Enquiry': 1168200442, 'Bookings': 9828158, 'Stock': 674010899}
+    }
+}
+
+
+class TabConfig(BaseModel):
+    gid: int
+    refresh_interval: Optional[float] = Field(None, gt=0)
+    priority: Optional[int] = None
+
+
+class BranchConfig(BaseModel):
+    sheet_id: str = Field(..., min_length=1)
+    tabs: Dict[str, Union[int, TabConfig]]
+    refresh_interval: Optional[float] = Field(None, gt=0)
+    priority: int = 0
+    enabled: bool = True
+
+
+class BranchRegistry:
+    """Branches, their sheets and per-tab refresh settings, hot-reloadable.
+
+    Sources in order of precedence: the Mongo `branch_registry` collection
+    (one document per branch), the JSON file at `config_file`
+    ({"<branch>": {"sheet_id", "tabs", ...}}), then DEFAULT_BRANCHES.
+    `reload()` re-reads them and only installs a new version when the
+    content changed; `watch()` does that every `reload_interval` seconds,
+    so adding a branch or retuning an interval needs no restart.
+
+    Tabs inherit `refresh_interval`/`priority` from their branch, which
+    inherits `default_interval` and priority 0. Higher priority refreshes first.
+    """
+
+    def __init__(self, config_file: str = '', default_interval: float = 60.0, reload_interval: float = 30.0):
+        self.config_file = config_file
+        self.default_interval = default_interval
+        self.reload_interval = reload_interval
+        self.version = 0
+        self.source = 'defaults'
+        self._digest: Optional[str] = None
+        self._listeners: List[Callable[['BranchRegistry'], None]] = []
+        self.branches: Dict[str, Dict[str, Any]] = {}
+        self.sheet_ids: Dict[str, str] = {}
+        self.gids: Dict[str, Dict[str, int]] = {}
+        self._install(self._normalize_all(DEFAULT_BRANCHES), 'defaults')
+
+    # ---- normalization ----
+
+    def _normalize(self, name: str, raw: Dict[str, Any]) -> Dict[str, Any]:
+        """Validated branch config with tab settings resolved (raises ValueError)"""
+        config = BranchConfig(**{k: v for k, v in raw.items() if k not in ('name', 'updated_at', '_id')})
+        interval = config.refresh_interval or self.default_interval
+        tabs = {}
+        for tab, tab_config in config.tabs.items():
+            if isinstance(tab_config, int):
+                tab_config = TabConfig(gid=tab_config)
+            tabs[tab] = {
+                'gid': tab_config.gid,
+                'refresh_interval': tab_config.refresh_interval or interval,
+                'priority': config.priority if tab_config.priority is None else tab_config.priority
+            }
+        return {
+            'name': name,
+            'sheet_id': config.sheet_id,
+            'refresh_interval': interval,
+            'priority': config.priority,
+            'enabled': config.enabled,
+            'tabs': tabs
+        }
+
+    def _normalize_all(self, raw: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        branches = {}
+        for name, config in raw.items():
+            try:
+                branches[name] = self._normalize(name, config)
+            except ValueError as e:
+                # One bad entry shouldn't take every branch offline
+                logger.error(f"Ignoring invalid branch registry entry {name}: {e}")
+        return branches
+
+    def _install(self, branches: Dict[str, Dict[str, Any]], source: str) -> bool:
+        digest = hashlib.sha1(json.dumps(branches, sort_keys=True).encode('utf-8')).hexdigest()
+        if digest == self._digest:
+            self.source = source
+            return False
+        self._digest = digest
+        self.branches = branches
+        self.source = source
+        enabled = [b for b in branches.values() if b['enabled']]
+        self.sheet_ids = {b['name']: b['sheet_id'] for b in enabled}
+        self.gids = {b['name']: {tab: t['gid'] for tab, t in b['tabs'].items()} for b in enabled}
+        self.version += 1
+        if self.version > 1:
+            logger.info(f"Branch registry v{self.version} from {source}: {len(self.sheet_ids)} active branches")
+        for callback in self._listeners:
+            try:
+                callback(self)
+            except Exception as e:
+                logger.error(f"Branch registry listener failed: {e}")
+        return True
+
+    # ---- lookups ----
+
+    def add_listener(self, callback: Callable[['BranchRegistry'], None]):
+        """Register callback(registry), called after every reload that changed the registry"""
+        self._listeners.append(callback)
+
+    def tab(self, branch: str, tab: str) -> Optional[Dict[str, Any]]:
+        """{"gid", "refresh_interval", "priority"} of an active branch tab"""
+        config = self.branches.get(branch)
+        if not config or not config['enabled']:
+            return None
+        return config['tabs'].get(tab)
+
+    def tabs(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Settings of every active (branch, tab)"""
+        return {
+            (name, tab): settings
+            for name, config in self.branches.items() if config['enabled']
+            for tab, settings in config['tabs'].items()
+        }
+
+    # ---- sources ----
+
+    def _read_file(self) -> Optional[Dict[str, Any]]:
+        if not self.config_file or not os.path.exists(self.config_file):
+            return None
+        with open(self.config_file, encoding='utf-8') as f:
+            return json.load(f)
+
+    async def reload(self, db=None) -> bool:
+        """Re-read Mongo / the config file; True if a new registry version was installed"""
+        if db is not None:
+            try:
+                docs = await db.branch_registry.find({}, {"_id": 0}).to_list(None)
+            except Exception as e:
+                logger.error(f"Branch registry lookup failed: {e}")
+                return False
+            if docs:
+                return self._install(self._normalize_all({d['name']: d for d in docs if d.get('name')}), 'mongo')
+        try:
+            raw = await asyncio.to_thread(self._read_file)
+        except Exception as e:
+            logger.error(f"Failed to read branch registry file {self.config_file}: {e}")
+            return False
+        if raw is not None:
+            return self._install(self._normalize_all(raw), 'file')
+        return self._install(self._normalize_all(DEFAULT_BRANCHES), 'defaults')
+
+    async def watch(self, db=None):
+        """Background task: hot-reload the registry every reload_interval seconds"""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            await self.reload(db)
+
+    async def save_branch(self, db, name: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Create or replace a branch in Mongo and reload (raises ValueError for bad config)"""
+        normalized = self._normalize(name, config)
+        if await db.branch_registry.count_documents({}) == 0:
+            # First edit: copy the file/default branches so they stay registered
+            for existing, existing_config in self.branches.items():
+                await db.branch_registry.update_one(
+                    {"name": existing},
+                    {"$set": {**self._stored(existing_config), "name": existing}},
+                    upsert=True
+                )
+        await db.branch_registry.update_one(
+            {"name": name},
+            {"$set": {
+                **BranchConfig(**config).model_dump(),
+                "name": name,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True
+        )
+        await self.reload(db)
+        return normalized
+
+    async def delete_branch(self, db, name: str) -> bool:
+        if await db.branch_registry.count_documents({}) == 0:
+            # Registry still comes from the file/defaults: materialize it first
+            for existing, existing_config in self.branches.items():
+                if existing != name:
+                    await db.branch_registry.update_one(
+                        {"name": existing},
+                        {"$set": {**self._stored(existing_config), "name": existing}},
+                        upsert=True
+                    )
+            found = name in self.branches
+        else:
+            result = await db.branch_registry.delete_one({"name": name})
+            found = result.deleted_count > 0
+        await self.reload(db)
+        return found
+
+    @staticmethod
+    def _stored(config: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'sheet_id': config['sheet_id'],
+            'tabs': {tab: dict(settings) for tab, settings in config['tabs'].items()},
+            'refresh_interval': config['refresh_interval'],
+            'priority': config['priority'],
+            'enabled': config['enabled']
+        }
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'version': self.version,
+            'source': self.source,
+            'branches': list(self.branches.values())
+        }
+
+
+# Global instance
+branch_registry = BranchRegistry(
+    config_file=os.environ.get('BRANCH_REGISTRY_FILE', ''),
+    default_interval=float(os.environ.get('SHEETS_CACHE_TTL', 60)),
+    reload_interval=float(os.environ.get('BRANCH_REGISTRY_RELOAD_SECONDS', 30))
+)
@@ -0,0 +1,61 @@
+"""Sheet-change listeners whose work is too heavy for the event loop.
+
+A `ChangeQueue` splits a listener into `compute(branch, tab, rows)`, which
+scans the rows in a worker thread, and `commit(branch, tab, result)`, which
+swaps the result in on the loop. Changes are coalesced per (branch, tab) -
+only the newest rows matter - and handled one at a time by a single task,
+so `compute` only ever sees state from earlier commits and never races
+another compute. A tab that was removed is pushed with rows=None and both
+callbacks must drop what they hold for it. Outside a running loop (scripts,
+unit tests) changes are applied immediately.
+"""
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Rows = Optional[List[Dict[str, Any]]]
+
+
+class ChangeQueue:
+    def __init__(self, name: str, compute: Callable[[str, str, Rows], Any], commit: Callable[[str, str, Any], None]):
+        self.name = name
+        self._compute = compute
+        self._commit = commit
+        self._pending: Dict[Tuple[str, str], Rows] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def apply(self, branch: str, tab: str, rows: Rows):
+        """Compute and commit inline"""
+        self._commit(branch, tab, self._compute(branch, tab, rows))
+
+    def push(self, branch: str, tab: str, rows: Rows):
+        """Queue a change for the worker thread (applied inline when no loop is running)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.apply(branch, tab, rows)
+            return
+        self._pending[(branch, tab)] = rows
+        if not self._running(loop):
+            self._task = loop.create_task(self._drain())
+
+    def _running(self, loop: asyncio.AbstractEventLoop) -> bool:
+        return self._task is not None and not self._task.done() and self._task.get_loop() is loop
+
+    async def _drain(self):
+        while self._pending:
+            branch, tab = key = next(iter(self._pending))
+            rows = self._pending.pop(key)
+            try:
+                result = await asyncio.to_thread(self._compute, branch, tab, rows)
+                self._commit(branch, tab, result)
+            except Exception as e:
+                logger.error(f"{self.name} failed to apply {branch}/{tab}: {e}")
+
+    async def settled(self):
+        """Wait until every queued change has been committed"""
+        loop = asyncio.get_running_loop()
+        while self._running(loop):
+            await asyncio.shield(self._task)
@@ -0,0 +1,164 @@
+import base64
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_cursor(created_at: str) -> str:
+    return base64.urlsafe_b64encode(created_at.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        return base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+class ChatHistoryStore:
+    """chat_history storage: indexed reads, retention and per-session compaction.
+
+    Every turn carries an `expires_at` covered by a TTL index, so the
+    collection stays bounded at `retention_days`. Once a session has more than
+    `compact_after` uncompacted turns, all but the latest `keep_recent` are
+    folded into a running summary in chat_summaries, and the live chat
+    backend is reset to summary + recent turns so prompts stop growing.
+    """
+
+    def __init__(self, retention_days: int = 90, compact_after: int = 20, keep_recent: int = 6, summary_chars: int = 2000):
+        self.retention_days = retention_days
+        self.compact_after = compact_after
+        self.keep_recent = keep_recent
+        self.summary_chars = summary_chars
+
+    async def ensure_indexes(self, db):
+        await db.chat_history.create_index([("user_id", 1), ("session_id", 1), ("created_at", -1)])
+        await db.chat_history.create_index("expires_at", expireAfterSeconds=0)
+        await db.chat_summaries.create_index([("user_id", 1), ("session_id", 1)], unique=True)
+        await db.chat_summaries.create_index("expires_at", expireAfterSeconds=0)
+
+    def _expires_at(self) -> datetime:
+        return datetime.now(timezone.utc) + timedelta(days=self.retention_days)
+
+    async def save_turn(self, db, user_id: str, session_id: str, message: str, response: str, timings: Dict[str, Any]):
+        """Store one chat exchange in chat_history"""
+        await db.chat_history.insert_one({
+            "user_id": user_id,
+            "session_id": session_id,
+            "user_message": message,
+            "ai_response": response,
+            **timings,
+            "compacted": False,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "expires_at": self._expires_at()
+        })
+
+    async def page(self, db, user_id: str, session_id: str, cursor: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        """One page of a session's turns, newest page first, oldest-first within the page"""
+        query: Dict[str, Any] = {"user_id": user_id, "session_id": session_id}
+        if cursor:
+            query["created_at"] = {"$lt": _decode_cursor(cursor)}
+
+        docs = await db.chat_history.find(
+            query, {"_id": 0, "expires_at": 0}
+        ).sort("created_at", -1).limit(limit + 1).to_list(limit + 1)
+
+        has_more = len(docs) > limit
+        docs = docs[:limit]
+        summary = None
+        if not cursor:
+            summary_doc = await db.chat_summaries.find_one(
+                {"user_id": user_id, "session_id": session_id}, {"_id": 0, "summary": 1}
+            )
+            summary = summary_doc["summary"] if summary_doc else None
+
+        return {
+            "data": list(reversed(docs)),
+            "next_cursor": _encode_cursor(docs[-1]["created_at"]) if has_more else None,
+            "summary": summary
+        }
+
+    async def _recent_turns(self, db, user_id: str, session_id: str) -> List[Dict[str, Any]]:
+        docs = await db.chat_history.find(
+            {"user_id": user_id, "session_id": session_id, "compacted": {"$ne": True}},
+            {"_id": 0, "user_message": 1, "ai_response": 1, "created_at": 1}
+        ).sort("created_at", -1).limit(self.compact_after).to_list(self.compact_after)
+        return list(reversed(docs))
+
+    async def restore_session(self, db, user_id: str, session) -> bool:
+        """Reload a session the registry no longer holds (evicted or restarted) from Mongo"""
+        turns = await self._recent_turns(db, user_id, session.backend.session_id)
+        summary_doc = await db.chat_summaries.find_one(
+            {"user_id": user_id, "session_id": session.backend.session_id}, {"_id": 0, "summary": 1}
+        )
+        if not turns and not summary_doc:
+            return False
+        session.backend.restore(summary_doc["summary"] if summary_doc else None, turns)
+        session.turns = len(turns) + (1 if summary_doc else 0)
+        # The rebuilt history carries no data snapshot: ground the next turn again
+        session.context_version = None
+        return True
+
+    async def compact(self, db, user_id: str, session_id: str, session=None) -> bool:
+        """Fold older turns into the session summary once the session grows past compact_after"""
+        open_count = await db.chat_history.count_documents(
+            {"user_id": user_id, "session_id": session_id, "compacted": {"$ne": True}}
+        )
+        if open_count <= self.compact_after:
+            return False
+
+        older = await db.chat_history.find(
+            {"user_id": user_id, "session_id": session_id, "compacted": {"$ne": True}},
+            {"_id": 0, "user_message": 1, "ai_response": 1, "created_at": 1}
+        ).sort("created_at", 1).limit(open_count - self.keep_recent).to_list(None)
+        if not older:
+            return False
+
+        summary_doc = await db.chat_summaries.find_one(
+            {"user_id": user_id, "session_id": session_id}, {"_id": 0, "summary": 1}
+        )
+        lines = summary_doc["summary"].splitlines() if summary_doc else []
+        lines += [f"- Q: {_clip(t['user_message'], 160)} A: {_clip(t['ai_response'], 240)}" for t in older]
+        # Keep the most recent points when the summary outgrows its budget
+        while lines and sum(len(line) + 1 for line in lines) > self.summary_chars:
+            lines.pop(0)
+        summary = "\n".join(lines)
+
+        await db.chat_summaries.update_one(
+            {"user_id": user_id, "session_id": session_id},
+            {"$set": {
+                "summary": summary,
+                "compacted_through": older[-1]["created_at"],
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "expires_at": self._expires_at()
+            }},
+            upsert=True
+        )
+        await db.chat_history.update_many(
+            {"user_id": user_id, "session_id": session_id, "created_at": {"$lte": older[-1]["created_at"]}},
+            {"$set": {"compacted": True}}
+        )
+
+        if session is not None and session.user_id == user_id:
+            recent = await self._recent_turns(db, user_id, session_id)
+            async with session.lock:
+                session.backend.restore(summary, recent)
+                session.context_version = None
+        logger.info(f"Compacted {len(older)} turns of chat session {session_id}")
+        return True
+
+
+# Global instance
+chat_history = ChatHistoryStore(
+    retention_days=int(os.environ.get("CHAT_HISTORY_RETENTION_DAYS", 90)),
+    compact_after=int(os.environ.get("CHAT_COMPACT_AFTER_TURNS", 20)),
+    keep_recent=int(os.environ.get("CHAT_KEEP_RECENT_TURNS", 6))
+)
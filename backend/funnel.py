@@ -0,0 +1,308 @@
+import logging
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from change_queue import ChangeQueue
+from sheet_dates import date_normalizer, to_date
+
+logger = logging.getLogger(__name__)
+
+FUNNEL_TABS = ('Enquiry', 'Bookings', 'Sold')
+
+# Column names differ slightly between tabs and branches
+DATE_FIELDS = {
+    'Enquiry': ['Enquiry Date', 'Date'],
+    'Bookings': ['Booking Date', 'Date'],
+    'Sold': ['Sales Date', 'Date']
+}
+MOBILE_FIELDS = ['Mobile No', 'Mobile', 'Mobile Number', 'Phone', 'Contact No']
+MODEL_FIELDS = ['Vehicle Model', 'Model', 'Model Name']
+EXECUTIVE_FIELDS = ['Executive Name', 'Executive']
+CUSTOMER_FIELDS = ['Customer Name', 'Name']
+
+# Upper bounds (days, inclusive) of the time-to-convert histogram
+CONVERT_BUCKETS = [(7, '0-7'), (15, '8-15'), (30, '16-30'), (60, '31-60'), (None, '61+')]
+
+Key = Tuple[str, str]
+Entry = Tuple[Optional[date], Dict[str, Any]]
+
+
+def _first(record: Dict[str, Any], fields: List[str]) -> str:
+    for field in fields:
+        value = record.get(field)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+def parse_date(value: str) -> Optional[date]:
+    """A single date in any format the sheets use (see sheet_dates), None when unparseable"""
+    return to_date(date_normalizer.parse(value))
+
+
+def normalize_mobile(value: str) -> str:
+    """Last 10 digits, so '+91 98400 12345' and '9840012345' match"""
+    digits = re.sub(r'\D', '', value)
+    return digits[-10:] if len(digits) >= 10 else ''
+
+
+def normalize_model(value: str) -> str:
+    return ' '.join(value.lower().split())
+
+
+class TabIndex:
+    """Hash indexes over one (branch, tab): (mobile, model) and mobile alone.
+
+    Entries under each key are sorted by date (undated rows last) so the
+    first entry on or after an enquiry date is a short scan of one bucket.
+    """
+
+    def __init__(self, tab: str, rows: List[Dict[str, Any]]):
+        self.rows = 0
+        self.by_key: Dict[Key, List[Entry]] = {}
+        self.by_mobile: Dict[str, List[Entry]] = {}
+        formats = date_normalizer.detect_formats(rows, DATE_FIELDS[tab])
+        for row in rows:
+            mobile = normalize_mobile(_first(row, MOBILE_FIELDS))
+            if not mobile:
+                continue
+            self.rows += 1
+            entry = (to_date(date_normalizer.row_day(row, DATE_FIELDS[tab], formats)), row)
+            self.by_key.setdefault((mobile, normalize_model(_first(row, MODEL_FIELDS))), []).append(entry)
+            self.by_mobile.setdefault(mobile, []).append(entry)
+        for index in (self.by_key, self.by_mobile):
+            for entries in index.values():
+                entries.sort(key=lambda e: (e[0] is None, e[0] or date.min))
+
+
+def _match(candidates: List[Entry], since: Optional[date], claimed: set) -> Optional[Entry]:
+    """Earliest unclaimed entry dated on/after `since` (undated entries always qualify)"""
+    for entry in candidates:
+        if id(entry[1]) in claimed:
+            continue
+        if since is None or entry[0] is None or entry[0] >= since:
+            claimed.add(id(entry[1]))
+            return entry
+    return None
+
+
+def _days(start: Optional[date], end: Optional[date]) -> Optional[int]:
+    if start is None or end is None:
+        return None
+    return (end - start).days
+
+
+def _stats(journeys: List[Dict[str, Any]]) -> Dict[str, Any]:
+    enquiries = len(journeys)
+    booked = sum(1 for j in journeys if j['booked'])
+    sold = sum(1 for j in journeys if j['sold'])
+    booked_and_sold = sum(1 for j in journeys if j['booked'] and j['sold'])
+    days = sorted(j['days_to_sale'] for j in journeys if j['days_to_sale'] is not None)
+
+    buckets = {label: 0 for _, label in CONVERT_BUCKETS}
+    for value in days:
+        for upper, label in CONVERT_BUCKETS:
+            if upper is None or value <= upper:
+                buckets[label] += 1
+                break
+
+    def rate(part, whole):
+        return round(part / whole * 100, 1) if whole else 0.0
+
+    return {
+        'enquiries': enquiries,
+        'booked': booked,
+        'sold': sold,
+        'enquiry_to_booking': rate(booked, enquiries),
+        'booking_to_sale': rate(booked_and_sold, booked),
+        'conversion_rate': rate(sold, enquiries),
+        'time_to_convert': {
+            'buckets': buckets,
+            'median_days': days[len(days) // 2] if days else None,
+            'mean_days': round(sum(days) / len(days), 1) if days else None
+        }
+    }
+
+
+class FunnelEngine:
+    """Enquiry -> Booking -> Sale journeys per customer, joined on mobile and model.
+
+    Each (branch, tab) keeps a TabIndex built when SheetsService reports new
+    rows. When one tab changes only that branch's journeys are rejoined - a
+    hash lookup per enquiry instead of a nested scan - and every summary is
+    memoized until the next change. Reindexing and rejoining run in a worker
+    thread; the loop only swaps the result in (await `settled()` to read
+    after a sync).
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._indexes: Dict[Tuple[str, str], TabIndex] = {}
+        self._branches: Dict[str, Dict[str, Any]] = {}
+        self._summaries: Dict[Tuple, Dict[str, Any]] = {}
+        self._changes = ChangeQueue('Funnel engine', self._reindex, self._swap)
+
+    # ---- incremental updates ----
+
+    def on_sheet_change(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """SheetsService listener: reindex the tab and rejoin its branch off the event loop"""
+        if tab in FUNNEL_TABS:
+            self._changes.push(branch, tab, rows)
+
+    def apply(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """Reindex the tab and rejoin its branch inline"""
+        if tab in FUNNEL_TABS:
+            self._changes.apply(branch, tab, rows)
+
+    async def settled(self):
+        """Wait for queued sheet changes to be swapped in"""
+        await self._changes.settled()
+
+    def _reindex(self, branch: str, tab: str, rows: Optional[List[Dict[str, Any]]]) -> Tuple[Optional[TabIndex], Optional[Dict[str, Any]]]:
+        indexes = {key: index for key, index in self._indexes.items() if key != (branch, tab)}
+        if rows is not None:
+            indexes[(branch, tab)] = TabIndex(tab, rows)
+        elif not any(name == branch for name, _ in indexes):
+            # The branch's last funnel tab is gone
+            return None, None
+        return indexes.get((branch, tab)), self._join(branch, indexes)
+
+    def _swap(self, branch: str, tab: str, result: Tuple[Optional[TabIndex], Optional[Dict[str, Any]]]):
+        index, joined = result
+        if index is None:
+            self._indexes.pop((branch, tab), None)
+        else:
+            self._indexes[(branch, tab)] = index
+        if joined is None:
+            self._branches.pop(branch, None)
+        else:
+            self._branches[branch] = joined
+        self.version += 1
+        self._summaries.clear()
+
+    def _join(self, branch: str, indexes: Dict[Tuple[str, str], TabIndex]) -> Dict[str, Any]:
+        empty = TabIndex('Sold', [])
+        enquiries = indexes.get((branch, 'Enquiry'), empty)
+        bookings = indexes.get((branch, 'Bookings'), empty)
+        sales = indexes.get((branch, 'Sold'), empty)
+
+        # One journey per customer and model, opened by their earliest enquiry
+        journeys = []
+        for (mobile, model), entries in enquiries.by_key.items():
+            enquiry_date, row = entries[0]
+            journeys.append({
+                'branch': branch,
+                'customer': _first(row, CUSTOMER_FIELDS),
+                'mobile': mobile,
+                'model': _first(row, MODEL_FIELDS),
+                'executive': _first(row, EXECUTIVE_FIELDS),
+                'enquiry_date': enquiry_date,
+                'booked': False,
+                'booking_date': None,
+                'sold': False,
+                'sale_date': None,
+                '_key': (mobile, model)
+            })
+
+        # Exact (mobile, model) matches first, then the same customer buying another model
+        unmatched = {}
+        for flag, field, index in (('booked', 'booking_date', bookings), ('sold', 'sale_date', sales)):
+            claimed: set = set()
+            for lookup, key_of in ((index.by_key, lambda j: j['_key']), (index.by_mobile, lambda j: j['mobile'])):
+                for journey in journeys:
+                    if journey[flag]:
+                        continue
+                    entry = _match(lookup.get(key_of(journey), []), journey['enquiry_date'], claimed)
+                    if entry:
+                        journey[flag] = True
+                        journey[field] = entry[0]
+            unmatched[flag] = index.rows - len(claimed)
+
+        for journey in journeys:
+            del journey['_key']
+            journey['days_to_booking'] = _days(journey['enquiry_date'], journey['booking_date'])
+            journey['days_to_sale'] = _days(journey['enquiry_date'], journey['sale_date'])
+            journey['stage'] = 'sold' if journey['sold'] else 'booked' if journey['booked'] else 'enquiry'
+        journeys.sort(key=lambda j: j['enquiry_date'] or date.min, reverse=True)
+
+        return {
+            'journeys': journeys,
+            'unmatched_bookings': unmatched['booked'],
+            'unmatched_sales': unmatched['sold']
+        }
+
+    # ---- queries ----
+
+    def _journeys(self, branch: Optional[str], executive: Optional[str],
+                  start: Optional[date], end: Optional[date]) -> List[Dict[str, Any]]:
+        branches = [branch] if branch else sorted(self._branches)
+        selected = []
+        for name in branches:
+            for journey in self._branches.get(name, {}).get('journeys', []):
+                if executive and journey['executive'] != executive:
+                    continue
+                if start and (journey['enquiry_date'] is None or journey['enquiry_date'] < start):
+                    continue
+                if end and (journey['enquiry_date'] is None or journey['enquiry_date'] > end):
+                    continue
+                selected.append(journey)
+        return selected
+
+    def summary(self, branch: Optional[str] = None, executive: Optional[str] = None,
+                start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, Any]:
+        """Funnel totals with per-branch and per-executive breakdowns"""
+        key = ('summary', branch, executive, start_date, end_date)
+        if key not in self._summaries:
+            start = parse_date(start_date) if start_date else None
+            end = parse_date(end_date) if end_date else None
+            journeys = self._journeys(branch, executive, start, end)
+
+            by_branch: Dict[str, List[Dict[str, Any]]] = {}
+            by_executive: Dict[str, List[Dict[str, Any]]] = {}
+            for journey in journeys:
+                by_branch.setdefault(journey['branch'], []).append(journey)
+                by_executive.setdefault(journey['executive'] or 'Unassigned', []).append(journey)
+
+            branches = [branch] if branch else sorted(self._branches)
+            self._summaries[key] = {
+                **_stats(journeys),
+                'unmatched_bookings': sum(self._branches.get(b, {}).get('unmatched_bookings', 0) for b in branches),
+                'unmatched_sales': sum(self._branches.get(b, {}).get('unmatched_sales', 0) for b in branches),
+                'branches': {name: _stats(items) for name, items in sorted(by_branch.items())},
+                'executives': sorted(
+                    ({'executive': name, **_stats(items)} for name, items in by_executive.items()),
+                    key=lambda s: (-s['conversion_rate'], -s['enquiries'], s['executive'])
+                ),
+                'version': self.version
+            }
+        return self._summaries[key]
+
+    def drop_offs(self, branch: Optional[str] = None, executive: Optional[str] = None,
+                  stage: str = 'enquiry', limit: int = 100) -> Dict[str, Any]:
+        """Most recent journeys stuck at `stage`: 'enquiry' (never booked or bought) or 'booked' (not sold)"""
+        journeys = [j for j in self._journeys(branch, executive, None, None) if j['stage'] == stage]
+        journeys.sort(key=lambda j: j['enquiry_date'] or date.min, reverse=True)
+        today = datetime.now().date()
+        data = []
+        for journey in journeys[:limit]:
+            since = journey['booking_date'] if stage == 'booked' else journey['enquiry_date']
+            data.append({
+                'branch': journey['branch'],
+                'customer': journey['customer'],
+                'mobile': journey['mobile'],
+                'model': journey['model'],
+                'executive': journey['executive'],
+                'enquiry_date': journey['enquiry_date'].isoformat() if journey['enquiry_date'] else None,
+                'booking_date': journey['booking_date'].isoformat() if journey['booking_date'] else None,
+                'days_open': (today - since).days if since else None
+            })
+        return {'stage': stage, 'data': data, 'total': len(journeys)}
+
+    @property
+    def branches(self) -> List[str]:
+        return sorted(self._branches)
+
+
+# Global instance
+funnel_engine = FunnelEngine()
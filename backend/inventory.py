@@ -0,0 +1,298 @@
+import bisect
+import logging
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from change_queue import ChangeQueue
+from funnel import MODEL_FIELDS, normalize_model
+from sheet_dates import date_normalizer, to_date
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_TABS = ('Stock', 'Sold')
+
+RECEIVED_FIELDS = ['Received Date', 'Inward Date', 'Date']
+SALE_DATE_FIELDS = ['Sales Date', 'Date']
+COLOUR_FIELDS = ['Colour', 'Color']
+# Stock rows some branches keep after the vehicle has gone
+GONE_STATUSES = {'sold', 'delivered', 'billed'}
+
+# Upper bounds (days, inclusive) of the stock-age histogram
+AGE_BUCKETS = [(30, '0-30'), (60, '31-60'), (90, '61-90'), (180, '91-180'), (None, '180+')]
+
+ModelKey = Tuple[str, str]  # (normalized model, normalized colour)
+
+
+def _first(record: Dict[str, Any], fields: List[str]) -> str:
+    for field in fields:
+        value = record.get(field)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+def _age_bucket(days: int) -> str:
+    for upper, label in AGE_BUCKETS:
+        if upper is None or days <= upper:
+            return label
+    return AGE_BUCKETS[-1][1]
+
+
+class InventoryAnalytics:
+    """Stock counts, ageing, sell-through and alerts per branch, updated as sheets sync.
+
+    A Stock change rebuilds only that branch's (model, colour) counts and
+    patches the cross-branch index by the difference, so "who has model X in
+    colour Y" is a single dict lookup. Sold changes keep sorted sale dates
+    per model for sell-through. Alerts for the branch are re-evaluated after
+    either change and the transitions (raised / cleared) are kept as events.
+    Rows are scanned in a worker thread; the loop only patches the indexes.
+    """
+
+    def __init__(self, low_stock: int = 2, overstock_days: int = 90, window_days: int = 30, max_events: int = 200):
+        self.low_stock = low_stock
+        self.overstock_days = overstock_days
+        self.window_days = window_days
+        self.max_events = max_events
+        self.version = 0
+        self._stock: Dict[str, Dict[str, Any]] = {}
+        self._sales: Dict[str, Dict[str, List[date]]] = {}
+        self._locate: Dict[ModelKey, Counter] = {}
+        self._names: Dict[str, str] = {}
+        self._colour_names: Dict[str, str] = {}
+        self._alerts: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+        self.events: List[Dict[str, Any]] = []
+        self._summaries: Dict[Tuple[Optional[str], date], Dict[str, Any]] = {}
+        self._changes = ChangeQueue('Inventory analytics', self._scan, self._commit)
+
+    # ---- incremental updates ----
+
+    def on_sheet_change(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """SheetsService listener: scan the branch's stock or sales off the event loop, then re-check its alerts"""
+        if tab in INVENTORY_TABS:
+            self._changes.push(branch, tab, rows)
+
+    def apply(self, branch: str, tab: str, rows: List[Dict[str, Any]], today: Optional[date] = None):
+        """Reindex the branch's stock or sales inline and re-check its alerts as of `today`"""
+        if tab in INVENTORY_TABS:
+            self._commit(branch, tab, self._scan(branch, tab, rows), today)
+
+    async def settled(self):
+        """Wait for queued sheet changes to be indexed"""
+        await self._changes.settled()
+
+    def _scan(self, branch: str, tab: str, rows: Optional[List[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Everything the rows say, read without touching shared state (runs in a worker thread)"""
+        if rows is None:
+            return None
+        names: Dict[str, str] = {}
+
+        def model_key(record: Dict[str, Any]) -> str:
+            name = _first(record, MODEL_FIELDS)
+            key = normalize_model(name)
+            if key:
+                names.setdefault(key, name)
+            return key
+
+        if tab == 'Sold':
+            sales: Dict[str, List[date]] = {}
+            formats = date_normalizer.detect_formats(rows, SALE_DATE_FIELDS)
+            for row in rows:
+                model = model_key(row)
+                sold_on = to_date(date_normalizer.row_day(row, SALE_DATE_FIELDS, formats))
+                if model and sold_on:
+                    sales.setdefault(model, []).append(sold_on)
+            for dates in sales.values():
+                dates.sort()
+            return {'names': names, 'colour_names': {}, 'sales': sales}
+
+        counts: Counter = Counter()
+        received: List[Tuple[str, Optional[date]]] = []
+        colour_names: Dict[str, str] = {}
+        formats = date_normalizer.detect_formats(rows, RECEIVED_FIELDS)
+        for row in rows:
+            if _first(row, ['Status']).lower() in GONE_STATUSES:
+                continue
+            model = model_key(row)
+            if not model:
+                continue
+            colour_name = _first(row, COLOUR_FIELDS)
+            colour = normalize_model(colour_name)
+            colour_names.setdefault(colour, colour_name)
+            counts[(model, colour)] += 1
+            received.append((model, to_date(date_normalizer.row_day(row, RECEIVED_FIELDS, formats))))
+
+        by_model: Counter = Counter()
+        colours: Dict[str, Counter] = {}
+        for (model, colour), count in counts.items():
+            by_model[model] += count
+            colours.setdefault(model, Counter())[colour] += count
+        return {
+            'names': names,
+            'colour_names': colour_names,
+            'stock': {'counts': counts, 'by_model': by_model, 'colours': colours, 'received': received}
+        }
+
+    def _commit(self, branch: str, tab: str, scanned: Optional[Dict[str, Any]], today: Optional[date] = None):
+        if scanned is None:
+            self._drop(branch, tab, today)
+            return
+        for key, name in scanned['names'].items():
+            self._names.setdefault(key, name)
+        for key, name in scanned['colour_names'].items():
+            self._colour_names.setdefault(key, name)
+        if tab == 'Stock':
+            self._patch_locate(branch, scanned['stock']['counts'])
+            self._stock[branch] = scanned['stock']
+        else:
+            self._sales[branch] = scanned['sales']
+        self._check_alerts(branch, today or datetime.now(timezone.utc).date())
+        self.version += 1
+        self._summaries.clear()
+
+    def _drop(self, branch: str, tab: str, today: Optional[date] = None):
+        """Forget a removed tab; a branch with neither stock nor sales left is dropped with its alerts"""
+        if tab == 'Stock':
+            self._patch_locate(branch, Counter())
+            self._stock.pop(branch, None)
+        else:
+            self._sales.pop(branch, None)
+        self._check_alerts(branch, today or datetime.now(timezone.utc).date())
+        if branch not in self._stock and branch not in self._sales:
+            self._alerts.pop(branch, None)
+        self.version += 1
+        self._summaries.clear()
+
+    def _patch_locate(self, branch: str, counts: Counter):
+        old = self._stock.get(branch, {}).get('counts', Counter())
+        for key in set(old) | set(counts):
+            change = counts.get(key, 0) - old.get(key, 0)
+            if not change:
+                continue
+            holders = self._locate.setdefault(key, Counter())
+            holders[branch] += change
+            if holders[branch] <= 0:
+                del holders[branch]
+            if not holders:
+                del self._locate[key]
+
+    def _sold_within(self, branch: str, model: str, today: date) -> int:
+        dates = self._sales.get(branch, {}).get(model, [])
+        since = today - timedelta(days=self.window_days)
+        return len(dates) - bisect.bisect_left(dates, since)
+
+    def _check_alerts(self, branch: str, today: date):
+        by_model = self._stock.get(branch, {}).get('by_model', Counter())
+        models = set(by_model) | set(self._sales.get(branch, {}))
+        current: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for model in models:
+            on_hand = by_model.get(model, 0)
+            sold = self._sold_within(branch, model, today)
+            daily_rate = sold / self.window_days
+            cover = round(on_hand / daily_rate) if daily_rate else None
+            alert = None
+            if sold and on_hand <= self.low_stock:
+                alert = 'low_stock'
+            elif on_hand and (cover is None or cover > self.overstock_days):
+                alert = 'overstock'
+            if alert:
+                current[(model, alert)] = {
+                    'branch': branch,
+                    'model': self._names.get(model, model),
+                    'type': alert,
+                    'on_hand': on_hand,
+                    'sold_last_window': sold,
+                    'days_of_cover': cover
+                }
+
+        previous = self._alerts.get(branch, {})
+        at = datetime.now(timezone.utc).isoformat()
+        for key in current.keys() - previous.keys():
+            self._event('raised', current[key], at)
+        for key in previous.keys() - current.keys():
+            self._event('cleared', previous[key], at)
+        self._alerts[branch] = current
+
+    def _event(self, change: str, alert: Dict[str, Any], at: str):
+        self.events.append({**alert, 'change': change, 'at': at})
+        del self.events[:-self.max_events]
+        logger.info(f"Inventory alert {change}: {alert['type']} {alert['branch']}/{alert['model']} (on hand {alert['on_hand']})")
+
+    # ---- queries ----
+
+    def locate(self, model: str, colour: Optional[str] = None) -> Dict[str, int]:
+        """Branches holding the model (in the colour, if given) with their counts"""
+        model_key = normalize_model(model)
+        if colour is not None:
+            return dict(self._locate.get((model_key, normalize_model(colour)), {}))
+        holders: Counter = Counter()
+        for branch, stock in self._stock.items():
+            if stock['by_model'].get(model_key):
+                holders[branch] = stock['by_model'][model_key]
+        return dict(holders)
+
+    def alerts(self, branch: Optional[str] = None) -> List[Dict[str, Any]]:
+        branches = [branch] if branch else sorted(self._alerts)
+        return [
+            alert
+            for name in branches
+            for _, alert in sorted(self._alerts.get(name, {}).items())
+        ]
+
+    def _branch_summary(self, branch: str, today: date) -> Dict[str, Any]:
+        stock = self._stock.get(branch, {'counts': Counter(), 'by_model': Counter(), 'colours': {}, 'received': []})
+        ages = {label: 0 for _, label in AGE_BUCKETS}
+        undated = 0
+        for _, received in stock['received']:
+            if received is None:
+                undated += 1
+            else:
+                ages[_age_bucket(max((today - received).days, 0))] += 1
+
+        models = []
+        for model, on_hand in stock['by_model'].most_common():
+            sold = self._sold_within(branch, model, today)
+            colours = {
+                self._colour_names.get(colour, colour) or 'Unspecified': count
+                for colour, count in stock['colours'][model].most_common()
+            }
+            models.append({
+                'model': self._names.get(model, model),
+                'on_hand': on_hand,
+                'colours': colours,
+                'sold_last_window': sold,
+                'sell_through': round(sold / (sold + on_hand) * 100, 1) if sold + on_hand else 0.0
+            })
+
+        return {
+            'total': sum(stock['by_model'].values()),
+            'models': models,
+            'age_buckets': ages,
+            'undated': undated
+        }
+
+    def summary(self, branch: Optional[str] = None, today: Optional[date] = None) -> Dict[str, Any]:
+        """Per-branch stock by model and colour, ageing and sell-through over the window"""
+        today = today or datetime.now(timezone.utc).date()
+        key = (branch, today)
+        if key not in self._summaries:
+            branches = [branch] if branch else sorted(set(self._stock) | set(self._sales))
+            summaries = {name: self._branch_summary(name, today) for name in branches}
+            self._summaries[key] = {
+                'window_days': self.window_days,
+                'total': sum(s['total'] for s in summaries.values()),
+                'branches': summaries,
+                'alerts': self.alerts(branch),
+                'version': self.version
+            }
+        return self._summaries[key]
+
+
+# Global instance
+inventory = InventoryAnalytics(
+    low_stock=int(os.environ.get('INVENTORY_LOW_STOCK', 2)),
+    overstock_days=int(os.environ.get('INVENTORY_OVERSTOCK_DAYS', 90)),
+    window_days=int(os.environ.get('INVENTORY_SELL_THROUGH_DAYS', 30))
+)
@@ -0,0 +1,277 @@
+"""Minimal Prometheus-style metrics: counters, gauges and histograms with labels.
+
+Rendered in the Prometheus text exposition format (version 0.0.4) by
+`MetricsRegistry.render()`. Updates are thread-safe, since sheet downloads
+and parsing run in worker threads. Metrics are per process; with several
+workers each one is scraped separately.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds: from a cache hit up to a slow sheet download or LLM answer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block in seconds (also when it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry
+metrics = MetricsRegistry()
+
+# ---- shared instruments ----
+
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "API request latency until the response headers are sent", ["method", "route", "status"]
+)
+HTTP_ERRORS = metrics.counter(
+    "http_request_errors_total", "API requests answered with a 5xx or an unhandled exception", ["method", "route", "status"]
+)
+CLIENT_DISCONNECTS = metrics.counter(
+    "http_client_disconnects_total", "API requests abandoned by the client before the response, whose handler was cancelled"
+)
+
+ADMISSION_QUEUE_DEPTH = metrics.gauge(
+    "admission_queue_depth", "Requests waiting for a concurrency slot", ["route_class"]
+)
+ADMISSION_IN_FLIGHT = metrics.gauge(
+    "admission_in_flight", "Requests holding a concurrency slot", ["route_class"]
+)
+ADMISSION_WAIT_SECONDS = metrics.histogram(
+    "admission_queue_wait_seconds", "Time queued requests waited for a concurrency slot", ["route_class"]
+)
+ADMISSION_REJECTIONS = metrics.counter(
+    "admission_rejections_total", "Requests answered 429 (rate_limited, queue_full, queue_timeout)", ["route_class", "reason"]
+)
+
+SHEET_DOWNLOAD_SECONDS = metrics.histogram(
+    "sheets_download_seconds", "Google Sheets CSV export download time", ["branch", "tab"]
+)
+SHEET_PARSE_SECONDS = metrics.histogram(
+    "sheets_parse_seconds", "CSV parse time", ["branch", "tab"]
+)
+SHEET_ROWS = metrics.gauge("sheets_csv_rows", "Rows in the last downloaded CSV", ["branch", "tab"])
+SHEET_BYTES = metrics.gauge("sheets_csv_bytes", "Size of the last downloaded CSV in bytes", ["branch", "tab"])
+SHEET_DOWNLOADED_BYTES = metrics.counter(
+    "sheets_downloaded_bytes_total", "CSV bytes downloaded from Google Sheets", ["branch", "tab"]
+)
+SHEET_CACHE_LOOKUPS = metrics.counter(
+    "sheets_cache_lookups_total", "Sheet cache lookups by result (hit, stale, miss)", ["result"]
+)
+SHEET_FETCH_ERRORS = metrics.counter(
+    "sheets_fetch_errors_total", "Failed sheet downloads", ["branch", "tab"]
+)
+SHEET_FETCHES_ABANDONED = metrics.counter(
+    "sheets_fetches_abandoned_total", "In-flight sheet downloads cancelled because no request was waiting any more", ["branch", "tab"]
+)
+SHEET_FALLBACKS = metrics.counter(
+    "sheets_fallbacks_total",
+    "Reads answered without fresh upstream data (circuit_open, fetch_error, stale_snapshot, shared_copy, deadline)",
+    ["branch", "tab", "reason"]
+)
+
+SHEET_HISTORY_VERSIONS = metrics.counter(
+    "sheets_history_versions_total", "Sheet versions recorded, by kind (checkpoint, delta)", ["kind"]
+)
+SHEET_HISTORY_ROWS = metrics.counter(
+    "sheets_history_rows_total", "Rows written to the sheet history, by kind (checkpoint, delta)", ["kind"]
+)
+
+EXPORT_PARTITIONS = metrics.counter(
+    "analytics_export_partitions_total", "Export partitions by result (written, unchanged, removed)", ["dataset", "result"]
+)
+
+MONGO_SECONDS = metrics.histogram("mongo_query_seconds", "MongoDB call latency on hot paths", ["operation"])
+
+PDF_PARSE_SECONDS = metrics.histogram("pdf_parse_seconds", "Service report PDF text extraction time")
+PDF_ERRORS = metrics.counter("pdf_upload_errors_total", "Service report PDF uploads that failed")
+
+LLM_SECONDS = metrics.histogram(
+    "llm_request_seconds", "LLM answer latency (full response)", ["provider", "model", "mode"],
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+)
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram(
+    "llm_time_to_first_token_seconds", "Time to the first streamed LLM token", ["provider", "model"],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+LLM_ERRORS = metrics.counter("llm_errors_total", "Failed LLM calls", ["provider", "model", "mode"])
+AI_CACHE_LOOKUPS = metrics.counter("ai_cache_lookups_total", "AI response cache lookups by result", ["result"])
+AI_CACHE_SAVED_SECONDS = metrics.counter("ai_cache_saved_seconds_total", "LLM latency saved by AI response cache hits")
+AI_CACHE_SAVED_TOKENS = metrics.counter("ai_cache_saved_tokens_total", "Estimated LLM tokens saved by AI response cache hits")
+AI_CACHE_SAVED_COST = metrics.counter("ai_cache_saved_cost_total", "Estimated LLM cost saved by AI response cache hits")
+AUTH_TOKENS = metrics.counter(
+    "auth_access_tokens_total", "Signed access tokens by outcome (valid, rejected, issued)", ["result"]
+)
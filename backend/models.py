@@ -76,6 +76,14 @@ class Target(BaseModel):
     sales_target: int
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class TargetCreate(BaseModel):
+    branch_id: Optional[str] = None
+    executive_id: Optional[str] = None
+    month: str = Field(pattern=r'^\d{4}-(0[1-9]|1[0-2])$')
+    enquiry_target: int = Field(ge=0)
+    booking_target: int = Field(ge=0)
+    sales_target: int = Field(ge=0)
+
 # ==================== SALES FUNNEL MODELS ====================
 
 class Enquiry(BaseModel):
@@ -175,4 +183,23 @@ class DashboardFilters(BaseModel):
     end_date: Optional[str] = None
     branch_id: Optional[str] = None
     executive_id: Optional[str] = None
-    model_id: Optional[str] = None
\ No newline at end of file
+    model_id: Optional[str] = None
+
+class SheetAggregate(BaseModel):
+    group_by: Optional[str] = None  # column to count rows by
+    sum: List[str] = []  # numeric columns to total
+
+class SheetQuery(BaseModel):
+    id: Optional[str] = None  # echoed back so callers can match results
+    tab: str = Field(pattern=r'^(Sold|Enquiry|Bookings|Stock)$')
+    branch: Optional[str] = None
+    search: Optional[str] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    executive: Optional[str] = None
+    aggregate: Optional[SheetAggregate] = None  # aggregates instead of rows
+    as_of: Optional[datetime] = None  # read the tab as it was then (default: the batch's as_of)
+
+class SheetBatch(BaseModel):
+    queries: List[SheetQuery] = Field(min_length=1, max_length=100)
+    as_of: Optional[datetime] = None
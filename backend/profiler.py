@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+_BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for a single request.
+
+    A daemon thread snapshots the stacks of the event loop thread (the thread
+    that started the profiler) and of worker threads currently running
+    backend code, every `interval` seconds. Other requests handled on the
+    same loop meanwhile show up in the samples too, so profile on a quiet
+    worker. Results are collapsed stacks (flamegraph.pl / speedscope
+    "folded" format) plus a top-functions table.
+    """
+
+    def __init__(self, interval: float = 0.001, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.duration = 0.0
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+
+    def _stack(self, frame) -> Tuple[str, ...]:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(frame)
+            frame = frame.f_back
+        return tuple(_frame_label(f) for f in reversed(stack))
+
+    @staticmethod
+    def _runs_backend_code(frame) -> bool:
+        while frame is not None:
+            if frame.f_code.co_filename.startswith(_BACKEND_DIR) and frame.f_code.co_filename != __file__:
+                return True
+            frame = frame.f_back
+        return False
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                # Idle pool workers would drown the profile; keep threads busy with our code
+                if thread_id != self._loop_thread and not self._runs_backend_code(frame):
+                    continue
+                prefix = ("event-loop",) if thread_id == self._loop_thread else ("worker-thread",)
+                self.samples[prefix + self._stack(frame)] += 1
+            self.sample_count += 1
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def folded(self) -> str:
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.samples.most_common())
+
+    def top(self, limit: int = 25) -> List[Dict[str, Any]]:
+        """Functions by samples on top of the stack (self) and anywhere in it (total)"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in self.samples.items():
+            self_counts[stack[-1]] += count
+            for label in set(stack[1:]):
+                total_counts[label] += count
+        return [
+            {"function": label, "self_samples": self_counts.get(label, 0), "total_samples": total}
+            for label, total in total_counts.most_common(limit)
+        ]
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.interval * 1000,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": self.sample_count,
+            "top": self.top(),
+            "folded": self.folded()
+        }
@@ -0,0 +1,259 @@
+"""Admission control for the expensive API routes.
+
+Routes are grouped into classes (sheets, pdf, ai, export). Each class has a
+token bucket per user - `rate_per_min` sustained, `burst` at once - and a
+global cap on how many of its requests run at the same time. Requests over
+the cap wait in a bounded queue for up to `queue_timeout` seconds. A request
+over its user's rate, or one that finds the queue full or waits too long, is
+answered 429 with a Retry-After header before any real work is done, so one
+heavy user (or a dozen auto-syncing tabs) cannot starve everyone else.
+
+Only verified identities get a bucket of their own: a signed access token,
+or a session credential that authentication has recently accepted. Anything
+else counts against the client IP, so sending a fresh junk credential on
+every request neither escapes the limit nor grows the bucket table.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_WAIT_SECONDS
+from session_tokens import looks_like_token, session_tokens
+
+logger = logging.getLogger(__name__)
+
+# Path prefixes of each route class (first match wins)
+ROUTE_CLASSES = (
+    ('sheets', ('/api/sheets/', '/api/funnel', '/api/inventory', '/api/targets/progress', '/api/targets/leaderboard')),
+    ('pdf', ('/api/service/upload-pdf',)),
+    ('ai', ('/api/ai/chat',)),
+    ('export', ('/api/export/',)),
+)
+
+# Idle buckets are dropped after this long (a full bucket carries no state)
+BUCKET_IDLE_SECONDS = 600
+# Session credentials accepted by authentication keep their own bucket this long
+KNOWN_SESSION_SECONDS = 600
+MAX_KNOWN_SESSIONS = 10_000
+
+
+class RateLimited(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate  # tokens per second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token: 0.0 if one was available, else seconds until there is one"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass
+class RouteLimits:
+    rate_per_min: float
+    burst: int
+    max_concurrent: int
+    max_queue: int
+
+    @classmethod
+    def from_env(cls, name: str, rate_per_min: float, burst: int, max_concurrent: int, max_queue: int) -> 'RouteLimits':
+        prefix = name.upper()
+        return cls(
+            rate_per_min=float(os.environ.get(f'RATE_LIMIT_{prefix}_PER_MIN', rate_per_min)),
+            burst=int(os.environ.get(f'RATE_LIMIT_{prefix}_BURST', burst)),
+            max_concurrent=int(os.environ.get(f'MAX_CONCURRENT_{prefix}', max_concurrent)),
+            max_queue=int(os.environ.get(f'MAX_QUEUED_{prefix}', max_queue))
+        )
+
+
+class AdmissionController:
+    """Per-user token buckets plus a bounded, queued concurrency cap per route class.
+
+    A rate or cap of 0 disables that check for the class.
+    """
+
+    def __init__(self, limits: Dict[str, RouteLimits], queue_timeout: float = 10.0):
+        self.limits = limits
+        self.queue_timeout = queue_timeout
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._queued: Dict[str, int] = {name: 0 for name in limits}
+        self._last_sweep = time.monotonic()
+        self._known_sessions: 'OrderedDict[str, float]' = OrderedDict()
+
+    def note_session(self, credential: str):
+        """Authentication accepted this session credential: rate it on its own from now on"""
+        digest = _digest(credential)
+        self._known_sessions[digest] = time.monotonic() + KNOWN_SESSION_SECONDS
+        self._known_sessions.move_to_end(digest)
+        while len(self._known_sessions) > MAX_KNOWN_SESSIONS:
+            self._known_sessions.popitem(last=False)
+
+    def known_session(self, credential: str) -> Optional[str]:
+        """The credential's digest if authentication accepted it recently, else None"""
+        digest = _digest(credential)
+        until = self._known_sessions.get(digest)
+        if until is None:
+            return None
+        if until < time.monotonic():
+            del self._known_sessions[digest]
+            return None
+        return digest
+
+    @staticmethod
+    def route_class(path: str) -> Optional[str]:
+        for name, prefixes in ROUTE_CLASSES:
+            if path.startswith(prefixes):
+                return name
+        return None
+
+    def check_rate(self, user_key: str, route_class: str):
+        """Spend one of the user's tokens for this class, raising RateLimited if there are none"""
+        limits = self.limits[route_class]
+        if limits.rate_per_min <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_sweep > BUCKET_IDLE_SECONDS:
+            self._sweep(now)
+        bucket = self._buckets.get((user_key, route_class))
+        if bucket is None:
+            bucket = self._buckets[(user_key, route_class)] = TokenBucket(limits.rate_per_min / 60, limits.burst, now)
+        wait = bucket.take(now)
+        if wait:
+            ADMISSION_REJECTIONS.inc(route_class=route_class, reason='rate_limited')
+            raise RateLimited('rate_limited', wait)
+
+    def _sweep(self, now: float):
+        for key in [key for key, bucket in self._buckets.items() if now - bucket.updated > BUCKET_IDLE_SECONDS]:
+            del self._buckets[key]
+        self._last_sweep = now
+
+    def _semaphore(self, route_class: str) -> asyncio.Semaphore:
+        # Created lazily so it binds to the serving event loop
+        if route_class not in self._slots:
+            self._slots[route_class] = asyncio.Semaphore(self.limits[route_class].max_concurrent)
+        return self._slots[route_class]
+
+    async def acquire(self, route_class: str):
+        """Take one of the class's concurrency slots, queueing if none is free (raises RateLimited)"""
+        limits = self.limits[route_class]
+        if limits.max_concurrent <= 0:
+            return
+        slots = self._semaphore(route_class)
+        if not slots.locked():
+            await slots.acquire()
+        else:
+            if self._queued[route_class] >= limits.max_queue:
+                ADMISSION_REJECTIONS.inc(route_class=route_class, reason='queue_full')
+                raise RateLimited('queue_full', 1.0)
+            self._queued[route_class] += 1
+            ADMISSION_QUEUE_DEPTH.set(self._queued[route_class], route_class=route_class)
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                ADMISSION_REJECTIONS.inc(route_class=route_class, reason='queue_timeout')
+                raise RateLimited('queue_timeout', 1.0)
+            finally:
+                self._queued[route_class] -= 1
+                ADMISSION_QUEUE_DEPTH.set(self._queued[route_class], route_class=route_class)
+                ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - started, route_class=route_class)
+        ADMISSION_IN_FLIGHT.inc(route_class=route_class)
+
+    def release(self, route_class: str):
+        if self.limits[route_class].max_concurrent <= 0:
+            return
+        ADMISSION_IN_FLIGHT.dec(route_class=route_class)
+        self._semaphore(route_class).release()
+
+    def queued(self, route_class: str) -> int:
+        return self._queued[route_class]
+
+
+def _digest(credential: str) -> str:
+    return hashlib.sha256(credential.encode('utf-8')).hexdigest()[:16]
+
+
+def user_key(request: Request, controller: Optional['AdmissionController'] = None) -> str:
+    """Who a request counts against: the signed token's user, else a recently accepted session, else the client IP"""
+    authorization = request.headers.get('Authorization', '')
+    bearer = authorization[7:] if authorization.startswith('Bearer ') else None
+    for credential in (request.cookies.get('access_token'), bearer):
+        if looks_like_token(credential):
+            claims = session_tokens.verify(credential)
+            if claims:
+                return f"user:{claims['sub']}"
+    credential = request.cookies.get('session_token') or (None if looks_like_token(bearer) else bearer)
+    digest = controller.known_session(credential) if credential and controller else None
+    if digest:
+        return f"session:{digest}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to the classed routes.
+
+    The concurrency slot is held until the response has been fully sent,
+    so streamed AI answers count for as long as they run.
+    """
+
+    def __init__(self, app, controller: 'AdmissionController'):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        route_class = self.controller.route_class(scope['path']) if scope['type'] == 'http' else None
+        if route_class is None or scope['method'] == 'OPTIONS':
+            await self.app(scope, receive, send)
+            return
+        try:
+            self.controller.check_rate(user_key(Request(scope), self.controller), route_class)
+            await self.controller.acquire(route_class)
+        except RateLimited as e:
+            retry_after = max(1, math.ceil(e.retry_after))
+            logger.warning(f"Rejected {scope['path']} ({route_class}, {e.reason}); retry after {retry_after}s")
+            response = JSONResponse(
+                {'detail': 'Too many requests, please retry shortly', 'reason': e.reason},
+                status_code=429,
+                headers={'Retry-After': str(retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
+
+
+# Global instance
+admission = AdmissionController(
+    {
+        'sheets': RouteLimits.from_env('sheets', rate_per_min=240, burst=60, max_concurrent=32, max_queue=128),
+        'pdf': RouteLimits.from_env('pdf', rate_per_min=10, burst=3, max_concurrent=2, max_queue=8),
+        'ai': RouteLimits.from_env('ai', rate_per_min=30, burst=10, max_concurrent=8, max_queue=16),
+        'export': RouteLimits.from_env('export', rate_per_min=30, burst=10, max_concurrent=4, max_queue=8),
+    },
+    queue_timeout=float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', 10))
+)
@@ -0,0 +1,138 @@
+"""Request deadlines and client-disconnect cancellation.
+
+`DeadlineMiddleware` gives every /api request a time budget, kept in a
+context variable so code below it (and worker threads started with
+asyncio.to_thread) can ask how much is left, and cancels the request's
+handler as soon as the client disconnects.
+
+Upstream fetches shared by several requests carry a `FetchBudget`: the
+latest deadline of the requests still waiting on it, plus a cancel flag set
+when the last of them goes away. Blocking download code polls it with
+`check_fetch()` between chunks.
+"""
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from metrics import CLIENT_DISCONNECTS
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+_fetch_budget: ContextVar[Optional["FetchBudget"]] = ContextVar("fetch_budget", default=None)
+
+
+class FetchAborted(Exception):
+    """The requests waiting on an upstream fetch ran out of time or went away"""
+
+
+def current_deadline() -> Optional[float]:
+    """time.monotonic() by which the current request must answer (None outside a request or without a budget)"""
+    return _deadline.get()
+
+
+def set_deadline(seconds: Optional[float]):
+    """Start a budget of `seconds` for the current context (None or <= 0 removes it); returns the reset token"""
+    return _deadline.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+
+
+def remaining(deadline: Optional[float] = None) -> Optional[float]:
+    """Seconds left before `deadline` (default: the current request's), never negative; None if unbounded"""
+    deadline = current_deadline() if deadline is None else deadline
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+class FetchBudget:
+    """How long an upstream fetch may keep going, shared by everyone waiting on it"""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self._cancelled = threading.Event()
+
+    def extend(self, deadline: Optional[float]):
+        """Another request joined: the fetch may run until the later of the two deadlines"""
+        if self.deadline is not None:
+            self.deadline = None if deadline is None else max(self.deadline, deadline)
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def timeout(self, cap: float) -> float:
+        """Socket timeout for the next upstream call: `cap`, or less if the budget runs out first"""
+        left = remaining(self.deadline)
+        return cap if left is None else max(0.001, min(cap, left))
+
+    def check(self):
+        if self.cancelled:
+            raise FetchAborted("no request is waiting for this fetch any more")
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise FetchAborted("deadline exceeded")
+
+
+def use_fetch_budget(budget: FetchBudget):
+    return _fetch_budget.set(budget)
+
+
+def fetch_timeout(cap: float) -> float:
+    budget = _fetch_budget.get()
+    return budget.timeout(cap) if budget else cap
+
+
+def check_fetch():
+    """Raise FetchAborted if the fetch running in this context is no longer wanted (no-op outside one)"""
+    budget = _fetch_budget.get()
+    if budget is not None:
+        budget.check()
+
+
+class DeadlineMiddleware:
+    """ASGI middleware: per-request deadline, and cancellation of the handler when the client disconnects.
+
+    The request's messages are pumped from the server into a queue the app
+    reads from, so an `http.disconnect` is noticed while the handler is
+    still working (waiting on Google, filtering) rather than only when it
+    next reads the body. The handler task is then cancelled; nothing is
+    sent, as there is nobody left to send it to.
+    """
+
+    def __init__(self, app, budget: float = 0.0, prefix: str = "/api"):
+        self.app = app
+        self.budget = budget
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        token = set_deadline(self.budget)
+        messages: asyncio.Queue = asyncio.Queue()
+        handler = asyncio.ensure_future(self.app(scope, messages.get, send))
+
+        async def pump():
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not handler.done():
+                        CLIENT_DISCONNECTS.inc()
+                        handler.cancel()
+                    return
+
+        watcher = asyncio.ensure_future(pump())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if not handler.cancelled() or asyncio.current_task().cancelling():
+                raise
+        finally:
+            watcher.cancel()
+            if not handler.done():
+                handler.cancel()
+            _deadline.reset(token)
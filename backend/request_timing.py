@@ -0,0 +1,117 @@
+"""Per-request phase timings, reported in the Server-Timing response header.
+
+The HTTP middleware installs a RequestTiming for the request in a context
+variable; code anywhere below it (dependencies, endpoints, worker threads
+started with asyncio.to_thread) records named phases with `timed_phase()`,
+which is a no-op outside a request. Phases that run concurrently - e.g.
+downloads of several branches - are summed, so they can exceed `total`.
+"""
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+# Header order; phases not listed here follow in the order they were first recorded
+PHASES = ("auth", "sheets", "parse", "filter", "serialize")
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.endpoint_done: Optional[float] = None
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_ms(self) -> Dict[str, float]:
+        ordered = [name for name in PHASES if name in self.phases]
+        ordered += [name for name in self.phases if name not in PHASES]
+        timings = {name: round(self.phases[name] * 1000, 2) for name in ordered}
+        timings["total"] = round(self.total() * 1000, 2)
+        return timings
+
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.as_ms().items())
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def start_request() -> RequestTiming:
+    timing = RequestTiming()
+    _current.set(timing)
+    return timing
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+@contextmanager
+def timed_phase(name: str):
+    """Add the duration of the with-block to phase `name` of the current request"""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that times response serialization.
+
+    The endpoint is wrapped to note when it returned; everything FastAPI does
+    after that (jsonable_encoder, JSON rendering) is the `serialize` phase.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dependant.call = self._mark_done(self.dependant.call)
+
+    @staticmethod
+    def _mark_done(call: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def async_endpoint(*args, **kwargs):
+                try:
+                    return await call(*args, **kwargs)
+                finally:
+                    timing = _current.get()
+                    if timing is not None:
+                        timing.endpoint_done = time.perf_counter()
+            return async_endpoint
+
+        @functools.wraps(call)
+        def endpoint(*args, **kwargs):
+            try:
+                return call(*args, **kwargs)
+            finally:
+                timing = _current.get()
+                if timing is not None:
+                    timing.endpoint_done = time.perf_counter()
+        return endpoint
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request: Request) -> Response:
+            response = await handler(request)
+            timing = _current.get()
+            if timing is not None and timing.endpoint_done is not None:
+                timing.add("serialize", time.perf_counter() - timing.endpoint_done)
+            return response
+
+        return timed_handler
@@ -1,8 +1,11 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Response, Request, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Response, Request, UploadFile, File, BackgroundTasks
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import os
 import logging
 import uuid
@@ -11,27 +14,60 @@ from pathlib import Path
 from datetime import datetime, timezone, timedelta
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
-import PyPDF2
 import io
 import re
+import json
+import time
+import asyncio
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 from sheets_service import sheets_service
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from branch_registry import BranchConfig, branch_registry
+from sheet_sync import sheet_sync
+from ai_service import SessionForbidden, chat_sessions
+from ai_context import business_context
+from funnel import FUNNEL_TABS, FunnelEngine, funnel_engine
+from targets import METRICS as TARGET_METRICS, TargetTracker, target_tracker
+from inventory import INVENTORY_TABS, InventoryAnalytics, inventory
+from models import SheetBatch, SheetQuery, Target, TargetCreate
+from sheet_queries import aggregate, filter_rows, query_tab, tab_dates, tab_parts
+from sheet_history import sheet_history
+from analytics_export import MEDIA_TYPES, ExportUnavailable, analytics_export
+from ai_cache import ai_response_cache
+from chat_history import chat_history
+from session_tokens import looks_like_token, session_id, session_tokens
+from request_timing import TimedRoute, start_request, timed_phase
+from request_deadline import DeadlineMiddleware
+from rate_limit import AdmissionMiddleware, admission
+from profiler import SamplingProfiler
+from metrics import (
+    AI_CACHE_LOOKUPS, AUTH_TOKENS, CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_ERRORS, HTTP_REQUEST_SECONDS, LLM_ERRORS,
+    LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, MONGO_SECONDS, PDF_ERRORS, PDF_PARSE_SECONDS, metrics
+)
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Keep the AI chat's business snapshot in step with the sheet cache
+sheets_service.add_listener(tab_dates.on_sheet_change)
+sheets_service.add_listener(business_context.on_sheet_change)
+sheets_service.add_listener(funnel_engine.on_sheet_change)
+sheets_service.add_listener(target_tracker.on_sheet_change)
+sheets_service.add_listener(inventory.on_sheet_change)
+sheets_service.add_listener(sheet_history.on_sheet_change)
+# ...and drop what was derived from branches that are removed or disabled
+branch_registry.add_listener(sheets_service.prune)
+
 # LLM API key
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY')
 
 # Create the main app
 app = FastAPI()
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -62,25 +98,54 @@ class ChatRequest(BaseModel):
 
 # ==================== AUTH HELPERS ====================
 
-async def get_current_user(request: Request) -> User:
-    """Get current user from session token (cookie or header)"""
+async def get_current_user(request: Request, response: Response) -> User:
+    """Get current user from a signed access token, else the session token (cookie or header)"""
+    with timed_phase("auth"):
+        return await _authenticate(request, response)
+
+def _set_access_token(response: Response, token: str):
+    response.set_cookie(
+        key="access_token",
+        value=token,
+        httponly=True,
+        secure=True,
+        samesite="none",
+        path="/",
+        max_age=7 * 24 * 60 * 60  # outlives the token so an expired one can still be refreshed
+    )
+    response.headers["X-Access-Token"] = token
+
+async def _authenticate(request: Request, response: Optional[Response] = None) -> User:
+    bearer = None
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        bearer = auth_header.split(" ")[1]
+    
+    # Signed access token: verified in-process, no database round trip
+    access_token = request.cookies.get("access_token") or (bearer if looks_like_token(bearer) else None)
+    if access_token and session_tokens.enabled:
+        claims = session_tokens.verify(access_token)
+        if claims:
+            AUTH_TOKENS.inc(result="valid")
+            return User(**session_tokens.user_from_claims(claims))
+        AUTH_TOKENS.inc(result="rejected")
+    
     # Try cookie first
     session_token = request.cookies.get("session_token")
     
     # Fallback to Authorization header
-    if not session_token:
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            session_token = auth_header.split(" ")[1]
+    if not session_token and not looks_like_token(bearer):
+        session_token = bearer
     
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     # Find session
-    session_doc = await db.user_sessions.find_one(
-        {"session_token": session_token},
-        {"_id": 0}
-    )
+    with MONGO_SECONDS.time(operation="session_lookup"):
+        session_doc = await db.user_sessions.find_one(
+            {"session_token": session_token},
+            {"_id": 0}
+        )
     
     if not session_doc:
         raise HTTPException(status_code=401, detail="Invalid session")
@@ -96,29 +161,66 @@ async def get_current_user(request: Request) -> User:
             raise HTTPException(status_code=401, detail="Session expired")
     
     # Find user
-    user_doc = await db.users.find_one(
-        {"user_id": session_doc["user_id"]},
-        {"_id": 0}
-    )
+    with MONGO_SECONDS.time(operation="user_lookup"):
+        user_doc = await db.users.find_one(
+            {"user_id": session_doc["user_id"]},
+            {"_id": 0}
+        )
     
     if not user_doc:
         raise HTTPException(status_code=401, detail="User not found")
+    admission.note_session(session_token)
+    
+    # Hand out a fresh access token so the next requests skip the lookups
+    if session_tokens.enabled and response is not None:
+        _set_access_token(response, session_tokens.issue(user_doc, session_token))
+        AUTH_TOKENS.inc(result="issued")
     
     return User(**user_doc)
 
+async def require_admin(user: User = Depends(get_current_user)) -> User:
+    """Current user, 403 unless they are an admin"""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
 # ==================== AUTH ENDPOINTS (Google OAuth) ====================
 
+# Emergent Auth session-data endpoint, called through one pooled client for the app's lifetime
+AUTH_SESSION_URL = os.environ.get(
+    "AUTH_SESSION_URL", "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+AUTH_HTTP_MAX_CONNECTIONS = int(os.environ.get("AUTH_HTTP_MAX_CONNECTIONS", 20))
+_auth_http: Optional[httpx.AsyncClient] = None
+
+def auth_http_client() -> httpx.AsyncClient:
+    """Keep-alive client for the auth provider, so logins skip the TCP/TLS handshake"""
+    global _auth_http
+    if _auth_http is None or _auth_http.is_closed:
+        _auth_http = httpx.AsyncClient(
+            timeout=10.0,
+            limits=httpx.Limits(
+                max_connections=AUTH_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=AUTH_HTTP_MAX_CONNECTIONS
+            )
+        )
+    return _auth_http
+
+async def close_auth_http_client():
+    global _auth_http
+    if _auth_http is not None:
+        await _auth_http.aclose()
+        _auth_http = None
+
 @api_router.post("/auth/session")
 async def create_session(request: SessionRequest, response: Response):
     """Exchange session_id from Emergent Auth for session_token"""
     try:
-        # Call Emergent Auth API to get user data
-        async with httpx.AsyncClient() as client_http:
-            auth_response = await client_http.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": request.session_id},
-                timeout=10.0
-            )
+        # Call Emergent Auth API to get user data; the whitelist is read meanwhile
+        auth_response, settings_doc = await asyncio.gather(
+            auth_http_client().get(AUTH_SESSION_URL, headers={"X-Session-ID": request.session_id}),
+            db.app_settings.find_one({"setting_id": "global"}, {"_id": 0})
+        )
         
         if auth_response.status_code != 200:
             raise HTTPException(status_code=401, detail="Invalid session_id")
@@ -130,42 +232,38 @@ async def create_session(request: SessionRequest, response: Response):
         session_token = auth_data.get("session_token")
         
         # Check if email is allowed (if whitelist exists)
-        settings_doc = await db.app_settings.find_one({"setting_id": "global"}, {"_id": 0})
         if settings_doc and settings_doc.get("allowed_emails"):
             allowed = settings_doc["allowed_emails"]
             if allowed and email not in allowed:
                 raise HTTPException(status_code=403, detail="Email not authorized. Contact admin.")
         
-        # Find or create user
-        existing_user = await db.users.find_one({"email": email}, {"_id": 0})
-        
-        if existing_user:
-            user_id = existing_user["user_id"]
-            # Update user info
-            await db.users.update_one(
-                {"user_id": user_id},
-                {"$set": {"name": name, "picture": picture}}
+        # Find or create user in one round trip
+        now = datetime.now(timezone.utc)
+        with MONGO_SECONDS.time(operation="login_upsert"):
+            user_doc = await db.users.find_one_and_update(
+                {"email": email},
+                {
+                    "$set": {"name": name, "picture": picture},
+                    "$setOnInsert": {
+                        "user_id": f"user_{uuid.uuid4().hex[:12]}",
+                        "role": "user",
+                        "created_at": now.isoformat()
+                    }
+                },
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
             )
-        else:
-            user_id = f"user_{uuid.uuid4().hex[:12]}"
-            new_user = {
-                "user_id": user_id,
-                "email": email,
-                "name": name,
-                "picture": picture,
-                "role": "user",
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.users.insert_one(new_user)
         
         # Create session
-        expires_at = datetime.now(timezone.utc) + timedelta(days=7)
-        await db.user_sessions.insert_one({
-            "user_id": user_id,
-            "session_token": session_token,
-            "expires_at": expires_at.isoformat(),
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
+        expires_at = now + timedelta(days=7)
+        with MONGO_SECONDS.time(operation="session_insert"):
+            await db.user_sessions.insert_one({
+                "user_id": user_doc["user_id"],
+                "session_token": session_token,
+                "expires_at": expires_at.isoformat(),
+                "created_at": now.isoformat()
+            })
         
         # Set cookie
         response.set_cookie(
@@ -178,10 +276,11 @@ async def create_session(request: SessionRequest, response: Response):
             max_age=7 * 24 * 60 * 60  # 7 days
         )
         
-        # Get user data
-        user_doc = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-        
-        return {"user": user_doc, "session_token": session_token}
+        result = {"user": user_doc, "session_token": session_token}
+        if session_tokens.enabled:
+            result["access_token"] = session_tokens.issue(user_doc, session_token)
+            _set_access_token(response, result["access_token"])
+        return result
         
     except HTTPException:
         raise
@@ -202,6 +301,20 @@ async def logout(request: Request, response: Response):
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
     
+    # Outstanding access tokens stay valid until they expire unless the session is revoked
+    access_token = request.cookies.get("access_token")
+    sid = session_id(session_token) if session_token else None
+    if not sid and access_token:
+        sid = session_tokens.unverified_session(access_token)
+    if sid and session_tokens.enabled:
+        await session_tokens.revoke(db, sid)
+    
+    response.delete_cookie(
+        key="access_token",
+        path="/",
+        secure=True,
+        samesite="none"
+    )
     response.delete_cookie(
         key="session_token",
         path="/",
@@ -257,67 +370,178 @@ async def remove_allowed_email(email: str = Query(...), user: User = Depends(get
 
 # ==================== AI CHAT ENDPOINTS ====================
 
+async def _prepare_chat(chat_request: ChatRequest, user: User):
+    """Get the live chat session for a request, creating one for new conversations"""
+    session_id = chat_request.session_id or f"chat_{user.user_id}_{uuid.uuid4().hex[:8]}"
+    try:
+        session = await chat_sessions.acquire(db, session_id, user.user_id, EMERGENT_LLM_KEY)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SessionForbidden:
+        raise HTTPException(status_code=403, detail="Chat session belongs to another user")
+    if chat_request.session_id and not session.turns:
+        # Continuing a conversation this worker no longer holds in memory
+        async with session.lock:
+            await chat_history.restore_session(db, user.user_id, session)
+    await business_context.ensure_service_loaded(db)
+    await business_context.settled()
+    return session, session_id
+
+async def _save_chat_turn(user_id: str, session_id: str, message: str, response: str, timings: Dict[str, Any]):
+    """Store one chat exchange and compact the session once it grows long"""
+    try:
+        await chat_history.save_turn(db, user_id, session_id, message, response, timings)
+        await chat_history.compact(db, user_id, session_id, chat_sessions.peek(session_id))
+    except Exception as e:
+        logger.error(f"Chat history error: {e}")
+
+async def _lookup_cached_answer(session, message: str):
+    """Cached answer for the opening question of a session.
+
+    Returns (answer, cache_args); cache_args is None when the exchange can't be
+    cached because it depends on earlier turns of the conversation.
+    """
+    if session.turns:
+        return None, None
+    model = f"{session.backend.provider}/{session.backend.model}"
+    cache_args = (message, business_context.digest, model)
+    answer = await ai_response_cache.get(db, *cache_args)
+    AI_CACHE_LOOKUPS.inc(result="miss" if answer is None else "hit")
+    if answer is not None:
+        session.backend.remember(message, answer)
+        session.turns += 1
+    return answer, cache_args
+
+async def _timed_llm_send(backend, prompt: str) -> str:
+    labels = {"provider": backend.provider, "model": backend.model}
+    started = time.perf_counter()
+    try:
+        response = await backend.send(prompt)
+    except Exception:
+        LLM_ERRORS.inc(mode="chat", **labels)
+        raise
+    LLM_SECONDS.observe(time.perf_counter() - started, mode="chat", **labels)
+    return response
+
 @api_router.post("/ai/chat")
-async def ai_chat(chat_request: ChatRequest, user: User = Depends(get_current_user)):
+async def ai_chat(
+    chat_request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    user: User = Depends(get_current_user)
+):
     """AI Chat endpoint using Gemini/OpenAI"""
     try:
-        # Get API key from settings or use default
-        settings_doc = await db.app_settings.find_one({"setting_id": "global"}, {"_id": 0})
-        
-        # Check for custom API key in settings, otherwise use Emergent LLM key
-        api_key = None
-        ai_provider = "gemini"
-        ai_model = "gemini-2.5-flash"
-        
-        if settings_doc:
-            api_key = settings_doc.get("ai_api_key")
-            if settings_doc.get("ai_provider"):
-                ai_provider = settings_doc["ai_provider"]
-            if settings_doc.get("ai_model"):
-                ai_model = settings_doc["ai_model"]
-        
-        # Use Emergent LLM key as fallback
-        if not api_key:
-            api_key = EMERGENT_LLM_KEY
-        
-        if not api_key:
-            raise HTTPException(status_code=400, detail="No AI API key configured. Please add one in Settings.")
-        
-        # Initialize chat with business context
-        session_id = chat_request.session_id or f"chat_{user.user_id}_{uuid.uuid4().hex[:8]}"
+        session, session_id = await _prepare_chat(chat_request, user)
         
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=session_id,
-            system_message="""You are a helpful AI assistant for Dharani TVS Business Manager. 
-            You help analyze sales data, provide insights on dealership performance, and answer questions about:
-            - Sales metrics and trends
-            - Vehicle sales data analysis
-            - Service department performance
-            - Inventory management
-            - Executive/staff performance
-            Be concise and helpful. Use Indian Rupee (₹) for currency."""
-        ).with_model(ai_provider, ai_model)
+        started = time.perf_counter()
+        async with session.lock:
+            response, cache_args = await _lookup_cached_answer(session, chat_request.message)
+            cached = response is not None
+            if not cached:
+                prompt = business_context.ground(chat_request.message, session)
+                response = await _timed_llm_send(session.backend, prompt)
+                session.turns += 1
+        latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"AI chat {session_id}: latency={latency_ms}ms cached={cached}")
         
-        # Send message and get response
-        user_message = UserMessage(text=chat_request.message)
-        response = await chat.send_message(user_message)
-        
-        # Store chat history in database
-        await db.chat_history.insert_one({
-            "user_id": user.user_id,
-            "session_id": session_id,
-            "user_message": chat_request.message,
-            "ai_response": response,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        })
+        if cache_args and not cached:
+            background_tasks.add_task(ai_response_cache.put, db, *cache_args, prompt, response, latency_ms)
+        background_tasks.add_task(
+            _save_chat_turn, user.user_id, session_id, chat_request.message, response,
+            {"latency_ms": latency_ms, "cached": cached}
+        )
         
-        return {"response": response, "session_id": session_id}
+        return {"response": response, "session_id": session_id, "cached": cached}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"AI chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.post("/ai/chat/stream")
+async def ai_chat_stream(chat_request: ChatRequest, user: User = Depends(get_current_user)):
+    """Streaming AI chat - forwards response tokens as Server-Sent Events"""
+    session, session_id = await _prepare_chat(chat_request, user)
+    turn = {"parts": [], "completed": False, "timings": {"cached": False}, "cache_args": None, "prompt": None}
+    llm_labels = {"provider": session.backend.provider, "model": session.backend.model}
+    
+    async def event_stream():
+        started = time.perf_counter()
+        yield _sse_event("session", {"session_id": session_id})
+        try:
+            async with session.lock:
+                answer, turn["cache_args"] = await _lookup_cached_answer(session, chat_request.message)
+                if answer is not None:
+                    turn["timings"]["cached"] = True
+                    turn["timings"]["ttft_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    turn["parts"].append(answer)
+                    yield _sse_event("token", {"text": answer})
+                else:
+                    turn["prompt"] = business_context.ground(chat_request.message, session)
+                    llm_started = time.perf_counter()
+                    async for token in session.backend.stream(turn["prompt"]):
+                        if not turn["parts"]:
+                            turn["timings"]["ttft_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - llm_started, **llm_labels)
+                        turn["parts"].append(token)
+                        yield _sse_event("token", {"text": token})
+                    LLM_SECONDS.observe(time.perf_counter() - llm_started, mode="stream", **llm_labels)
+                    session.turns += 1
+        except Exception as e:
+            if turn["prompt"] is not None:
+                LLM_ERRORS.inc(mode="stream", **llm_labels)
+            logger.error(f"AI chat stream error: {e}")
+            yield _sse_event("error", {"detail": str(e)})
+            return
+        
+        turn["timings"]["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        turn["completed"] = True
+        logger.info(
+            f"AI chat stream {session_id}: ttft={turn['timings'].get('ttft_ms')}ms "
+            f"latency={turn['timings']['latency_ms']}ms cached={turn['timings']['cached']}"
+        )
+        yield _sse_event("done", {"session_id": session_id, **turn["timings"]})
+    
+    async def save_history():
+        # Runs after the last byte is sent, so these writes never delay the stream
+        if not turn["completed"]:
+            return
+        response = "".join(turn["parts"])
+        if turn["cache_args"] and not turn["timings"]["cached"]:
+            await ai_response_cache.put(
+                db, *turn["cache_args"], turn["prompt"], response, turn["timings"]["latency_ms"]
+            )
+        await _save_chat_turn(user.user_id, session_id, chat_request.message, response, turn["timings"])
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(save_history)
+    )
+
+@api_router.get("/ai/history")
+async def get_ai_history(
+    session_id: str = Query(...),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    user: User = Depends(get_current_user)
+):
+    """Page through a chat session's history, newest page first"""
+    try:
+        return await chat_history.page(db, user.user_id, session_id, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/ai/cache/stats")
+async def get_ai_cache_stats(user: User = Depends(get_current_user)):
+    """Hit rate and latency/tokens saved by the AI response cache (this worker)"""
+    return ai_response_cache.stats()
+
 @api_router.put("/settings/ai")
 async def update_ai_settings(
     ai_api_key: Optional[str] = Query(None),
@@ -340,6 +564,8 @@ async def update_ai_settings(
         {"$set": update_fields},
         upsert=True
     )
+    # Live chat sessions were built with the old provider/model/key
+    chat_sessions.invalidate()
     return {"message": "AI settings updated"}
 
 # ==================== GOOGLE SHEETS DATA ENDPOINTS ====================
@@ -352,35 +578,15 @@ async def get_sheets_sales_data(
     branch: Optional[str] = Query(None),
     executive: Optional[str] = Query(None),
     data_type: Optional[str] = Query("Sold"),  # Sold, Enquiry, or Bookings
+    as_of: Optional[datetime] = Query(None),  # the sheet as it was at this time
     user: User = Depends(get_current_user)
 ):
     """Get sales data from Google Sheets with filters"""
     try:
-        sales_data = await sheets_service.get_sales_data(branch, data_type)
-        
-        # Apply filters
-        filtered_data = []
-        for record in sales_data:
-            # Search filter
-            if search:
-                search_lower = search.lower()
-                searchable = f"{record.get('Customer Name', '')} {record.get('Mobile No', '')} {record.get('Vehicle Model', '')}".lower()
-                if search_lower not in searchable:
-                    continue
-            
-            # Date filter - try multiple date field names
-            if start_date and end_date:
-                date_value = record.get('Sales Date') or record.get('Date') or record.get('Enquiry Date') or record.get('Booking Date') or ''
-                if date_value and (date_value < start_date or date_value > end_date):
-                    continue
-            
-            # Executive filter  
-            if executive:
-                exec_name = record.get('Executive Name') or record.get('Executive') or ''
-                if exec_name != executive:
-                    continue
-            
-            filtered_data.append(record)
+        # Sales rules (search by customer/mobile/model, any date column) whatever data_type is read
+        filtered_data = await query_tab(
+            branch, data_type, "Sold", search, start_date, end_date, executive, as_of=as_of, db=db
+        )
         
         return {
             "data": filtered_data,
@@ -397,32 +603,14 @@ async def get_sheets_enquiry_data(
     end_date: Optional[str] = Query(None),
     branch: Optional[str] = Query(None),
     executive: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None),
     user: User = Depends(get_current_user)
 ):
     """Get enquiry data from Google Sheets"""
     try:
-        enquiry_data = await sheets_service.get_enquiry_data(branch)
-        
-        # Apply filters
-        filtered_data = []
-        for record in enquiry_data:
-            if search:
-                search_lower = search.lower()
-                searchable = str(record).lower()
-                if search_lower not in searchable:
-                    continue
-            
-            if start_date and end_date:
-                date_value = record.get('Enquiry Date') or record.get('Date') or ''
-                if date_value and (date_value < start_date or date_value > end_date):
-                    continue
-            
-            if executive:
-                exec_name = record.get('Executive Name') or record.get('Executive') or ''
-                if exec_name != executive:
-                    continue
-            
-            filtered_data.append(record)
+        filtered_data = await query_tab(
+            branch, "Enquiry", None, search, start_date, end_date, executive, as_of=as_of, db=db
+        )
         
         return {"data": filtered_data, "total": len(filtered_data)}
     except Exception as e:
@@ -436,32 +624,14 @@ async def get_sheets_bookings_data(
     end_date: Optional[str] = Query(None),
     branch: Optional[str] = Query(None),
     executive: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None),
     user: User = Depends(get_current_user)
 ):
     """Get bookings data from Google Sheets"""
     try:
-        bookings_data = await sheets_service.get_bookings_data(branch)
-        
-        # Apply filters
-        filtered_data = []
-        for record in bookings_data:
-            if search:
-                search_lower = search.lower()
-                searchable = str(record).lower()
-                if search_lower not in searchable:
-                    continue
-            
-            if start_date and end_date:
-                date_value = record.get('Booking Date') or record.get('Date') or ''
-                if date_value and (date_value < start_date or date_value > end_date):
-                    continue
-            
-            if executive:
-                exec_name = record.get('Executive Name') or record.get('Executive') or ''
-                if exec_name != executive:
-                    continue
-            
-            filtered_data.append(record)
+        filtered_data = await query_tab(
+            branch, "Bookings", None, search, start_date, end_date, executive, as_of=as_of, db=db
+        )
         
         return {"data": filtered_data, "total": len(filtered_data)}
     except Exception as e:
@@ -472,18 +642,19 @@ async def get_sheets_bookings_data(
 async def get_sheets_stock_data(
     branch: Optional[str] = Query(None),
     search: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None),
     user: User = Depends(get_current_user)
 ):
     """Get inventory/stock data from Google Sheets"""
     try:
-        stock_data = await sheets_service.get_stock_data(branch)
+        if as_of is not None:
+            stock_data = [row for _, rows in await tab_parts(branch, "Stock", as_of, db) for row in rows]
+        else:
+            stock_data = await sheets_service.get_stock_data(branch)
         
         if search:
-            search_lower = search.lower()
-            stock_data = [
-                record for record in stock_data
-                if search_lower in str(record).lower()
-            ]
+            with timed_phase("filter"):
+                stock_data = await filter_rows(stock_data, "Stock", search)
         
         return {
             "data": stock_data,
@@ -493,6 +664,39 @@ async def get_sheets_stock_data(
         logger.error(f"Sheets stock data error: {e}")
         return {"data": [], "total": 0}
 
+@api_router.post("/sheets/batch")
+async def batch_sheet_queries(batch: SheetBatch, user: User = Depends(get_current_user)):
+    """Several (tab, branch, filters) queries in one request, run concurrently against the sheet cache.
+    
+    Each result carries the query's id, tab and branch, the matching row
+    count, and either the rows or - when the query asks for an aggregate -
+    only the aggregate. A failing query returns no rows and an error
+    without failing the others. A query's as_of (or the batch's) reads
+    the tab as it was at that time.
+    """
+    async def run(query: SheetQuery) -> Dict[str, Any]:
+        result = {"id": query.id, "tab": query.tab, "branch": query.branch}
+        try:
+            rows = await query_tab(
+                query.branch, query.tab, None, query.search, query.start_date, query.end_date, query.executive,
+                as_of=query.as_of or batch.as_of, db=db
+            )
+        except Exception as e:
+            logger.error(f"Sheets batch query error ({query.tab}/{query.branch}): {e}")
+            return {**result, "total": 0, "data": [], "error": "query failed"}
+        
+        result["total"] = len(rows)
+        if query.aggregate:
+            spec = query.aggregate
+            result["aggregate"] = aggregate(rows, spec.group_by, spec.sum)
+        else:
+            result["data"] = rows
+        return result
+    
+    results = await asyncio.gather(*[run(query) for query in batch.queries])
+    # Rows are plain string dicts: render them directly instead of through jsonable_encoder
+    return JSONResponse({"results": results})
+
 @api_router.get("/sheets/service-data")
 async def get_sheets_service_data(
     branch: Optional[str] = Query(None),
@@ -532,6 +736,286 @@ async def get_sheets_executives(
         logger.error(f"Sheets executives error: {e}")
         return {"executives": []}
 
+# ==================== FUNNEL ====================
+
+async def _load_funnel_tabs(branch: Optional[str]) -> Optional[str]:
+    """Make sure the funnel tabs are cached and indexed (the engine indexes them as they load)"""
+    branches = [branch] if branch in sheets_service.BRANCH_SHEETS else sheets_service.get_branches()
+    await asyncio.gather(*[
+        sheets_service.get_tab(name, tab) for name in branches for tab in FUNNEL_TABS
+    ])
+    await funnel_engine.settled()
+    return branch if branch in sheets_service.BRANCH_SHEETS else None
+
+async def _funnel_as_of(branch: Optional[str], as_of: datetime) -> FunnelEngine:
+    """A funnel engine over the funnel tabs as they were at `as_of`"""
+    engine = FunnelEngine()
+    for tab in FUNNEL_TABS:
+        for name, rows in await tab_parts(branch, tab, as_of, db):
+            await asyncio.to_thread(engine.apply, name, tab, rows)
+    return engine
+
+@api_router.get("/funnel")
+async def get_funnel(
+    branch: Optional[str] = Query(None),
+    executive: Optional[str] = Query(None),
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Enquiry -> booking -> sale conversion per branch and executive"""
+    try:
+        if as_of is not None:
+            engine = await _funnel_as_of(branch, as_of)
+            branch = branch if branch in sheets_service.BRANCH_SHEETS else None
+        else:
+            engine = funnel_engine
+            branch = await _load_funnel_tabs(branch)
+        with timed_phase("filter"):
+            return engine.summary(branch, executive, start_date, end_date)
+    except Exception as e:
+        logger.error(f"Funnel error: {e}")
+        return {"enquiries": 0, "booked": 0, "sold": 0, "conversion_rate": 0.0, "branches": {}, "executives": []}
+
+@api_router.get("/funnel/drop-offs")
+async def get_funnel_drop_offs(
+    branch: Optional[str] = Query(None),
+    executive: Optional[str] = Query(None),
+    stage: str = Query("enquiry", pattern="^(enquiry|booked)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    as_of: Optional[datetime] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Customers who enquired but never booked (stage=enquiry) or booked but never bought (stage=booked)"""
+    try:
+        if as_of is not None:
+            engine = await _funnel_as_of(branch, as_of)
+            branch = branch if branch in sheets_service.BRANCH_SHEETS else None
+        else:
+            engine = funnel_engine
+            branch = await _load_funnel_tabs(branch)
+        return engine.drop_offs(branch, executive, stage, limit)
+    except Exception as e:
+        logger.error(f"Funnel drop-offs error: {e}")
+        return {"stage": stage, "data": [], "total": 0}
+
+# ==================== TARGETS ====================
+# Targets use the sheet names: branch_id is the branch, executive_id the executive name
+
+def _current_month() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m")
+
+_DUPLICATE_TARGET = "A target for this scope already exists"
+
+def _check_target_scope(target: Dict[str, Any], target_id: Optional[str] = None):
+    # Blank ids mean "all": store them as null so the unique scope index sees one scope
+    target["branch_id"] = target.get("branch_id") or None
+    target["executive_id"] = target.get("executive_id") or None
+    existing = target_tracker.find(*target_tracker.scope(target))
+    if existing and existing["id"] != target_id:
+        raise HTTPException(status_code=409, detail=f"{_DUPLICATE_TARGET} ({existing['id']})")
+
+@api_router.get("/targets")
+async def list_targets(
+    month: Optional[str] = Query(None),
+    branch: Optional[str] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Stored monthly targets"""
+    await target_tracker.ensure_loaded(db)
+    targets = target_tracker.targets(month, branch)
+    return {"data": targets, "total": len(targets)}
+
+@api_router.post("/targets")
+async def create_target(body: TargetCreate, user: User = Depends(require_admin)):
+    """Set a month's targets for the company, a branch or an executive"""
+    await target_tracker.ensure_loaded(db)
+    target = Target(**body.model_dump()).model_dump()
+    _check_target_scope(target)
+    try:
+        await db.targets.insert_one(dict(target))
+    except DuplicateKeyError:
+        # Created on another worker since this one last loaded targets
+        raise HTTPException(status_code=409, detail=_DUPLICATE_TARGET)
+    target_tracker.put(target)
+    return target
+
+@api_router.put("/targets/{target_id}")
+async def update_target(target_id: str, body: TargetCreate, user: User = Depends(require_admin)):
+    """Replace a target's scope and values"""
+    await target_tracker.ensure_loaded(db)
+    existing = await db.targets.find_one({"id": target_id}, {"_id": 0})
+    if not existing:
+        raise HTTPException(status_code=404, detail="Target not found")
+    target = {**existing, **body.model_dump()}
+    _check_target_scope(target, target_id)
+    try:
+        await db.targets.update_one({"id": target_id}, {"$set": {
+            key: target[key] for key in body.model_dump()
+        }})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail=_DUPLICATE_TARGET)
+    target_tracker.put(target)
+    return target
+
+@api_router.delete("/targets/{target_id}")
+async def delete_target(target_id: str, user: User = Depends(require_admin)):
+    """Remove a target"""
+    await target_tracker.ensure_loaded(db)
+    result = await db.targets.delete_one({"id": target_id})
+    if not result.deleted_count:
+        raise HTTPException(status_code=404, detail="Target not found")
+    target_tracker.remove(target_id)
+    return {"message": "Target deleted"}
+
+async def _targets_as_of(as_of: datetime) -> TargetTracker:
+    """A tracker counting the funnel tabs as they were at `as_of`, against today's stored targets"""
+    tracker = TargetTracker()
+    for target in target_tracker.targets():
+        tracker.put(target)
+    for tab in FUNNEL_TABS:
+        for name, rows in await tab_parts(None, tab, as_of, db):
+            await asyncio.to_thread(tracker.apply, name, tab, rows)
+    return tracker
+
+async def _target_view(month: Optional[str], as_of: Optional[datetime]):
+    """(tracker, month, today) for a progress view, live or as of a point in time"""
+    await target_tracker.ensure_loaded(db)
+    if as_of is not None:
+        today = as_of.date()
+        return await _targets_as_of(as_of), month or today.strftime("%Y-%m"), today
+    await _load_funnel_tabs(None)
+    await target_tracker.settled()
+    return target_tracker, month or _current_month(), None
+
+@api_router.get("/targets/progress")
+async def get_target_progress(
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    as_of: Optional[datetime] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Month-to-date actual vs target and run-rate projection for every branch and executive"""
+    try:
+        tracker, month, today = await _target_view(month, as_of)
+        return tracker.progress(month, today)
+    except Exception as e:
+        logger.error(f"Target progress error: {e}")
+        return {"month": month or _current_month(), "company": None, "branches": [], "executives": []}
+
+@api_router.get("/targets/leaderboard")
+async def get_target_leaderboard(
+    month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    metric: str = Query("sales", pattern="^(" + "|".join(TARGET_METRICS) + ")$"),
+    as_of: Optional[datetime] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Executives ranked by target achievement for the month"""
+    try:
+        tracker, month, today = await _target_view(month, as_of)
+        leaderboard = tracker.leaderboard(month, metric, today)
+        return {"month": month, "metric": metric, "data": leaderboard, "total": len(leaderboard)}
+    except Exception as e:
+        logger.error(f"Target leaderboard error: {e}")
+        return {"month": month or _current_month(), "metric": metric, "data": [], "total": 0}
+
+# ==================== INVENTORY ====================
+
+async def _load_inventory_tabs():
+    """Stock and Sold for every branch; cached tabs cost nothing and new ones get indexed on load"""
+    await asyncio.gather(*[
+        sheets_service.get_tab(name, tab) for name in sheets_service.get_branches() for tab in INVENTORY_TABS
+    ])
+    await inventory.settled()
+
+async def _inventory_view(as_of: Optional[datetime]):
+    """(analytics, today): the live indexes, or Stock and Sold as they were at `as_of`"""
+    if as_of is None:
+        await _load_inventory_tabs()
+        return inventory, None
+    today = as_of.date()
+    analytics = InventoryAnalytics(inventory.low_stock, inventory.overstock_days, inventory.window_days)
+    for tab in INVENTORY_TABS:
+        for name, rows in await tab_parts(None, tab, as_of, db):
+            await asyncio.to_thread(analytics.apply, name, tab, rows, today)
+    # Alert transitions are only tracked live
+    analytics.events.clear()
+    return analytics, today
+
+@api_router.get("/inventory/summary")
+async def get_inventory_summary(
+    branch: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Stock by model and colour, stock age and sell-through per branch"""
+    try:
+        analytics, today = await _inventory_view(as_of)
+        return analytics.summary(branch if branch in sheets_service.BRANCH_SHEETS else None, today)
+    except Exception as e:
+        logger.error(f"Inventory summary error: {e}")
+        return {"total": 0, "branches": {}, "alerts": []}
+
+@api_router.get("/inventory/alerts")
+async def get_inventory_alerts(
+    branch: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Current low-stock/overstock alerts and the most recent alert transitions"""
+    try:
+        analytics, _ = await _inventory_view(as_of)
+        alerts = analytics.alerts(branch if branch in sheets_service.BRANCH_SHEETS else None)
+        return {"data": alerts, "total": len(alerts), "events": analytics.events[-50:][::-1]}
+    except Exception as e:
+        logger.error(f"Inventory alerts error: {e}")
+        return {"data": [], "total": 0, "events": []}
+
+@api_router.get("/inventory/locate")
+async def locate_stock(
+    model: str = Query(..., min_length=1),
+    colour: Optional[str] = Query(None),
+    as_of: Optional[datetime] = Query(None),
+    user: User = Depends(get_current_user)
+):
+    """Which branches have the model (optionally in a colour) in stock"""
+    try:
+        analytics, _ = await _inventory_view(as_of)
+        branches = analytics.locate(model, colour)
+        return {"model": model, "colour": colour, "branches": branches, "total": sum(branches.values())}
+    except Exception as e:
+        logger.error(f"Inventory locate error: {e}")
+        return {"model": model, "colour": colour, "branches": {}, "total": 0}
+
+# ==================== BRANCH REGISTRY ====================
+
+@api_router.get("/branches/registry")
+async def get_branch_registry(user: User = Depends(require_admin)):
+    """Registered branches with their resolved refresh settings and live sync schedule"""
+    return {**branch_registry.describe(), "schedule": sheet_sync.snapshot()}
+
+@api_router.put("/branches/registry/{name}")
+async def put_branch(name: str, config: BranchConfig, user: User = Depends(require_admin)):
+    """Add or update a branch; takes effect without a restart"""
+    try:
+        branch = await branch_registry.save_branch(db, name, config.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": f"Branch {name} saved", "branch": branch, "version": branch_registry.version}
+
+@api_router.delete("/branches/registry/{name}")
+async def delete_branch(name: str, user: User = Depends(require_admin)):
+    """Remove a branch from the registry"""
+    if not await branch_registry.delete_branch(db, name):
+        raise HTTPException(status_code=404, detail="Branch not found")
+    return {"message": f"Branch {name} removed", "version": branch_registry.version}
+
+@api_router.post("/branches/registry/reload")
+async def reload_branch_registry(user: User = Depends(require_admin)):
+    """Re-read the registry now instead of waiting for the next poll"""
+    changed = await branch_registry.reload(db)
+    return {"changed": changed, "version": branch_registry.version, "source": branch_registry.source}
+
 # ==================== SERVICE PDF UPLOAD ====================
 
 @api_router.post("/service/upload-pdf")
@@ -546,13 +1030,15 @@ async def upload_service_pdf(
             raise HTTPException(status_code=400, detail="Only PDF files allowed")
         
         content = await file.read()
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+        import PyPDF2  # imported on first upload to keep startup fast
         
         extracted_data = []
         full_text = ""
         
-        for page in pdf_reader.pages:
-            full_text += page.extract_text() + "\n"
+        with PDF_PARSE_SECONDS.time():
+            pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+            for page in pdf_reader.pages:
+                full_text += page.extract_text() + "\n"
         
         # Parse the S601 format - technician productivity table
         lines = full_text.split('\n')
@@ -607,6 +1093,7 @@ async def upload_service_pdf(
                 # Store a copy for response (without _id)
                 response_data.append(dict(record))
             await db.service_reports.insert_many(extracted_data)
+            business_context.update_service_reports(branch, response_data)
         
         return {
             "message": f"Successfully extracted {len(response_data)} records",
@@ -615,6 +1102,7 @@ async def upload_service_pdf(
         }
         
     except Exception as e:
+        PDF_ERRORS.inc()
         logger.error(f"PDF upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -638,12 +1126,205 @@ async def get_service_reports(
         logger.error(f"Service reports error: {e}")
         return {"data": [], "total": 0}
 
+# ==================== ANALYTICS EXPORT ====================
+# Parquet/Arrow files of the synced sheets and service_reports, partitioned by branch and month
+
+@api_router.post("/export/run")
+async def run_analytics_export(user: User = Depends(require_admin)):
+    """Bring the export up to date now instead of waiting for the next scheduled run"""
+    try:
+        return await analytics_export.export(db)
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@api_router.get("/export/partitions")
+async def list_export_partitions(
+    dataset: Optional[str] = Query(None, pattern="^(sheets|service_reports)$"),
+    tab: Optional[str] = Query(None),
+    branch: Optional[str] = Query(None),
+    from_month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    to_month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    user: User = Depends(get_current_user)
+):
+    """Exported partitions (path, rows, bytes, updated_at) matching the filters"""
+    partitions = analytics_export.partitions(dataset, tab, branch, from_month, to_month)
+    for entry in partitions:
+        entry.pop("fingerprint", None)
+    return {"partitions": partitions, "total": len(partitions), "last_run": analytics_export.last_run}
+
+@api_router.get("/export/file")
+async def download_export_file(path: str = Query(...), user: User = Depends(get_current_user)):
+    """One partition file, streamed from disk"""
+    file_path = analytics_export.file_path(path)
+    if file_path is None or not file_path.exists():
+        raise HTTPException(status_code=404, detail="Unknown export partition")
+    entry = analytics_export.manifest()["partitions"][path]
+    name = "_".join(part for part in (entry["dataset"], entry.get("tab"), entry["branch"], entry["month"]) if part)
+    return FileResponse(
+        file_path, media_type=MEDIA_TYPES[entry["format"]], filename=f"{name}{file_path.suffix}"
+    )
+
+@api_router.get("/export/archive")
+async def download_export_archive(
+    dataset: Optional[str] = Query(None, pattern="^(sheets|service_reports)$"),
+    tab: Optional[str] = Query(None),
+    branch: Optional[str] = Query(None),
+    from_month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    to_month: Optional[str] = Query(None, pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    user: User = Depends(get_current_user)
+):
+    """Every matching partition in one zip, in the export's directory layout, streamed as it is built"""
+    partitions = analytics_export.partitions(dataset, tab, branch, from_month, to_month)
+    if not partitions:
+        raise HTTPException(status_code=404, detail="No exported partitions match")
+    return StreamingResponse(
+        analytics_export.iter_archive(partitions),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="dharani-export.zip"'}
+    )
+
 # ==================== ROOT ====================
 
 @api_router.get("/")
 async def root():
     return {"message": "Dharani TVS Business Manager API", "status": "active"}
 
+@api_router.get("/health/live")
+async def health_live():
+    """Liveness - the process is up and serving"""
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def health_ready():
+    """Readiness - 200 once the background Sheets probe has succeeded and while the upstream isn't down"""
+    started_at = getattr(app.state, "started_at", None)
+    body = {
+        "ready": sheets_service.connected and sheets_service.warmup_state in ('warming', 'ready'),
+        "sheets": {
+            "connected": sheets_service.connected,
+            "health": sheets_service.health.snapshot(),
+            "warmup": sheets_service.warmup_state,
+            "cached_tabs": sheets_service.cached_tabs
+        },
+        "uptime_s": round(time.monotonic() - started_at, 1) if started_at else None
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+# ==================== METRICS ====================
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Latency histogram and error counter for every /api route"""
+    if not request.url.path.startswith("/api"):
+        return await call_next(request)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not the raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        labels = {
+            "method": request.method,
+            "route": getattr(route, "path", "unmatched"),
+            "status": str(status)
+        }
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+        if status >= 500:
+            HTTP_ERRORS.inc(**labels)
+
+# ==================== REQUEST TIMING ====================
+
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", 1)) / 1000
+PROFILE_RETENTION_DAYS = int(os.environ.get("PROFILE_RETENTION_DAYS", 7))
+
+async def _profiling_admin(request: Request) -> Optional[User]:
+    """The admin asking for ?profile=1, or None (profiling is silently skipped for anyone else)"""
+    if request.query_params.get("profile") != "1":
+        return None
+    try:
+        user = await _authenticate(request)
+    except HTTPException:
+        return None
+    return user if user.role == "admin" else None
+
+async def _store_profile(request: Request, user: User, status: int, timing, profiler: SamplingProfiler) -> str:
+    profile_id = f"prof_{uuid.uuid4().hex[:12]}"
+    now = datetime.now(timezone.utc)
+    await db.request_profiles.insert_one({
+        "profile_id": profile_id,
+        "user_id": user.user_id,
+        "method": request.method,
+        "path": request.url.path,
+        "query": str(request.query_params),
+        "status": status,
+        "server_timing": timing.as_ms(),
+        **profiler.result(),
+        "created_at": now.isoformat(),
+        "expires_at": now + timedelta(days=PROFILE_RETENTION_DAYS)
+    })
+    return profile_id
+
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    """Server-Timing header with per-phase durations; admins can add ?profile=1 to sample the request"""
+    if not request.url.path.startswith("/api"):
+        return await call_next(request)
+    profile_user = await _profiling_admin(request)
+    timing = start_request()
+    profiler = SamplingProfiler(interval=PROFILE_INTERVAL) if profile_user else None
+    if profiler:
+        profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        if profiler:
+            profiler.stop()
+    
+    response.headers["Server-Timing"] = timing.header()
+    origin = request.headers.get("origin")
+    if origin and origin in cors_origins_list:
+        # Lets the browser expose the timings to the page's Resource Timing API
+        response.headers["Timing-Allow-Origin"] = origin
+    if profiler:
+        try:
+            response.headers["X-Profile-Id"] = await _store_profile(request, profile_user, response.status_code, timing, profiler)
+        except Exception as e:
+            logger.error(f"Failed to store request profile: {e}")
+    return response
+
+@api_router.get("/admin/profiles")
+async def list_profiles(limit: int = Query(20, ge=1, le=100), user: User = Depends(require_admin)):
+    """Recently captured request profiles (without the stacks)"""
+    profiles = await db.request_profiles.find(
+        {}, {"_id": 0, "folded": 0, "top": 0, "expires_at": 0}
+    ).sort("created_at", -1).limit(limit).to_list(limit)
+    return {"data": profiles}
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query("json", pattern="^(json|folded)$"),
+    user: User = Depends(require_admin)
+):
+    """One request profile; format=folded returns collapsed stacks for flamegraph tools"""
+    profile = await db.request_profiles.find_one({"profile_id": profile_id}, {"_id": 0, "expires_at": 0})
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return Response(profile["folded"], media_type="text/plain")
+    return profile
+
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """Prometheus scrape endpoint (this worker); bearer METRICS_TOKEN when set"""
+    token = os.environ.get("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 app.include_router(api_router)
 
 cors_origins = os.environ.get('CORS_ORIGINS', '*')
@@ -658,19 +1339,59 @@ if cors_origins == '*':
 else:
     cors_origins_list = [origin.strip() for origin in cors_origins.split(',')]
 
+# Per-user rate limits and concurrency caps for the sheets, pdf and ai routes
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Budget for each /api request; handlers are cancelled when the client disconnects
+REQUEST_DEADLINE_SECONDS = float(os.environ.get('REQUEST_DEADLINE_SECONDS', 25))
+app.add_middleware(DeadlineMiddleware, budget=REQUEST_DEADLINE_SECONDS)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=cors_origins_list,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Access-Token", "Retry-After"],
 )
 
+async def _ensure_indexes():
+    try:
+        await ai_response_cache.ensure_indexes(db)
+        await chat_history.ensure_indexes(db)
+        await db.request_profiles.create_index("profile_id", unique=True)
+        await db.request_profiles.create_index("expires_at", expireAfterSeconds=0)
+        await db.targets.create_index("id", unique=True)
+        await db.targets.create_index([("month", 1), ("branch_id", 1), ("executive_id", 1)], unique=True)
+        await session_tokens.ensure_indexes(db)
+        await sheet_history.ensure_indexes(db)
+    except Exception as e:
+        logger.error(f"Index creation failed: {e}")
+
+async def _sync_sheets():
+    """Load the branch registry, warm the sheet cache, then keep every tab refreshed on schedule"""
+    await branch_registry.reload(db)
+    await sheets_service.warm_up()
+    await sheet_sync.run()
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Starting Dharani TVS Business Manager API...")
-    await sheets_service.connect()
+    # Nothing here waits on the network: the Sheets probe, cache warm-up and
+    # index builds run in the background and report through /api/health/ready
+    app.state.started_at = time.monotonic()
+    app.state.background_tasks = [
+        asyncio.create_task(_sync_sheets()),
+        asyncio.create_task(branch_registry.watch(db)),
+        asyncio.create_task(session_tokens.watch(db)),
+        asyncio.create_task(sheet_history.run(db)),
+        asyncio.create_task(analytics_export.run(db)),
+        asyncio.create_task(_ensure_indexes())
+    ]
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for task in getattr(app.state, "background_tasks", []):
+        task.cancel()
+    await close_auth_http_client()
     client.close()
@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+import jwt
+
+from auth import DEFAULT_JWT_SECRET, JWT_ALGORITHM
+
+logger = logging.getLogger(__name__)
+
+# Claims copied from the user document into the token
+USER_CLAIMS = ('email', 'name', 'picture', 'role', 'branch_id')
+# Shortest JWT_SECRET that turns token mode on (HS256 wants at least 256 bits)
+MIN_SECRET_BYTES = 32
+
+
+def session_id(session_token: str) -> str:
+    """Stable, non-reversible id for a login session (tokens carry this, never the session token)"""
+    return hashlib.sha256(session_token.encode('utf-8')).hexdigest()[:32]
+
+
+def looks_like_token(value: Optional[str]) -> bool:
+    return bool(value) and value.count('.') == 2
+
+
+class SessionTokens:
+    """Short-lived signed access tokens layered over the Mongo login sessions.
+
+    After login (and whenever a request falls back to the session lookup)
+    the server issues an HS256 token with the user's id, role and branch.
+    Requests carrying a valid token are authenticated in-process; an expired
+    or missing token falls back to one session lookup, which issues a fresh
+    token. Token mode is only on with a JWT_SECRET of at least
+    MIN_SECRET_BYTES that isn't the committed default; otherwise every
+    request authenticates through the session lookup. Logout revokes the session id until its last token could expire,
+    in memory right away and through `revoked_sessions` for other workers,
+    which pick it up on their next sync.
+    """
+
+    def __init__(self, ttl: int = 900, secret: str = '', sync_interval: float = 30.0):
+        self.ttl = ttl
+        self.secret = secret
+        self.sync_interval = sync_interval
+        self._revoked: Dict[str, float] = {}  # session id -> unix time the entry can be dropped
+        if ttl > 0 and not self.strong_secret:
+            logger.warning(
+                f"Signed access tokens disabled: set JWT_SECRET to a random value of at least {MIN_SECRET_BYTES} bytes"
+            )
+
+    @property
+    def strong_secret(self) -> bool:
+        return len(self.secret.encode('utf-8')) >= MIN_SECRET_BYTES and self.secret != DEFAULT_JWT_SECRET
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.strong_secret
+
+    def issue(self, user: Dict[str, Any], session_token: str) -> str:
+        if not self.strong_secret:
+            raise RuntimeError("JWT_SECRET is missing or too weak to sign access tokens")
+        claims = {key: user.get(key) for key in USER_CLAIMS}
+        claims.update({
+            'sub': user['user_id'], 'sid': session_id(session_token), 'jti': uuid.uuid4().hex,
+            'exp': datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        })
+        return jwt.encode(claims, self.secret, algorithm=JWT_ALGORITHM)
+
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """Claims of a valid, unexpired, unrevoked token - None otherwise"""
+        if not self.enabled:
+            return None
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[JWT_ALGORITHM])
+        except jwt.InvalidTokenError:
+            return None
+        if self.is_revoked(claims.get('sid')):
+            return None
+        return claims
+
+    @staticmethod
+    def user_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+        return {'user_id': claims['sub'], **{key: claims.get(key) for key in USER_CLAIMS}}
+
+    def unverified_session(self, token: str) -> Optional[str]:
+        """Session id of a correctly signed token, expired or not (for logout)"""
+        if not self.strong_secret:
+            return None
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[JWT_ALGORITHM], options={'verify_exp': False})
+        except jwt.InvalidTokenError:
+            return None
+        return claims.get('sid')
+
+    # ---- revocation ----
+
+    def is_revoked(self, sid: Optional[str]) -> bool:
+        until = self._revoked.get(sid) if sid else None
+        if until is None:
+            return False
+        if until < time.time():
+            del self._revoked[sid]
+            return False
+        return True
+
+    async def revoke(self, db, sid: str):
+        """No token of this session verifies any more, here at once and on other workers after a sync"""
+        until = time.time() + self.ttl
+        self._revoked[sid] = until
+        try:
+            await db.revoked_sessions.update_one(
+                {'sid': sid},
+                {'$set': {'sid': sid, 'expires_at': datetime.fromtimestamp(until, timezone.utc)}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to persist session revocation: {e}")
+
+    async def sync_revocations(self, db):
+        now = datetime.now(timezone.utc)
+        docs = await db.revoked_sessions.find({'expires_at': {'$gt': now}}, {'_id': 0}).to_list(None)
+        for doc in docs:
+            expires_at = doc['expires_at']
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=timezone.utc)
+            self._revoked[doc['sid']] = expires_at.timestamp()
+        for sid in [sid for sid, until in self._revoked.items() if until < time.time()]:
+            del self._revoked[sid]
+
+    async def watch(self, db):
+        """Pull revocations made by other workers"""
+        if not self.enabled:
+            return
+        while True:
+            try:
+                await self.sync_revocations(db)
+            except Exception as e:
+                logger.error(f"Session revocation sync failed: {e}")
+            await asyncio.sleep(self.sync_interval)
+
+    async def ensure_indexes(self, db):
+        await db.revoked_sessions.create_index('sid', unique=True)
+        await db.revoked_sessions.create_index('expires_at', expireAfterSeconds=0)
+
+
+# Global instance
+session_tokens = SessionTokens(
+    ttl=int(os.environ.get('SESSION_TOKEN_TTL_SECONDS', 900)),
+    secret=os.environ.get('JWT_SECRET', ''),
+    sync_interval=float(os.environ.get('SESSION_REVOCATION_SYNC_SECONDS', 30))
+)
@@ -0,0 +1,121 @@
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from request_deadline import FetchAborted, check_fetch
+from sheet_snapshot import SnapshotReader, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def default_shared_dir() -> str:
+    # tmpfs keeps the files in shared memory on Linux
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "dharani-sheets")
+
+
+class SharedSheetCache:
+    """Cross-process sheet cache for multi-worker deployments on one host.
+
+    Every (branch, tab) lives in its own snapshot-format file under
+    `directory` (tmpfs by default), which workers read through mmap. Refreshes
+    are single-flight across processes: the worker that wins the tab's
+    flock downloads it, and the others wait for the lock and then read the
+    file it wrote, so N workers cost one upstream fetch per sheet - forced
+    refreshes (max_age=0) included, as a copy written after a worker started
+    waiting is fresh enough for it. Waiting polls a non-blocking lock so it
+    honours the fetch budget (deadline, cancellation) and `lock_wait`; a
+    waiter that gives up gets the copy already on disk, if any.
+    """
+
+    def __init__(self, directory: str, lock_wait: float = 30.0, poll_interval: float = 0.05):
+        self.directory = directory
+        self.lock_wait = lock_wait
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, branch: str, tab: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in f"{branch}__{tab}")
+        return os.path.join(self.directory, f"{safe}.snap")
+
+    def read(self, branch: str, tab: str, known_digest: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """{"digest", "fetched_at" (wall clock), "rows"} for a tab, or None if absent.
+
+        Rows are only decoded when the digest differs from `known_digest`.
+        """
+        try:
+            with SnapshotReader(self._path(branch, tab)) as reader:
+                meta = reader.meta(branch, tab)
+                if meta is None:
+                    return None
+                rows = None if meta["digest"] == known_digest else reader.rows(branch, tab)
+                return {"digest": meta["digest"], "fetched_at": meta["fetched_at"], "rows": rows}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Unreadable shared cache file for {branch}/{tab}: {e}")
+            return None
+
+    def fetch(
+        self,
+        branch: str,
+        tab: str,
+        max_age: float,
+        download: Callable[[], str],
+        parse: Callable[[str], List[Dict[str, Any]]],
+        known_digest: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Fresh data for a tab, downloading only if no other worker has (blocking; run in a thread).
+
+        Returns (data, downloaded) where data is as in `read()`.
+        """
+        requested_at = time.time()
+        current = self.read(branch, tab, known_digest)
+        if current and requested_at - current["fetched_at"] < max_age:
+            return current, False
+
+        with open(self._path(branch, tab) + ".lock", "a") as lock_file:
+            try:
+                self._lock(lock_file)
+            except (FetchAborted, TimeoutError) as e:
+                if current is None:
+                    raise
+                logger.warning(f"Gave up waiting for the {branch}/{tab} refresh ({e}); using the shared copy")
+                return current, False
+            try:
+                # Another worker may have refreshed the tab while we waited for the lock
+                current = self.read(branch, tab, known_digest)
+                if current and (
+                    time.time() - current["fetched_at"] < max_age or current["fetched_at"] >= requested_at
+                ):
+                    return current, False
+
+                text = download()
+                rows = parse(text)
+                data = {
+                    "digest": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                    "fetched_at": time.time(),
+                    "rows": rows
+                }
+                write_snapshot(self._path(branch, tab), {(branch, tab): data}, data["fetched_at"])
+                return data, True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lock(self, lock_file):
+        """Take the tab's lock, polling so the fetch budget and `lock_wait` are honoured"""
+        give_up = time.monotonic() + self.lock_wait
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                pass
+            check_fetch()
+            if time.monotonic() >= give_up:
+                raise TimeoutError(f"lock held for over {self.lock_wait:g}s")
+            time.sleep(self.poll_interval)
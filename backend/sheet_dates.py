@@ -0,0 +1,205 @@
+"""Date normalization for sheet cells.
+
+Branch sheets write dates however whoever set them up liked: ISO, DD/MM/YYYY,
+DD-Mon-YYYY, sometimes with a time. When a tab loads, each date column's
+format is detected from a sample of its values and every row's date is
+stored as an integer day number (date.toordinal(), 0 = no date), so date
+filters compare integers instead of strings that only order correctly when
+they happen to be ISO. Parsed values are cached per distinct string: a
+column with 50,000 rows typically has a few hundred distinct dates.
+"""
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from change_queue import ChangeQueue
+
+# Tried in this order; day-first before month-first, as the sheets are Indian
+FORMATS = (
+    '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d-%b-%Y', '%d %b %Y', '%d-%B-%Y', '%d %B %Y',
+    '%d-%b-%y', '%d/%m/%y', '%Y/%m/%d', '%m/%d/%Y', '%b %d, %Y',
+)
+NO_DATE = 0
+# Distinct values per column looked at to pick its format
+SAMPLE_SIZE = 50
+# The parse cache is dropped wholesale beyond this many entries
+CACHE_LIMIT = 200_000
+# %Y happily reads "26" as year 26; anything earlier is a misparse
+MIN_YEAR = 1900
+
+_TIME_SUFFIX = re.compile(r'[ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?\s*([AaPp][Mm])?$')
+
+
+def _strip_time(value: str) -> str:
+    return _TIME_SUFFIX.sub('', value.strip())
+
+
+def to_date(day: int) -> Optional[date]:
+    """The date of a day number (None for NO_DATE)"""
+    return date.fromordinal(day) if day != NO_DATE else None
+
+
+class DateNormalizer:
+    """Per-column format detection and a parse cache keyed by (format, value)"""
+
+    def __init__(self):
+        self._cache: Dict[Tuple[Optional[str], str], int] = {}
+
+    def _strptime(self, value: str, fmt: str) -> int:
+        try:
+            parsed = datetime.strptime(value, fmt).date()
+        except ValueError:
+            return NO_DATE
+        return parsed.toordinal() if parsed.year >= MIN_YEAR else NO_DATE
+
+    def parse(self, value: Any, fmt: Optional[str] = None) -> int:
+        """Day number of a cell (NO_DATE if it is empty or no known format fits).
+
+        `fmt` is tried first - the column's detected format - then the rest,
+        so a stray differently formatted cell still parses.
+        """
+        if not value:
+            return NO_DATE
+        key = (fmt, value)
+        day = self._cache.get(key)
+        if day is not None:
+            return day
+        text = _strip_time(str(value))
+        day = self._strptime(text, fmt) if fmt else NO_DATE
+        if not day:
+            for candidate in FORMATS:
+                if candidate != fmt:
+                    day = self._strptime(text, candidate)
+                    if day:
+                        break
+        if len(self._cache) >= CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[key] = day
+        return day
+
+    def detect_format(self, values: Iterable[Any]) -> Optional[str]:
+        """The format that parses most of a sample of distinct values (earliest in FORMATS on a tie)"""
+        sample = []
+        seen = set()
+        for value in values:
+            if value and value not in seen:
+                seen.add(value)
+                sample.append(_strip_time(str(value)))
+                if len(sample) >= SAMPLE_SIZE:
+                    break
+        best, best_hits = None, 0
+        for fmt in FORMATS:
+            hits = sum(1 for value in sample if self._strptime(value, fmt))
+            if hits > best_hits:
+                best, best_hits = fmt, hits
+        return best
+
+    def detect_formats(self, rows: Sequence[Dict[str, Any]], fields: Sequence[str]) -> Dict[str, Optional[str]]:
+        """Detected format of each column in `fields`"""
+        return {field: self.detect_format(row.get(field) for row in rows) for field in fields}
+
+    def row_day(self, row: Dict[str, Any], fields: Sequence[str], formats: Dict[str, Optional[str]]) -> int:
+        """Day number of the row's first non-empty field among `fields`, read in that column's format"""
+        for field in fields:
+            value = row.get(field)
+            if value:
+                return self.parse(value, formats.get(field))
+        return NO_DATE
+
+    def row_days(
+        self, rows: Sequence[Dict[str, Any]], fields: Sequence[str], formats: Optional[Dict[str, Optional[str]]] = None
+    ) -> array:
+        """Day number per row of its first non-empty field among `fields` (as the string filters picked it)"""
+        if formats is None:
+            formats = self.detect_formats(rows, fields)
+        days = array('l', [NO_DATE]) * len(rows)
+        for i, row in enumerate(rows):
+            for field in fields:
+                value = row.get(field)
+                if value:
+                    days[i] = self.parse(value, formats[field])
+                    break
+        return days
+
+
+class _TabIndex:
+    __slots__ = ('rows', 'formats', 'order', 'sorted_days')
+
+    def __init__(self, rows: List[Dict[str, Any]], formats: Dict[str, Optional[str]], days: array):
+        self.rows = rows
+        self.formats = formats
+        # Row offsets ordered by day (stable: sheet order within a day), and their days
+        self.order = array('l', sorted(range(len(days)), key=days.__getitem__))
+        self.sorted_days = array('l', (days[i] for i in self.order))
+
+
+class TabDates:
+    """Date-ordered offset index for every cached tab, kept in step with the sheet cache by a listener.
+
+    The cached rows keep their sheet order; beside them each tab has its
+    row offsets sorted by day number. A date range is then two binary
+    searches and a slice - O(log n + k) however many years the sheet
+    holds - and the k matches are put back in sheet order. Entries remember
+    which rows list they were built for, so a caller holding an older copy
+    of a tab gets None (and filters row by row) rather than wrong offsets.
+    Indexes are built in a worker thread; until one is swapped in, reads
+    of the new rows take the same row-by-row path.
+    """
+
+    def __init__(self, normalizer: DateNormalizer, fields: Dict[str, Sequence[str]]):
+        self.normalizer = normalizer
+        self.fields = fields
+        self._index: Dict[Tuple[str, str], _TabIndex] = {}
+        self._changes = ChangeQueue('Date index', self._build, self._swap)
+
+    def on_sheet_change(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """SheetsService listener: index the tab's dates off the event loop"""
+        if self.fields.get(tab):
+            self._changes.push(branch, tab, rows)
+
+    def apply(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """Index the tab's dates inline"""
+        if self.fields.get(tab):
+            self._changes.apply(branch, tab, rows)
+
+    async def settled(self):
+        """Wait for queued tabs to be indexed"""
+        await self._changes.settled()
+
+    def _build(self, branch: str, tab: str, rows: Optional[List[Dict[str, Any]]]) -> Optional[_TabIndex]:
+        if rows is None:
+            return None
+        fields = self.fields[tab]
+        formats = self.normalizer.detect_formats(rows, fields)
+        return _TabIndex(rows, formats, self.normalizer.row_days(rows, fields, formats))
+
+    def _swap(self, branch: str, tab: str, index: Optional[_TabIndex]):
+        if index is None:
+            self._index.pop((branch, tab), None)
+        else:
+            self._index[(branch, tab)] = index
+
+    def formats(self, branch: str, tab: str, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Optional[str]]]:
+        """Column formats detected when these rows were indexed (None if they weren't)"""
+        index = self._index.get((branch, tab))
+        return index.formats if index is not None and index.rows is rows else None
+
+    def select(
+        self, branch: str, tab: str, rows: List[Dict[str, Any]], first_day: int, last_day: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Rows dated first_day..last_day (inclusive) plus undated rows, in sheet order; None if not indexed"""
+        index = self._index.get((branch, tab))
+        if index is None or index.rows is not rows:
+            return None
+        sorted_days = index.sorted_days
+        undated = bisect_right(sorted_days, NO_DATE)
+        lo = bisect_left(sorted_days, first_day, undated)
+        hi = bisect_right(sorted_days, last_day, lo)
+        offsets = index.order[:undated] + index.order[lo:hi]
+        return [rows[i] for i in sorted(offsets)]
+
+
+# Global instance
+date_normalizer = DateNormalizer()
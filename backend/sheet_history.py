@@ -0,0 +1,345 @@
+"""Append-only version history of every cached sheet tab, for point-in-time reads.
+
+Whenever a tab's data changes the new rows are diffed against the previous
+version and only the difference is written to `sheet_versions`: a list of
+splices (start, rows removed, rows inserted) against the previous rows.
+Sheets mostly grow at the bottom or get a few rows edited in place, so a
+sync usually stores a handful of rows. Every `checkpoint_every` versions -
+or when a diff would be larger than `max_delta_ratio` of the tab - the full
+rows are stored instead, so rebuilding a version replays at most
+`checkpoint_every - 1` deltas on top of the nearest checkpoint. Large
+versions are split into parts of at most `part_rows` rows to stay well
+inside Mongo's document size limit.
+
+Writes happen off the request path: the SheetsService listener only notes
+the newest rows per tab and wakes `run()`, which records them in the
+background, with the diffing and the replay of a version done in worker
+threads so neither holds up the event loop. Concurrent workers race on a unique (branch, tab, version,
+part) index; the loser drops its in-memory head and picks up the winner's
+version on the next change.
+"""
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from metrics import SHEET_HISTORY_ROWS, SHEET_HISTORY_VERSIONS
+from sheets_service import SheetsService, sheets_service
+
+logger = logging.getLogger(__name__)
+
+Rows = List[Dict[str, Any]]
+# (start, rows removed, rows inserted) against the previous version's rows
+Splice = Tuple[int, int, Rows]
+
+
+def _runs(old: Rows, new: Rows, old_start: int, new_start: int, length: int) -> List[Splice]:
+    """One splice per run of rows that differ position by position"""
+    splices = []
+    i = 0
+    while i < length:
+        if old[old_start + i] == new[new_start + i]:
+            i += 1
+            continue
+        j = i
+        while j < length and old[old_start + j] != new[new_start + j]:
+            j += 1
+        splices.append((old_start + i, j - i, new[new_start + i:new_start + j]))
+        i = j
+    return splices
+
+
+def diff_rows(old: Rows, new: Rows) -> List[Splice]:
+    """Splices turning `old` into `new`, in ascending order of start.
+
+    Unchanged leading and trailing rows are skipped. What is left is
+    compared row by row - aligned at its start (rows added or removed at
+    its end) or at its end (rows added or removed at its start), whichever
+    inserts fewer rows - so edits in place plus rows appended at the
+    bottom store only those rows. Linear time; a row moved elsewhere costs
+    the rows in between.
+    """
+    n_old, n_new = len(old), len(new)
+    shortest = min(n_old, n_new)
+    prefix = 0
+    while prefix < shortest and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < shortest - prefix and old[n_old - 1 - suffix] == new[n_new - 1 - suffix]:
+        suffix += 1
+    old_end, new_end = n_old - suffix, n_new - suffix
+    old_len, new_len = old_end - prefix, new_end - prefix
+    common = min(old_len, new_len)
+    if old_len == new_len:
+        return _runs(old, new, prefix, prefix, common)
+
+    head = _runs(old, new, prefix, prefix, common)
+    head.append((prefix + common, old_len - common, new[prefix + common:new_end]))
+    tail = [(prefix, old_len - common, new[prefix:new_end - common])]
+    tail.extend(_runs(old, new, old_end - common, new_end - common, common))
+    return min(head, tail, key=lambda splices: sum(len(inserted) for _, _, inserted in splices))
+
+
+def apply_splices(rows: Rows, splices: List[Splice]) -> Rows:
+    """Apply diff_rows() output to a copy of `rows`.
+
+    Splices are applied last to first, so each one's start still refers to
+    the unmodified rows before it.
+    """
+    result = list(rows)
+    for start, removed, inserted in reversed(splices):
+        result[start:start + removed] = inserted
+    return result
+
+
+def _split(splices: List[Splice], part_rows: int) -> List[List[Splice]]:
+    """Group splices into parts of about `part_rows` rows, splitting long insertions"""
+    pieces = []
+    for start, removed, inserted in splices:
+        if len(inserted) <= part_rows:
+            pieces.append((start, removed, inserted))
+            continue
+        # The first piece replaces the removed rows, the rest insert after them
+        for offset in range(0, len(inserted), part_rows):
+            if offset:
+                pieces.append((start + removed, 0, inserted[offset:offset + part_rows]))
+            else:
+                pieces.append((start, removed, inserted[:part_rows]))
+    parts: List[List[Splice]] = [[]]
+    size = 0
+    for piece in pieces:
+        weight = len(piece[2]) + 1
+        if parts[-1] and size + weight > part_rows:
+            parts.append([])
+            size = 0
+        parts[-1].append(piece)
+        size += weight
+    return parts
+
+
+def _replay(docs: List[Dict[str, Any]]) -> Rows:
+    """Rows after a checkpoint's parts and the following deltas, in (version, part) order"""
+    rows: Rows = []
+    splices: List[Splice] = []
+    current = None
+    for doc in docs:
+        if doc['version'] != current:
+            # A version's splices may span parts: apply them once all are in
+            rows = apply_splices(rows, splices) if splices else rows
+            splices = []
+            current = doc['version']
+        if doc['kind'] == 'checkpoint':
+            rows.extend(doc['rows'])
+        else:
+            splices.extend((start, removed, inserted) for start, removed, inserted in doc['splices'])
+    return apply_splices(rows, splices) if splices else rows
+
+
+def _utc(value: datetime) -> datetime:
+    # Mongo hands back naive UTC datetimes; query parameters may be naive too
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class SheetHistory:
+    """Delta-compressed versions of each (branch, tab), written in the background"""
+
+    def __init__(
+        self,
+        sheets: SheetsService,
+        checkpoint_every: int = 20,
+        max_delta_ratio: float = 0.5,
+        part_rows: int = 2000,
+        cache_versions: int = 8
+    ):
+        self.sheets = sheets
+        self.checkpoint_every = checkpoint_every
+        self.max_delta_ratio = max_delta_ratio
+        self.part_rows = part_rows
+        self.cache_versions = cache_versions
+        # (branch, tab) -> latest recorded version, its digest, time, checkpoint and rows (if in memory)
+        self._heads: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._pending: Dict[Tuple[str, str], Tuple[Rows, str, float]] = {}
+        self._wake = asyncio.Event()
+        # Recently rebuilt versions: (branch, tab, version) -> rows
+        self._versions: "OrderedDict[Tuple[str, str, int], Rows]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.checkpoint_every > 0
+
+    # ---- recording ----
+
+    def on_sheet_change(self, branch: str, tab: str, rows: Rows):
+        """SheetsService listener: queue the tab's new rows for recording"""
+        if not self.enabled:
+            return
+        digest = self.sheets.tab_digest(branch, tab)
+        fetched_at = self.sheets.tab_fetched_at(branch, tab)
+        if digest is None or fetched_at is None:
+            return
+        self._pending[(branch, tab)] = (rows, digest, fetched_at)
+        self._wake.set()
+
+    async def run(self, db):
+        """Record queued tab changes until cancelled"""
+        if not self.enabled:
+            return
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending:
+                key = next(iter(self._pending))
+                rows, digest, fetched_at = self._pending.pop(key)
+                try:
+                    await self.record(db, key[0], key[1], rows, digest, fetched_at)
+                except Exception as e:
+                    logger.error(f"Sheet history write failed for {key[0]}/{key[1]}: {e}")
+
+    async def _load_head(self, db, branch: str, tab: str) -> Optional[Dict[str, Any]]:
+        latest = await db.sheet_versions.find_one(
+            {'branch': branch, 'tab': tab, 'part': 0},
+            {'_id': 0, 'version': 1, 'digest': 1, 'at': 1, 'kind': 1},
+            sort=[('version', -1)]
+        )
+        if latest is None:
+            return None
+        checkpoint = latest['version']
+        if latest['kind'] != 'checkpoint':
+            doc = await db.sheet_versions.find_one(
+                {'branch': branch, 'tab': tab, 'part': 0, 'kind': 'checkpoint'},
+                {'_id': 0, 'version': 1},
+                sort=[('version', -1)]
+            )
+            checkpoint = doc['version'] if doc else 0
+        return {
+            'version': latest['version'], 'digest': latest['digest'],
+            'at': _utc(latest['at']).timestamp(), 'checkpoint': checkpoint, 'rows': None
+        }
+
+    async def record(self, db, branch: str, tab: str, rows: Rows, digest: str, fetched_at: float) -> Optional[int]:
+        """Store `rows` as the tab's next version; returns the version, or None if nothing was written.
+
+        Rows identical to the latest version (same digest) or fetched no
+        later than it - a disk snapshot loaded at startup, say - are skipped.
+        """
+        key = (branch, tab)
+        head = self._heads.get(key)
+        if head is None:
+            head = await self._load_head(db, branch, tab)
+        if head is not None:
+            if head['digest'] == digest:
+                head['rows'] = rows
+                self._heads[key] = head
+                return None
+            if fetched_at <= head['at']:
+                self._heads[key] = head
+                return None
+
+        version = head['version'] + 1 if head else 1
+        splices = None
+        if head is not None and version - head['checkpoint'] < self.checkpoint_every:
+            previous = head['rows']
+            if previous is None:
+                previous = await self._rebuild(db, branch, tab, head['version'])
+            if previous is not None:
+                splices = await asyncio.to_thread(diff_rows, previous, rows)
+                if sum(len(inserted) for _, _, inserted in splices) > len(rows) * self.max_delta_ratio:
+                    splices = None
+
+        base = {
+            'branch': branch, 'tab': tab, 'version': version, 'digest': digest,
+            'at': datetime.fromtimestamp(fetched_at, timezone.utc), 'row_count': len(rows)
+        }
+        if splices is None:
+            kind = 'checkpoint'
+            chunks = [rows[i:i + self.part_rows] for i in range(0, len(rows), self.part_rows)] or [[]]
+            docs = [{**base, 'kind': kind, 'rows': chunk} for chunk in chunks]
+            written = len(rows)
+        else:
+            kind = 'delta'
+            parts = _split(splices, self.part_rows)
+            docs = [{**base, 'kind': kind, 'splices': [list(s) for s in part]} for part in parts]
+            written = sum(len(inserted) for _, _, inserted in splices)
+        for part, doc in enumerate(docs):
+            doc['part'] = part
+            doc['parts'] = len(docs)
+
+        try:
+            await db.sheet_versions.insert_many(docs)
+        except Exception as e:
+            # Most likely another worker recorded this version first
+            logger.warning(f"Sheet history version {version} of {branch}/{tab} not written: {e}")
+            self._heads.pop(key, None)
+            return None
+
+        SHEET_HISTORY_VERSIONS.inc(kind=kind)
+        SHEET_HISTORY_ROWS.inc(written, kind=kind)
+        self._heads[key] = {
+            'version': version, 'digest': digest, 'at': fetched_at,
+            'checkpoint': version if kind == 'checkpoint' else head['checkpoint'], 'rows': rows
+        }
+        return version
+
+    # ---- point-in-time reads ----
+
+    async def version_at(self, db, branch: str, tab: str, as_of: datetime) -> Optional[int]:
+        """The tab's latest version recorded at or before `as_of` (None if there is none)"""
+        doc = await db.sheet_versions.find_one(
+            {'branch': branch, 'tab': tab, 'part': 0, 'at': {'$lte': _utc(as_of)}},
+            {'_id': 0, 'version': 1, 'at': 1},
+            sort=[('at', -1)]
+        )
+        return doc['version'] if doc else None
+
+    async def rows_as_of(self, db, branch: str, tab: str, as_of: datetime) -> Optional[Rows]:
+        """The tab's rows as they were at `as_of` (None if no version is that old)"""
+        version = await self.version_at(db, branch, tab, as_of)
+        if version is None:
+            return None
+        head = self._heads.get((branch, tab))
+        if head and head['version'] == version and head['rows'] is not None:
+            return head['rows']
+        key = (branch, tab, version)
+        rows = self._versions.get(key)
+        if rows is not None:
+            self._versions.move_to_end(key)
+            return rows
+        rows = await self._rebuild(db, branch, tab, version)
+        if rows is not None and self.cache_versions > 0:
+            self._versions[key] = rows
+            while len(self._versions) > self.cache_versions:
+                self._versions.popitem(last=False)
+        return rows
+
+    async def _rebuild(self, db, branch: str, tab: str, version: int) -> Optional[Rows]:
+        """Rows of a version: its nearest checkpoint with the following deltas applied"""
+        checkpoint = await db.sheet_versions.find_one(
+            {'branch': branch, 'tab': tab, 'part': 0, 'kind': 'checkpoint', 'version': {'$lte': version}},
+            {'_id': 0, 'version': 1},
+            sort=[('version', -1)]
+        )
+        if checkpoint is None:
+            return None
+        docs = await db.sheet_versions.find(
+            {'branch': branch, 'tab': tab, 'version': {'$gte': checkpoint['version'], '$lte': version}},
+            {'_id': 0, 'digest': 0, 'at': 0}
+        ).sort([('version', 1), ('part', 1)]).to_list(None)
+        return await asyncio.to_thread(_replay, docs)
+
+    async def ensure_indexes(self, db):
+        await db.sheet_versions.create_index(
+            [('branch', 1), ('tab', 1), ('version', 1), ('part', 1)], unique=True
+        )
+        await db.sheet_versions.create_index([('branch', 1), ('tab', 1), ('at', 1)])
+
+
+# Global instance
+sheet_history = SheetHistory(
+    sheets_service,
+    checkpoint_every=int(os.environ.get('SHEET_HISTORY_CHECKPOINT_EVERY', 20)),
+    max_delta_ratio=float(os.environ.get('SHEET_HISTORY_MAX_DELTA_RATIO', 0.5)),
+    part_rows=int(os.environ.get('SHEET_HISTORY_PART_ROWS', 2000)),
+    cache_versions=int(os.environ.get('SHEET_HISTORY_CACHE_VERSIONS', 8))
+)
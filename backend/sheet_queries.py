@@ -0,0 +1,180 @@
+"""Row filters and aggregates shared by the /api/sheets endpoints and the batch endpoint.
+
+Each tab has its own rules for which columns hold the date and what a
+search matches against (the Sold tab searches customer, mobile and model;
+the other tabs search the whole record). Date ranges compare day numbers,
+so every sheet's date format filters correctly, and are answered by
+binary search over each cached tab's date index (`tab_dates`, see
+sheet_dates). With `as_of` the rows come from the sheet history instead
+of the cache (see sheet_history). Filtering gives the event loop a
+turn every FILTER_YIELD_ROWS rows so a disconnected client's cancellation
+lands mid-filter.
+"""
+import asyncio
+import logging
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from request_timing import timed_phase
+from sheet_dates import TabDates, date_normalizer
+from sheet_history import sheet_history
+from sheets_service import sheets_service
+
+# Date columns tried in order
+DATE_FIELDS = {
+    'Sold': ('Sales Date', 'Date', 'Enquiry Date', 'Booking Date'),
+    'Enquiry': ('Enquiry Date', 'Date'),
+    'Bookings': ('Booking Date', 'Date'),
+    'Stock': (),
+}
+# Columns a search looks in; tabs not listed search the whole record
+SEARCH_FIELDS = {
+    'Sold': ('Customer Name', 'Mobile No', 'Vehicle Model'),
+}
+EXECUTIVE_FIELDS = ('Executive Name', 'Executive')
+
+logger = logging.getLogger(__name__)
+
+# Day numbers of every cached tab that has date columns
+tab_dates = TabDates(date_normalizer, {tab: fields for tab, fields in DATE_FIELDS.items() if fields})
+
+# Rows filtered between event-loop turns
+FILTER_YIELD_ROWS = int(os.environ.get('FILTER_YIELD_ROWS', 2000))
+
+
+def _first(record: Dict[str, Any], fields: Iterable[str]) -> str:
+    for field in fields:
+        value = record.get(field)
+        if value:
+            return value
+    return ''
+
+
+async def filter_rows(
+    rows: List[Dict[str, Any]],
+    tab: str,
+    search: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    executive: Optional[str] = None,
+    formats: Optional[Dict[str, Optional[str]]] = None
+) -> List[Dict[str, Any]]:
+    """Rows matching the search, date range and executive, checking every row.
+    
+    The range needs both ends and includes them; rows without a readable
+    date pass. Each row's date is read in its column's format - `formats`,
+    or detected from `rows` the way the date index does - through the
+    normalizer's cache, so this and the index agree on every row.
+    """
+    search_lower = search.lower() if search else None
+    search_fields = SEARCH_FIELDS.get(tab)
+    date_fields = DATE_FIELDS.get(tab, ()) if start_date and end_date else ()
+    first_day = date_normalizer.parse(start_date) if date_fields else 0
+    last_day = date_normalizer.parse(end_date) if date_fields else 0
+    if date_fields and not (first_day and last_day):
+        logger.warning(f"Unreadable date range {start_date!r}..{end_date!r}; comparing as text")
+    if date_fields and formats is None:
+        formats = date_normalizer.detect_formats(rows, date_fields)
+
+    filtered = []
+    for i, record in enumerate(rows):
+        if i and not i % FILTER_YIELD_ROWS:
+            await asyncio.sleep(0)
+
+        if search_lower:
+            if search_fields:
+                searchable = ' '.join(str(record.get(field, '')) for field in search_fields).lower()
+            else:
+                searchable = str(record).lower()
+            if search_lower not in searchable:
+                continue
+
+        if date_fields:
+            if first_day and last_day:
+                day = date_normalizer.row_day(record, date_fields, formats)
+                if day and (day < first_day or day > last_day):
+                    continue
+            else:
+                date_value = _first(record, date_fields)
+                if date_value and (date_value < start_date or date_value > end_date):
+                    continue
+
+        if executive and _first(record, EXECUTIVE_FIELDS) != executive:
+            continue
+
+        filtered.append(record)
+    return filtered
+
+
+async def tab_parts(
+    branch: Optional[str], tab: str, as_of: Optional[datetime] = None, db=None
+) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """(branch, rows) for one branch, or for every branch when branch is empty/unknown.
+    
+    Rows are the cached ones, or with `as_of` the version recorded in `db`
+    at that time (no rows for a branch without history that old).
+    """
+    branches = [branch] if branch and branch in sheets_service.BRANCH_SHEETS else list(sheets_service.BRANCH_SHEETS)
+    if as_of is not None:
+        results = await asyncio.gather(*[sheet_history.rows_as_of(db, name, tab, as_of) for name in branches])
+        return [(name, rows or []) for name, rows in zip(branches, results)]
+    results = await asyncio.gather(*[sheets_service.get_tab(name, tab) for name in branches])
+    return list(zip(branches, results))
+
+
+async def query_tab(
+    branch: Optional[str],
+    tab: str,
+    rules: Optional[str] = None,
+    search: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    executive: Optional[str] = None,
+    as_of: Optional[datetime] = None,
+    db=None
+) -> List[Dict[str, Any]]:
+    """Filtered rows of a tab for one branch or all of them.
+    
+    A date range on a tab's own rules is answered from the date index
+    (two binary searches per branch) and only the rows in range are
+    checked against the other filters. `rules` picks the tab whose
+    date/search rules apply (default: `tab`). `as_of` reads the tab as it
+    was at that time from the history in `db`.
+    """
+    rules = rules or tab
+    first_day = last_day = 0
+    if start_date and end_date and rules == tab:
+        first_day, last_day = date_normalizer.parse(start_date), date_normalizer.parse(end_date)
+    
+    filtered = []
+    parts = await tab_parts(branch, tab, as_of, db)
+    with timed_phase("filter"):
+        for name, rows in parts:
+            in_range = tab_dates.select(name, tab, rows, first_day, last_day) if first_day and last_day else None
+            if in_range is not None:
+                filtered.extend(await filter_rows(in_range, rules, search, executive=executive))
+            else:
+                # Formats from the index when it covers these rows under their own rules
+                formats = tab_dates.formats(name, tab, rows) if rules == tab else None
+                filtered.extend(await filter_rows(rows, rules, search, start_date, end_date, executive, formats))
+    return filtered
+
+
+def parse_amount(value: Any) -> float:
+    """Numeric value of a sheet cell like "Rs. 1,250.00" (0 when there is none)"""
+    match = re.search(r'\d+(?:\.\d+)?', str(value or '').replace(',', ''))
+    return float(match.group()) if match else 0.0
+
+
+def aggregate(rows: List[Dict[str, Any]], group_by: Optional[str] = None, sums: Iterable[str] = ()) -> Dict[str, Any]:
+    """Row count, optional column totals and optional counts per value of `group_by`"""
+    result: Dict[str, Any] = {'count': len(rows)}
+    sums = list(sums)
+    if sums:
+        result['sums'] = {field: round(sum(parse_amount(record.get(field)) for record in rows), 2) for field in sums}
+    if group_by:
+        result['groups'] = dict(Counter(record.get(group_by) or '' for record in rows).most_common())
+    return result
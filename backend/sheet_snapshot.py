@@ -0,0 +1,130 @@
+"""Compact on-disk snapshots of parsed sheet data.
+
+Layout of a snapshot file:
+
+    b"DTVSNAP1" | u32 header length | JSON header | dataset blocks...
+
+The header records the format version, when the file was written and, for
+every (branch, tab), the offset/length of its block plus the content digest
+and wall-clock fetch time. Each block is zlib-compressed JSON holding the
+column names once and the rows as value lists, which is several times
+smaller than the row dicts. Readers mmap the file and only decode the blocks
+they ask for.
+"""
+import json
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+MAGIC = b"DTVSNAP1"
+FORMAT_VERSION = 1
+_HEADER_LEN = struct.Struct("<I")
+
+
+def encode_rows(rows: List[Dict[str, Any]]) -> bytes:
+    """Columnar, compressed encoding of one dataset"""
+    columns: List[str] = list(rows[0].keys()) if rows else []
+    encoded = []
+    for row in rows:
+        if list(row.keys()) == columns:
+            encoded.append(list(row.values()))
+        else:
+            # Ragged CSV rows keep their own keys
+            encoded.append({str(k): v for k, v in row.items()})
+    payload = json.dumps({"columns": columns, "rows": encoded}, separators=(",", ":"), ensure_ascii=False)
+    return zlib.compress(payload.encode("utf-8"), 6)
+
+
+def decode_rows(block: bytes) -> List[Dict[str, Any]]:
+    data = json.loads(zlib.decompress(block).decode("utf-8"))
+    columns = data["columns"]
+    return [dict(zip(columns, row)) if isinstance(row, list) else row for row in data["rows"]]
+
+
+def write_snapshot(path: str, datasets: Dict[Tuple[str, str], Dict[str, Any]], written_at: float):
+    """Atomically write {(branch, tab): {"rows", "digest", "fetched_at"}} to `path`"""
+    blocks = []
+    entries = []
+    offset = 0
+    for (branch, tab), dataset in datasets.items():
+        block = encode_rows(dataset["rows"])
+        entries.append({
+            "branch": branch,
+            "tab": tab,
+            "offset": offset,
+            "length": len(block),
+            "digest": dataset["digest"],
+            "fetched_at": dataset["fetched_at"],
+            "rows": len(dataset["rows"])
+        })
+        blocks.append(block)
+        offset += len(block)
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "written_at": written_at,
+        "datasets": entries
+    }, separators=(",", ":")).encode("utf-8")
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(_HEADER_LEN.pack(len(header)))
+            f.write(header)
+            for block in blocks:
+                f.write(block)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class SnapshotReader:
+    """Memory-mapped view of a snapshot file; datasets are decoded on demand"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(MAGIC)] != MAGIC:
+                raise ValueError("not a sheet snapshot")
+            (header_len,) = _HEADER_LEN.unpack_from(self._map, len(MAGIC))
+            start = len(MAGIC) + _HEADER_LEN.size
+            self.header = json.loads(self._map[start:start + header_len].decode("utf-8"))
+            self._data_start = start + header_len
+        except Exception:
+            self.close()
+            raise
+        self.datasets = {(d["branch"], d["tab"]): d for d in self.header["datasets"]}
+
+    @property
+    def format_version(self) -> int:
+        return self.header.get("format", 0)
+
+    def meta(self, branch: str, tab: str) -> Optional[Dict[str, Any]]:
+        return self.datasets.get((branch, tab))
+
+    def rows(self, branch: str, tab: str) -> List[Dict[str, Any]]:
+        meta = self.datasets[(branch, tab)]
+        start = self._data_start + meta["offset"]
+        return decode_rows(self._map[start:start + meta["length"]])
+
+    def close(self):
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from branch_registry import BranchRegistry, branch_registry
+from sheets_service import SheetsService, UpstreamHealth, sheets_service
+
+logger = logging.getLogger(__name__)
+
+
+class SheetSyncScheduler:
+    """Background refresh of every registered tab at its own adaptive interval.
+
+    Each (branch, tab) starts at the registry's refresh_interval. A refresh
+    that finds new data shortens the interval by `step` (down to
+    `min_interval`), an unchanged one lengthens it (up to `max_factor` x the
+    configured interval), so busy branches are polled more often than quiet
+    ones. Due tabs are started highest priority first; downloads queue on
+    SheetsService's fetch semaphore, so dozens of branches don't stampede
+    the upstream. Requests keep getting served from the cache in between.
+    """
+
+    def __init__(
+        self,
+        sheets: SheetsService,
+        registry: BranchRegistry,
+        min_interval: float = 15.0,
+        max_factor: float = 4.0,
+        step: float = 1.5
+    ):
+        self.sheets = sheets
+        self.registry = registry
+        self.min_interval = min_interval
+        self.max_factor = max_factor
+        self.step = step
+        self._tabs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._plan_version: Optional[int] = None
+        self._running: Set[Tuple[str, str]] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def sync_plan(self):
+        """Reconcile scheduled tabs with the current registry version"""
+        now = time.monotonic()
+        registered = self.registry.tabs()
+        for key in list(self._tabs):
+            if key not in registered:
+                del self._tabs[key]
+                self.sheets.forget(*key)
+        for key, settings in registered.items():
+            state = self._tabs.get(key)
+            if state is None or state['gid'] != settings['gid']:
+                # New tab or a different sheet behind it: refresh right away
+                self._tabs[key] = {
+                    'gid': settings['gid'],
+                    'base': settings['refresh_interval'],
+                    'interval': settings['refresh_interval'],
+                    'priority': settings['priority'],
+                    'next_due': now if state is not None or self.sheets.peek_tab(*key) is None else now + settings['refresh_interval'],
+                    'refreshes': 0,
+                    'changes': 0
+                }
+                if state is not None:
+                    self.sheets.forget(*key)
+            elif state['base'] != settings['refresh_interval'] or state['priority'] != settings['priority']:
+                state['base'] = state['interval'] = settings['refresh_interval']
+                state['priority'] = settings['priority']
+                state['next_due'] = min(state['next_due'], now + state['interval'])
+            self._publish_ttl(key)
+        self._plan_version = self.registry.version
+
+    def _publish_ttl(self, key: Tuple[str, str]):
+        # Requests only download themselves once the scheduler has fallen behind
+        self.sheets.set_tab_ttl(*key, self._tabs[key]['interval'] * 1.5)
+
+    def due(self, now: float):
+        """Tabs due for a refresh, highest priority (then most overdue) first"""
+        keys = [key for key, state in self._tabs.items() if state['next_due'] <= now and key not in self._running]
+        return sorted(keys, key=lambda key: (-self._tabs[key]['priority'], self._tabs[key]['next_due']))
+
+    def _adapt(self, key: Tuple[str, str], changed: bool):
+        state = self._tabs[key]
+        if changed:
+            state['interval'] = max(min(self.min_interval, state['base']), state['interval'] / self.step)
+        else:
+            state['interval'] = min(state['base'] * self.max_factor, state['interval'] * self.step)
+        self._publish_ttl(key)
+
+    async def refresh(self, branch: str, tab: str) -> bool:
+        """Refresh one tab now; True if its data changed"""
+        key = (branch, tab)
+        state = self._tabs.get(key)
+        if state is None:
+            return False
+        try:
+            if self.sheets.health.state == UpstreamHealth.DOWN:
+                # The probe owns recovery; don't count an outage as a quiet period
+                return False
+            before = self.sheets.tab_digest(branch, tab)
+            # Another worker's copy younger than half an interval is good enough
+            await self.sheets.get_tab(branch, tab, max_age=state['interval'] / 2)
+            changed = self.sheets.tab_digest(branch, tab) != before
+            if key in self._tabs:
+                state['refreshes'] += 1
+                state['changes'] += int(changed)
+                self._adapt(key, changed)
+            return changed
+        except Exception as e:
+            logger.error(f"Scheduled refresh of {branch}/{tab} failed: {e}")
+            return False
+        finally:
+            state['next_due'] = time.monotonic() + state['interval']
+
+    def _start(self, key: Tuple[str, str]):
+        self._running.add(key)
+        task = asyncio.get_running_loop().create_task(self.refresh(*key))
+        self._tasks.add(task)
+
+        def done(_):
+            self._tasks.discard(task)
+            self._running.discard(key)
+
+        task.add_done_callback(done)
+
+    async def run(self):
+        """Background task: keep every registered tab refreshed on schedule"""
+        try:
+            while True:
+                if self._plan_version != self.registry.version:
+                    self.sync_plan()
+                now = time.monotonic()
+                for key in self.due(now):
+                    self._start(key)
+                upcoming = [s['next_due'] for k, s in self._tabs.items() if k not in self._running]
+                # Wake at least every few seconds to notice registry changes
+                await asyncio.sleep(min(max((min(upcoming) - now) if upcoming else 5.0, 0.1), 5.0))
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            'registry_version': self._plan_version,
+            'tabs': [
+                {
+                    'branch': branch,
+                    'tab': tab,
+                    'priority': state['priority'],
+                    'configured_interval_s': state['base'],
+                    'interval_s': round(state['interval'], 1),
+                    'next_refresh_in_s': round(max(0.0, state['next_due'] - now), 1),
+                    'refreshes': state['refreshes'],
+                    'changes': state['changes']
+                }
+                for (branch, tab), state in sorted(self._tabs.items())
+            ]
+        }
+
+
+# Global instance
+sheet_sync = SheetSyncScheduler(
+    sheets_service,
+    branch_registry,
+    min_interval=float(os.environ.get('SHEETS_SYNC_MIN_INTERVAL', 15)),
+    max_factor=float(os.environ.get('SHEETS_SYNC_MAX_FACTOR', 4))
+)
@@ -1,171 +1,514 @@
 import os
 import csv
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
 import logging
 import io
+import hashlib
+import time
+import asyncio
+from pathlib import Path
+from sheet_snapshot import FORMAT_VERSION, SnapshotReader, write_snapshot
+from shared_cache import SharedSheetCache, default_shared_dir
+from branch_registry import BranchRegistry, branch_registry
+from request_timing import timed_phase
+from request_deadline import FetchAborted, FetchBudget, check_fetch, current_deadline, fetch_timeout, remaining, use_fetch_budget
+from metrics import (
+    SHEET_BYTES, SHEET_CACHE_LOOKUPS, SHEET_DOWNLOAD_SECONDS, SHEET_DOWNLOADED_BYTES, SHEET_FALLBACKS,
+    SHEET_FETCHES_ABANDONED, SHEET_FETCH_ERRORS, SHEET_PARSE_SECONDS, SHEET_ROWS
+)
 
 logger = logging.getLogger(__name__)
 
-class SheetsService:
-    def __init__(self):
-        self.connected = False
-        
-        # Multi-branch Google Sheets configuration with correct Sheet IDs
-        self.BRANCH_SHEETS = {
-            'Bhavani': '1HYtgy4pLdQkCAInxucl3UT08B9afcJwuSrNtCvgDB7g',
-            'Kumarapalayam': '1sVI5CrCVXqT4ZgiEHz-j2LSA-sLHTIE_DcqoRk8UvCM',
-            'Anthiyur': '1MIf_sT6t4F9-2KeKwVylWH4VGKTUNAuxCLB2-COLXkA',
-            'Kavindapadi': '15W3aqY11b5HdB3KGcurs0MYO_h9r3qtQgQIQSKDjzqo',
-            'Ammapettai': '1dsV2gPw1eP-vaWv9fd25D5qJ9z5uXSd_bKLNvxmLp0I'
+# Downloads check between chunks whether anyone still wants them
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+class UpstreamHealth:
+    """Health state machine and circuit breaker for the Google Sheets upstream.
+    
+    healthy -> degraded on the first failed download, degraded -> down after
+    `down_after` consecutive failures. While down the circuit is open: reads
+    are served from cache without touching Google, and a single trial request
+    (half-open) is let through once the probe backoff has elapsed. The backoff
+    doubles after every failed trial up to `max_backoff`; any success closes
+    the circuit and resets it.
+    """
+    HEALTHY = 'healthy'
+    DEGRADED = 'degraded'
+    DOWN = 'down'
+    
+    def __init__(self, down_after: int = 3, base_backoff: float = 5.0, max_backoff: float = 300.0):
+        self.down_after = down_after
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.HEALTHY
+        self.consecutive_failures = 0
+        self.backoff = base_backoff
+        self.next_probe_at = 0.0
+        self.trial_in_flight = False
+    
+    def allow_request(self) -> bool:
+        """Whether a download may go upstream now (claims the half-open trial when down)"""
+        if self.state != self.DOWN:
+            return True
+        if self.trial_in_flight or time.monotonic() < self.next_probe_at:
+            return False
+        self.trial_in_flight = True
+        return True
+    
+    def record_success(self):
+        if self.state != self.HEALTHY:
+            logger.info(f"Google Sheets upstream recovered (was {self.state})")
+        self.state = self.HEALTHY
+        self.consecutive_failures = 0
+        self.backoff = self.base_backoff
+        self.trial_in_flight = False
+    
+    def release_trial(self):
+        """The half-open trial was answered without contacting the upstream"""
+        self.trial_in_flight = False
+    
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.DOWN:
+            # Failed half-open trial: wait longer before the next one
+            self.backoff = min(self.backoff * 2, self.max_backoff)
+        elif self.consecutive_failures >= self.down_after:
+            logger.error(f"Google Sheets upstream down after {self.consecutive_failures} failures")
+            self.state = self.DOWN
+        else:
+            self.state = self.DEGRADED
+        if self.state == self.DOWN:
+            self.next_probe_at = time.monotonic() + self.backoff
+        self.trial_in_flight = False
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'next_probe_in_s': round(max(0.0, self.next_probe_at - time.monotonic()), 1) if self.state == self.DOWN else None
         }
+
+class SheetsService:
+    def __init__(self, registry: Optional[BranchRegistry] = None):
+        self.health = UpstreamHealth(
+            down_after=int(os.environ.get('SHEETS_DOWN_AFTER_FAILURES', 3)),
+            base_backoff=float(os.environ.get('SHEETS_PROBE_BACKOFF', 5)),
+            max_backoff=float(os.environ.get('SHEETS_PROBE_BACKOFF_MAX', 300))
+        )
+        self._probe_task: Optional[asyncio.Task] = None
         
-        # Branch-specific GIDs for each sheet type
-        self.BRANCH_GIDS = {
-            'Bhavani': {
-                'Sold': 0,
-                'Enquiry': 1168200442,
-                'Bookings': 9828158,
-                'Stock': 471760422
-            },
-            'Kumarapalayam': {
-                'Sold': 0,
-                'Enquiry': 1168200442,
-                'Bookings': 9828158,
-                'Stock': 2505719
-            },
-            'Anthiyur': {
-                'Sold': 0,
-                'Enquiry': 1168200442,
-                'Bookings': 9828158,
-                'Stock': 1670776756
-            },
-            'Kavindapadi': {
-                'Sold': 0,
-                'Enquiry': 1168200442,
-                'Bookings': 9828158,
-                'Stock': 522931946
-            },
-            'Ammapettai': {
-                'Sold': 0,
-                'Enquiry': 1168200442,
-                'Bookings': 9828158,
-                'Stock': 674010899
-            }
-        }
+        # Parsed rows per (branch, tab), reused until they are CACHE_TTL seconds old
+        self.CACHE_TTL = int(os.environ.get('SHEETS_CACHE_TTL', 60))
+        self._cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._listeners: List[Callable[[str, str, Optional[List[Dict[str, Any]]]], None]] = []
+        self.data_version = 0
+        # Startup warm-up progress: pending -> probing (-> retrying) -> warming -> ready
+        self.warmup_state = 'pending'
+        
+        # On-disk snapshot of the cache so restarts and new workers start warm ('' disables)
+        self.SNAPSHOT_PATH = os.environ.get(
+            'SHEETS_SNAPSHOT_PATH', str(Path(__file__).parent / 'cache' / 'sheets.snap')
+        )
+        self.SNAPSHOT_WRITE_DELAY = float(os.environ.get('SHEETS_SNAPSHOT_WRITE_DELAY', 5))
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+        # In-flight fetch per tab, shared by every request that needs it (task, budget, waiter count)
+        self._inflight: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        
+        # Cross-worker cache on tmpfs, so N workers cost one download per sheet ('' disables)
+        shared_dir = os.environ.get('SHEETS_SHARED_CACHE_DIR', default_shared_dir())
+        self.shared: Optional[SharedSheetCache] = SharedSheetCache(shared_dir) if shared_dir else None
+        
+        # Overridable so benchmarks can point at a local fake export server
+        self.EXPORT_BASE_URL = os.environ.get('SHEETS_EXPORT_BASE_URL', 'https://docs.google.com').rstrip('/')
+        
+        # Branches, sheet IDs and GIDs come from the (hot-reloadable) branch registry
+        self.registry = registry or branch_registry
+        # Per-tab cache lifetime, set by the sync scheduler from each tab's refresh interval
+        self._tab_ttl: Dict[Tuple[str, str], float] = {}
+        # Bounds concurrent downloads however many branches are registered
+        self._fetch_slots = asyncio.Semaphore(int(os.environ.get('SHEETS_MAX_CONCURRENT_FETCHES', 8)))
+    
+    @property
+    def BRANCH_SHEETS(self) -> Dict[str, str]:
+        return self.registry.sheet_ids
+    
+    @property
+    def BRANCH_GIDS(self) -> Dict[str, Dict[str, int]]:
+        return self.registry.gids
     
     def get_sheet_url(self, sheet_id: str, gid: int = 0) -> str:
         """Generate CSV export URL for a Google Sheet"""
-        return f"https://docs.google.com/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+        return f"{self.EXPORT_BASE_URL}/spreadsheets/d/{sheet_id}/export?format=csv&gid={gid}"
+    
+    @property
+    def connected(self) -> bool:
+        return self.health.state != UpstreamHealth.DOWN
     
     async def connect(self):
-        """Test connection to Google Sheets"""
-        import asyncio
+        """Probe Google Sheets by refreshing the first branch's Sold tab (the result is cached)"""
+        if not self.BRANCH_SHEETS:
+            logger.error("Sheet connection skipped: no branches registered")
+            return False
+        first_branch = next(iter(self.BRANCH_SHEETS))
+        await self.get_tab(first_branch, 'Sold', max_age=0)
+        if self.health.state == UpstreamHealth.HEALTHY:
+            logger.info("✓ Connected to Google Sheets")
+            return True
+        logger.error(f"Sheet connection failed: upstream {self.health.state}")
+        return False
+    
+    def _schedule_probe(self):
+        """While the circuit is open, keep probing in the background with backoff"""
+        if self._probe_task and not self._probe_task.done():
+            return
         
-        def sync_connect():
-            try:
-                import requests
-                # Test connection with first branch
-                first_branch = list(self.BRANCH_SHEETS.values())[0]
-                url = self.get_sheet_url(first_branch, 0)
-                logger.info(f"Testing connection to: {url}")
-                response = requests.get(url, timeout=15, allow_redirects=True)
-                
-                if response.status_code == 200 and len(response.text) > 100:
-                    lines = response.text.strip().split('\n')
-                    if len(lines) > 1:
-                        return True, len(lines) - 1
-                return False, response.status_code
-            except Exception as e:
-                logger.error(f"Exception during connect: {e}")
-                return False, str(e)
+        async def probe_until_up():
+            while self.health.state == UpstreamHealth.DOWN:
+                await asyncio.sleep(max(0.0, self.health.next_probe_at - time.monotonic()))
+                await self.connect()
         
-        result = await asyncio.to_thread(sync_connect)
-        if result[0]:
-            logger.info(f"✓ Connected to Google Sheets: {result[1]} data rows")
-            self.connected = True
-            return True
-        else:
-            logger.error(f"Sheet connection failed: {result[1]}")
-            self.connected = False
-            return False
+        try:
+            self._probe_task = asyncio.get_running_loop().create_task(probe_until_up())
+        except RuntimeError:
+            pass
+    
+    async def warm_up(self):
+        """Background startup task: load the disk snapshot, probe connectivity, then refresh every branch tab"""
+        await self.load_snapshot()
+        self.warmup_state = 'probing'
+        while not await self.connect():
+            self.warmup_state = 'retrying'
+            await asyncio.sleep(max(self.health.next_probe_at - time.monotonic(), self.health.base_backoff))
+        self.warmup_state = 'warming'
+        # Highest priority first: downloads queue on the fetch semaphore in this order
+        tabs = sorted(self.registry.tabs().items(), key=lambda item: -item[1]['priority'])
+        await asyncio.gather(*[self.get_tab(branch, tab) for (branch, tab), _ in tabs])
+        self.warmup_state = 'ready'
+        logger.info(f"✓ Sheet cache warmed: {len(self._cache)} tabs")
+    
+    def _download(self, sheet_id: str, gid: int = 0) -> str:
+        """Download the CSV export of a sheet, raising on failure.
+        
+        Read in chunks so a fetch nobody waits for any more (or past its
+        deadline) stops with FetchAborted instead of running to the end.
+        """
+        import requests
+        url = self.get_sheet_url(sheet_id, gid)
+        check_fetch()
+        with requests.get(url, timeout=fetch_timeout(15), allow_redirects=True, stream=True) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            chunks = []
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                check_fetch()
+                chunks.append(chunk)
+            return b''.join(chunks).decode(response.encoding or 'utf-8', errors='replace')
+    
+    def _parse(self, text: str) -> List[Dict[str, Any]]:
+        reader = csv.DictReader(io.StringIO(text))
+        return [row for row in reader]
     
     async def read_sheet(self, sheet_id: str, gid: int = 0) -> List[Dict[str, Any]]:
         """Read data from a specific sheet"""
-        import asyncio
-        
         def sync_read():
             try:
-                import requests
-                url = self.get_sheet_url(sheet_id, gid)
-                response = requests.get(url, timeout=15, allow_redirects=True)
-                
-                if response.status_code == 200:
-                    reader = csv.DictReader(io.StringIO(response.text))
-                    result = [row for row in reader]
-                    logger.info(f"✓ Read {len(result)} rows from sheet {sheet_id} (gid={gid})")
-                    return result
-                else:
-                    logger.error(f"Failed to read sheet: HTTP {response.status_code}")
-                    return []
+                result = self._parse(self._download(sheet_id, gid))
+                logger.info(f"✓ Read {len(result)} rows from sheet {sheet_id} (gid={gid})")
+                return result
             except Exception as e:
                 logger.error(f"Failed to read sheet: {e}")
                 return []
         
         return await asyncio.to_thread(sync_read)
     
-    async def get_sales_data(self, branch: str = None, data_type: str = 'Sold') -> List[Dict[str, Any]]:
-        """Get sales data - optionally filtered by branch and data type (Sold/Enquiry/Bookings)"""
-        if not self.connected:
-            await self.connect()
+    def add_listener(self, callback: Callable[[str, str, Optional[List[Dict[str, Any]]]], None]):
+        """Register callback(branch, tab, rows), called whenever a tab's data changes (rows=None once it is forgotten)"""
+        self._listeners.append(callback)
+    
+    @property
+    def cached_tabs(self) -> int:
+        return len(self._cache)
+    
+    def peek_tab(self, branch: str, tab: str) -> Optional[List[Dict[str, Any]]]:
+        """Cached rows for a tab without triggering a download (None if never loaded)"""
+        entry = self._cache.get((branch, tab))
+        return entry['rows'] if entry else None
+    
+    def tab_digest(self, branch: str, tab: str) -> Optional[str]:
+        entry = self._cache.get((branch, tab))
+        return entry['digest'] if entry else None
+    
+    def tab_fetched_at(self, branch: str, tab: str) -> Optional[float]:
+        """Unix time the cached rows were downloaded (None if never loaded)"""
+        entry = self._cache.get((branch, tab))
+        return self._wall_time(entry['fetched_at']) if entry else None
+    
+    def tab_ttl(self, branch: str, tab: str) -> float:
+        return self._tab_ttl.get((branch, tab), self.CACHE_TTL)
+    
+    def set_tab_ttl(self, branch: str, tab: str, ttl: Optional[float]):
+        if ttl is None:
+            self._tab_ttl.pop((branch, tab), None)
+        else:
+            self._tab_ttl[(branch, tab)] = ttl
+    
+    def forget(self, branch: str, tab: str):
+        """Drop a tab that is no longer registered, along with everything listeners derived from it"""
+        self._tab_ttl.pop((branch, tab), None)
+        if self._cache.pop((branch, tab), None) is not None:
+            self.data_version += 1
+            self._notify(branch, tab, None)
+    
+    def prune(self, registry: BranchRegistry):
+        """Registry listener: forget cached tabs of removed or disabled branches"""
+        registered = registry.tabs()
+        for key in [key for key in self._cache if key not in registered]:
+            self.forget(*key)
+    
+    async def get_tab(self, branch: str, tab: str, max_age: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Rows of one branch tab, served from cache while fresh (or while the upstream is down)"""
+        entry = self._cache.get((branch, tab))
+        forced = max_age is not None
+        max_age = self.tab_ttl(branch, tab) if max_age is None else max_age
+        if entry and time.monotonic() - entry['fetched_at'] < max_age:
+            SHEET_CACHE_LOOKUPS.inc(result='hit')
+            return entry['rows']
+        if entry and entry['from_snapshot'] and not forced:
+            # Restored from disk: answer now, refresh behind the request
+            SHEET_CACHE_LOOKUPS.inc(result='stale')
+            SHEET_FALLBACKS.inc(branch=branch, tab=tab, reason='stale_snapshot')
+            self._refresh_in_background(branch, tab)
+            return entry['rows']
+        SHEET_CACHE_LOOKUPS.inc(result='miss')
         
-        all_data = []
+        known_digest = entry['digest'] if entry else None
+        if not self.health.allow_request():
+            # Circuit open: fail fast with the last good copy instead of adding upstream load
+            if self.shared:
+                data = await asyncio.to_thread(self.shared.read, branch, tab, known_digest)
+                if data and (not entry or data['fetched_at'] > self._wall_time(entry['fetched_at'])):
+                    SHEET_FALLBACKS.inc(branch=branch, tab=tab, reason='shared_copy')
+                    return self._apply(branch, tab, entry, data)
+            SHEET_FALLBACKS.inc(branch=branch, tab=tab, reason='circuit_open')
+            return entry['rows'] if entry else []
         
-        if branch and branch in self.BRANCH_SHEETS:
-            # Get data from specific branch
-            sheet_id = self.BRANCH_SHEETS[branch]
-            gid = self.BRANCH_GIDS.get(branch, {}).get(data_type, 0)
-            data = await self.read_sheet(sheet_id, gid)
-            # Add branch name to each record for reference
-            for record in data:
-                record['Branch'] = branch
-            all_data.extend(data)
+        return await self._join_fetch(branch, tab, max_age, entry)
+    
+    async def _join_fetch(self, branch: str, tab: str, max_age: float, entry: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Wait for the tab's in-flight fetch (starting one if needed) within the request's deadline.
+        
+        Concurrent readers of a tab share one fetch. A reader that is
+        cancelled (its client disconnected) or runs out of time only detaches:
+        the fetch keeps going for the others, and is cancelled when nobody is
+        left waiting on it. A reader out of time gets the last good copy.
+        """
+        key = (branch, tab)
+        deadline = current_deadline()
+        flight = self._inflight.get(key)
+        if flight is None:
+            budget = FetchBudget(deadline)
+            task = asyncio.get_running_loop().create_task(self._fetch(branch, tab, max_age, entry, budget))
+            flight = self._inflight[key] = {'task': task, 'budget': budget, 'waiters': 0}
+            task.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is flight else None)
         else:
-            # Get data from all branches
-            for branch_name, sheet_id in self.BRANCH_SHEETS.items():
-                gid = self.BRANCH_GIDS.get(branch_name, {}).get(data_type, 0)
-                data = await self.read_sheet(sheet_id, gid)
-                for record in data:
-                    record['Branch'] = branch_name
-                all_data.extend(data)
+            flight['budget'].extend(deadline)
         
-        return all_data
+        flight['waiters'] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight['task']), remaining(deadline))
+        except asyncio.TimeoutError:
+            SHEET_FALLBACKS.inc(branch=branch, tab=tab, reason='deadline')
+            logger.warning(f"Deadline passed waiting for {branch}/{tab}; serving the cached copy")
+            return entry['rows'] if entry else []
+        finally:
+            flight['waiters'] -= 1
+            if flight['waiters'] == 0 and not flight['task'].done():
+                SHEET_FETCHES_ABANDONED.inc(branch=branch, tab=tab)
+                flight['budget'].cancel()
+                flight['task'].cancel()
     
-    async def get_stock_data(self, branch: str = None) -> List[Dict[str, Any]]:
-        """Get inventory/stock data - optionally filtered by branch"""
-        if not self.connected:
-            await self.connect()
+    async def _fetch(self, branch: str, tab: str, max_age: float, entry: Optional[Dict[str, Any]], budget: FetchBudget) -> List[Dict[str, Any]]:
+        """Download (or take from the shared cache), parse and install one tab"""
+        use_fetch_budget(budget)
+        known_digest = entry['digest'] if entry else None
+        sheet_id = self.BRANCH_SHEETS[branch]
+        gid = self.BRANCH_GIDS.get(branch, {}).get(tab, 0)
         
-        all_data = []
+        def download():
+            with SHEET_DOWNLOAD_SECONDS.time(branch=branch, tab=tab), timed_phase('sheets'):
+                text = self._download(sheet_id, gid)
+            size = len(text.encode('utf-8'))
+            SHEET_BYTES.set(size, branch=branch, tab=tab)
+            SHEET_DOWNLOADED_BYTES.inc(size, branch=branch, tab=tab)
+            return text
         
-        if branch and branch in self.BRANCH_SHEETS:
-            sheet_id = self.BRANCH_SHEETS[branch]
-            gid = self.BRANCH_GIDS.get(branch, {}).get('Stock', 0)
-            logger.info(f"Fetching stock data for {branch}: sheet_id={sheet_id}, gid={gid}")
-            data = await self.read_sheet(sheet_id, gid)
-            for record in data:
-                record['Branch'] = branch
-            all_data.extend(data)
+        def parse(text):
+            with SHEET_PARSE_SECONDS.time(branch=branch, tab=tab), timed_phase('parse'):
+                rows = self._parse(text)
+            SHEET_ROWS.set(len(rows), branch=branch, tab=tab)
+            return rows
+        
+        def sync_fetch():
+            if self.shared:
+                # Single-flight across workers: only the lock holder downloads
+                return self.shared.fetch(branch, tab, max_age, download, parse, known_digest)
+            text = download()
+            data = {
+                'digest': hashlib.sha1(text.encode('utf-8')).hexdigest(),
+                'fetched_at': time.time(),
+                'rows': parse(text)
+            }
+            return data, True
+        
+        try:
+            async with self._fetch_slots:
+                budget.check()
+                data, downloaded = await asyncio.to_thread(sync_fetch)
+        except asyncio.CancelledError:
+            # Abandoned by every reader: not an upstream failure
+            self.health.release_trial()
+            raise
+        except FetchAborted as e:
+            logger.info(f"Stopped fetching {branch}/{tab}: {e}")
+            self.health.release_trial()
+            return entry['rows'] if entry else []
+        except Exception as e:
+            logger.error(f"Failed to read {branch}/{tab}: {e}")
+            SHEET_FETCH_ERRORS.inc(branch=branch, tab=tab)
+            SHEET_FALLBACKS.inc(branch=branch, tab=tab, reason='fetch_error')
+            self.health.record_failure()
+            if self.health.state == UpstreamHealth.DOWN:
+                self._schedule_probe()
+            # Keep serving the last good copy rather than an empty tab
+            return entry['rows'] if entry else []
+        
+        if downloaded:
+            self.health.record_success()
+            logger.info(f"✓ Read {len(data['rows'])} rows from {branch}/{tab} (gid={gid})")
         else:
-            for branch_name, sheet_id in self.BRANCH_SHEETS.items():
-                gid = self.BRANCH_GIDS.get(branch_name, {}).get('Stock', 0)
-                logger.info(f"Fetching stock data for {branch_name}: sheet_id={sheet_id}, gid={gid}")
-                data = await self.read_sheet(sheet_id, gid)
-                for record in data:
-                    record['Branch'] = branch_name
-                all_data.extend(data)
+            self.health.release_trial()
+        return self._apply(branch, tab, entry, data)
+    
+    @staticmethod
+    def _wall_time(monotonic_at: float) -> float:
+        return time.time() - (time.monotonic() - monotonic_at)
+    
+    def _apply(self, branch: str, tab: str, entry: Optional[Dict[str, Any]], data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Install freshly fetched (or shared) data, skipping the work when the content is unchanged"""
+        fetched_at = time.monotonic() - (time.time() - data['fetched_at'])
+        if entry and entry['digest'] == data['digest']:
+            entry['fetched_at'] = fetched_at
+            entry['from_snapshot'] = False
+            return entry['rows']
         
+        self._store(branch, tab, data['rows'], data['digest'], fetched_at)
+        self._schedule_snapshot_write()
+        return data['rows']
+    
+    def _store(self, branch: str, tab: str, rows: List[Dict[str, Any]], digest: str, fetched_at: float, from_snapshot: bool = False):
+        """Install new rows for a tab and notify listeners"""
+        for record in rows:
+            record['Branch'] = branch
+        self._cache[(branch, tab)] = {
+            'rows': rows, 'digest': digest, 'fetched_at': fetched_at, 'from_snapshot': from_snapshot
+        }
+        self.data_version += 1
+        self._notify(branch, tab, rows)
+    
+    def _notify(self, branch: str, tab: str, rows: Optional[List[Dict[str, Any]]]):
+        for callback in self._listeners:
+            try:
+                callback(branch, tab, rows)
+            except Exception as e:
+                logger.error(f"Sheet change listener failed for {branch}/{tab}: {e}")
+    
+    def _refresh_in_background(self, branch: str, tab: str):
+        key = (branch, tab)
+        if key in self._refreshing:
+            return
+        task = asyncio.get_running_loop().create_task(self.get_tab(branch, tab, max_age=0))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+    
+    # ---- disk snapshot ----
+    
+    def _read_snapshot(self) -> List[Tuple[str, str, List[Dict[str, Any]], str, float]]:
+        with SnapshotReader(self.SNAPSHOT_PATH) as reader:
+            if reader.format_version != FORMAT_VERSION:
+                logger.info(f"Ignoring sheet snapshot with format {reader.format_version}")
+                return []
+            return [
+                (branch, tab, reader.rows(branch, tab), meta['digest'], meta['fetched_at'])
+                for (branch, tab), meta in reader.datasets.items()
+                if branch in self.BRANCH_SHEETS
+            ]
+    
+    async def load_snapshot(self) -> int:
+        """Seed the cache from the on-disk snapshot; stale tabs are refreshed in the background"""
+        if not self.SNAPSHOT_PATH or not os.path.exists(self.SNAPSHOT_PATH):
+            return 0
+        try:
+            datasets = await asyncio.to_thread(self._read_snapshot)
+        except Exception as e:
+            logger.error(f"Failed to load sheet snapshot: {e}")
+            return 0
+        
+        now_wall, now_mono = time.time(), time.monotonic()
+        for branch, tab, rows, digest, fetched_wall in datasets:
+            if (branch, tab) not in self._cache:
+                # Wall-clock fetch time -> this process's monotonic clock, so TTLs carry over
+                self._store(branch, tab, rows, digest, now_mono - (now_wall - fetched_wall), from_snapshot=True)
+        logger.info(f"✓ Loaded {len(datasets)} tabs from sheet snapshot {self.SNAPSHOT_PATH}")
+        return len(datasets)
+    
+    def save_snapshot(self):
+        now_wall, now_mono = time.time(), time.monotonic()
+        datasets = {
+            key: {
+                'rows': entry['rows'],
+                'digest': entry['digest'],
+                'fetched_at': now_wall - (now_mono - entry['fetched_at'])
+            }
+            for key, entry in list(self._cache.items())
+        }
+        write_snapshot(self.SNAPSHOT_PATH, datasets, now_wall)
+    
+    def _schedule_snapshot_write(self):
+        """Debounced snapshot write after data changes"""
+        if not self.SNAPSHOT_PATH or (self._snapshot_task and not self._snapshot_task.done()):
+            return
+        
+        async def write_later():
+            await asyncio.sleep(self.SNAPSHOT_WRITE_DELAY)
+            try:
+                await asyncio.to_thread(self.save_snapshot)
+            except Exception as e:
+                logger.error(f"Failed to write sheet snapshot: {e}")
+        
+        self._snapshot_task = asyncio.get_running_loop().create_task(write_later())
+    
+    async def _get_tab_for_branches(self, branch: Optional[str], tab: str) -> List[Dict[str, Any]]:
+        """One branch's tab, or the tab from every branch when branch is empty/unknown"""
+        if branch and branch in self.BRANCH_SHEETS:
+            return list(await self.get_tab(branch, tab))
+        
+        results = await asyncio.gather(*[
+            self.get_tab(branch_name, tab) for branch_name in self.BRANCH_SHEETS
+        ])
+        all_data = []
+        for data in results:
+            all_data.extend(data)
         return all_data
     
+    async def get_sales_data(self, branch: str = None, data_type: str = 'Sold') -> List[Dict[str, Any]]:
+        """Get sales data - optionally filtered by branch and data type (Sold/Enquiry/Bookings)"""
+        return await self._get_tab_for_branches(branch, data_type)
+    
+    async def get_stock_data(self, branch: str = None) -> List[Dict[str, Any]]:
+        """Get inventory/stock data - optionally filtered by branch"""
+        return await self._get_tab_for_branches(branch, 'Stock')
+    
     async def get_enquiry_data(self, branch: str = None) -> List[Dict[str, Any]]:
         """Get enquiry data - optionally filtered by branch"""
         return await self.get_sales_data(branch, 'Enquiry')
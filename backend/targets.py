@@ -0,0 +1,247 @@
+import calendar
+import logging
+import os
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from change_queue import ChangeQueue
+from funnel import DATE_FIELDS, EXECUTIVE_FIELDS
+from sheet_dates import NO_DATE, date_normalizer
+
+logger = logging.getLogger(__name__)
+
+# Sheet tab -> target metric (Target.<metric>_target)
+TAB_METRICS = {'Enquiry': 'enquiry', 'Bookings': 'booking', 'Sold': 'sales'}
+METRICS = ('enquiry', 'booking', 'sales')
+
+Scope = Tuple[str, Optional[str], Optional[str]]  # (month, branch, executive)
+
+
+def _executive(record: Dict[str, Any]) -> str:
+    for field in EXECUTIVE_FIELDS:
+        value = record.get(field)
+        if value:
+            return str(value).strip()
+    return ''
+
+
+def _month(record: Dict[str, Any], tab: str, formats: Dict[str, Optional[str]]) -> Optional[str]:
+    """YYYY-MM of the row's date, read in its column's detected format"""
+    day = date_normalizer.row_day(record, DATE_FIELDS[tab], formats)
+    return date.fromordinal(day).strftime('%Y-%m') if day != NO_DATE else None
+
+
+def month_days(month: str, today: date) -> Tuple[int, int]:
+    """(days elapsed, days in month) - a past month is fully elapsed, a future one not at all"""
+    year, number = int(month[:4]), int(month[5:7])
+    total = calendar.monthrange(year, number)[1]
+    current = (today.year, today.month)
+    if (year, number) < current:
+        return total, total
+    if (year, number) > current:
+        return 0, total
+    return today.day, total
+
+
+class TargetTracker:
+    """Monthly enquiry/booking/sales counters and the targets they are measured against.
+
+    Counters are keyed by (month, branch, executive, metric), with None for
+    "all branches" / "whole branch", and are adjusted by the difference
+    whenever SheetsService reports a changed tab. Progress for a month only
+    touches the people active that month and is memoized until the next
+    sheet or target change, so a leaderboard costs the same however much
+    history the sheets hold. Rows are counted in a worker thread; stored
+    targets are re-read from Mongo once they are `reload_interval` seconds
+    old, so edits made on other workers show up.
+    """
+
+    def __init__(self, reload_interval: float = 30.0):
+        self.reload_interval = reload_interval
+        self.version = 0
+        self._tab_counts: Dict[Tuple[str, str], Counter] = {}
+        self._actuals: Counter = Counter()
+        self._members: Dict[str, Counter] = {}
+        self._targets: Dict[str, Dict[str, Any]] = {}
+        self._by_scope: Dict[Scope, Dict[str, Any]] = {}
+        self._progress: Dict[Tuple[str, date], Dict[str, Any]] = {}
+        self._leaderboards: Dict[Tuple[str, date, str], List[Dict[str, Any]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._writes = 0
+        self._changes = ChangeQueue('Target tracker', self._count, self._apply_counts)
+
+    # ---- incremental updates ----
+
+    def on_sheet_change(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """SheetsService listener: count the tab's rows off the event loop, then apply the difference"""
+        if tab in TAB_METRICS:
+            self._changes.push(branch, tab, rows)
+
+    def apply(self, branch: str, tab: str, rows: List[Dict[str, Any]]):
+        """Count the tab's rows and apply the difference inline"""
+        if tab in TAB_METRICS:
+            self._changes.apply(branch, tab, rows)
+
+    async def settled(self):
+        """Wait for queued sheet changes to be counted"""
+        await self._changes.settled()
+
+    def _count(self, branch: str, tab: str, rows: Optional[List[Dict[str, Any]]]) -> Optional[Counter]:
+        if rows is None:
+            return None
+        counts = Counter()
+        formats = date_normalizer.detect_formats(rows, DATE_FIELDS[tab])
+        for row in rows:
+            month = _month(row, tab, formats)
+            if month:
+                counts[(month, _executive(row))] += 1
+        return counts
+
+    def _apply_counts(self, branch: str, tab: str, counts: Optional[Counter]):
+        metric = TAB_METRICS[tab]
+        old = self._tab_counts.get((branch, tab), Counter())
+        delta = Counter(counts or {})
+        delta.subtract(old)
+        for (month, executive), change in delta.items():
+            if change:
+                self._add(month, branch, executive, metric, change)
+        if counts is None:
+            self._tab_counts.pop((branch, tab), None)
+        else:
+            self._tab_counts[(branch, tab)] = counts
+        self._invalidate()
+
+    def _add(self, month: str, branch: str, executive: str, metric: str, change: int):
+        for scope_branch in (branch, None):
+            self._actuals[(month, scope_branch, None, metric)] += change
+            if executive:
+                self._actuals[(month, scope_branch, executive, metric)] += change
+
+        members = self._members.setdefault(month, Counter())
+        members[(branch, executive)] += change
+        if members[(branch, executive)] <= 0:
+            del members[(branch, executive)]
+
+    def _invalidate(self):
+        self.version += 1
+        self._progress.clear()
+        self._leaderboards.clear()
+
+    # ---- targets ----
+
+    async def ensure_loaded(self, db):
+        """Load stored targets, again once the copy is older than `reload_interval`; local CRUD keeps it in step meanwhile"""
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < self.reload_interval:
+            return
+        writes = self._writes
+        try:
+            targets = await db.targets.find({}, {"_id": 0}).to_list(None)
+        except Exception as e:
+            logger.error(f"Failed to load targets: {e}")
+            return
+        # A local put/remove during the read is newer than what was read
+        if writes != self._writes:
+            return
+        self._loaded_at = time.monotonic()
+        loaded = {target['id']: target for target in targets}
+        if loaded != self._targets:
+            self._targets = loaded
+            self._by_scope = {self.scope(target): target for target in targets}
+            self._invalidate()
+
+    @staticmethod
+    def scope(target: Dict[str, Any]) -> Scope:
+        return (target['month'], target.get('branch_id') or None, target.get('executive_id') or None)
+
+    def find(self, month: str, branch: Optional[str], executive: Optional[str]) -> Optional[Dict[str, Any]]:
+        return self._by_scope.get((month, branch, executive))
+
+    def put(self, target: Dict[str, Any]):
+        self._writes += 1
+        self.remove(target['id'])
+        self._targets[target['id']] = target
+        self._by_scope[self.scope(target)] = target
+        self._invalidate()
+
+    def remove(self, target_id: str):
+        self._writes += 1
+        target = self._targets.pop(target_id, None)
+        if target:
+            self._by_scope.pop(self.scope(target), None)
+            self._invalidate()
+
+    def targets(self, month: Optional[str] = None, branch: Optional[str] = None) -> List[Dict[str, Any]]:
+        targets = [
+            t for t in self._targets.values()
+            if (not month or t['month'] == month) and (not branch or t.get('branch_id') == branch)
+        ]
+        return sorted(targets, key=lambda t: (t['month'], t.get('branch_id') or '', t.get('executive_id') or ''))
+
+    # ---- progress ----
+
+    def _entry(self, month: str, branch: Optional[str], executive: Optional[str], elapsed: int, total: int) -> Dict[str, Any]:
+        target = self.find(month, branch, executive)
+        entry: Dict[str, Any] = {'branch': branch, 'executive': executive, 'target_id': target['id'] if target else None}
+        for metric in METRICS:
+            actual = self._actuals.get((month, branch, executive, metric), 0)
+            goal = target.get(f'{metric}_target') if target else None
+            projected = round(actual / elapsed * total) if elapsed else 0
+            entry[metric] = {
+                'actual': actual,
+                'target': goal,
+                'achieved_pct': round(actual / goal * 100, 1) if goal else None,
+                'projected': projected,
+                'projected_pct': round(projected / goal * 100, 1) if goal else None
+            }
+        return entry
+
+    def progress(self, month: str, today: Optional[date] = None) -> Dict[str, Any]:
+        """Month-to-date actual vs target with a run-rate projection for the company, every branch and executive"""
+        today = today or datetime.now(timezone.utc).date()
+        key = (month, today)
+        if key not in self._progress:
+            elapsed, total = month_days(month, today)
+            members = self._members.get(month, Counter())
+            scoped = [s for s in self._by_scope if s[0] == month]
+
+            branches = {b for b, _ in members} | {b for _, b, e in scoped if b and not e}
+            # An executive with an all-branch target is reported once, summed over branches
+            cross_branch = {e for _, b, e in scoped if e and not b}
+            executives = {(b, e) for b, e in members if e and e not in cross_branch}
+            executives |= {(b, e) for _, b, e in scoped if e}
+
+            self._progress[key] = {
+                'month': month,
+                'days_elapsed': elapsed,
+                'days_in_month': total,
+                'company': self._entry(month, None, None, elapsed, total),
+                'branches': [self._entry(month, b, None, elapsed, total) for b in sorted(branches)],
+                'executives': [
+                    self._entry(month, b, e, elapsed, total)
+                    for b, e in sorted(executives, key=lambda item: (item[0] or '', item[1]))
+                ],
+                'version': self.version
+            }
+        return self._progress[key]
+
+    def leaderboard(self, month: str, metric: str = 'sales', today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """Executives ranked by target achievement, then by volume"""
+        today = today or datetime.now(timezone.utc).date()
+        key = (month, today, metric)
+        if key not in self._leaderboards:
+            progress = self.progress(month, today)
+            ranked = sorted(
+                progress['executives'],
+                key=lambda e: (e[metric]['achieved_pct'] is None, -(e[metric]['achieved_pct'] or 0), -e[metric]['actual'], e['executive'])
+            )
+            self._leaderboards[key] = [
+                {'rank': rank, 'branch': e['branch'], 'executive': e['executive'], **e[metric]}
+                for rank, e in enumerate(ranked, start=1)
+            ]
+        return self._leaderboards[key]
+
+
+# Global instance
+target_tracker = TargetTracker(reload_interval=float(os.environ.get('TARGETS_RELOAD_SECONDS', 30)))
@@ -0,0 +1,80 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "dharani_test")
+# Tests that want the disk snapshot or shared cache point SheetsService at a tmp_path
+os.environ.setdefault("SHEETS_SNAPSHOT_PATH", "")
+os.environ.setdefault("SHEETS_SHARED_CACHE_DIR", "")
+# Export tests point the analytics export at a tmp_path
+os.environ.setdefault("ANALYTICS_EXPORT_DIR", "")
+os.environ.setdefault("JWT_SECRET", "test-jwt-secret-at-least-32-bytes-long")
+
+from tests.fakes import FakeChatBackend, FakeDB  # noqa: E402
+
+TEST_SESSION_TOKEN = "test_session_token"
+TEST_USER = {
+    "user_id": "user_test",
+    "email": "tester@example.com",
+    "name": "Test User",
+    "role": "admin"
+}
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    import ai_service
+    import server
+
+    ai_service.chat_sessions.invalidate()
+    db = FakeDB()
+    db.users.docs.append(dict(TEST_USER))
+    db.user_sessions.docs.append({
+        "user_id": TEST_USER["user_id"],
+        "session_token": TEST_SESSION_TOKEN,
+        "expires_at": (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()
+    })
+    monkeypatch.setattr(server, "db", db)
+    # Every test starts with full rate-limit buckets and free concurrency slots
+    monkeypatch.setattr(server.admission, "_buckets", {})
+    monkeypatch.setattr(server.admission, "_slots", {})
+    return db
+
+
+@pytest.fixture
+async def api_client(fake_db):
+    import httpx
+    import server
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://testserver",
+        headers={"Authorization": f"Bearer {TEST_SESSION_TOKEN}"}
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+def fake_llm(fake_db):
+    import ai_service
+
+    ai_service.register_backend("fake", FakeChatBackend)
+    fake_db.app_settings.docs.append({
+        "setting_id": "global",
+        "ai_api_key": "fake-key",
+        "ai_provider": "fake",
+        "ai_model": "fake-1"
+    })
+    yield FakeChatBackend
+    ai_service.unregister_backend("fake")
@@ -0,0 +1,221 @@
+"""In-memory stand-ins for external services used by the backend tests"""
+import asyncio
+import copy
+import itertools
+from typing import Any, Dict, List, Optional
+
+import ai_service
+
+_ids = itertools.count(1)
+
+
+def _get(doc: Dict[str, Any], key: str):
+    value = doc
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _matches(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$lt" and not (value is not None and value < arg):
+                    return False
+                if op == "$lte" and not (value is not None and value <= arg):
+                    return False
+                if op == "$gt" and not (value is not None and value > arg):
+                    return False
+                if op == "$gte" and not (value is not None and value >= arg):
+                    return False
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$exists" and (value is not None) != arg:
+                    return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    if projection.get("_id") == 0:
+        doc.pop("_id", None)
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if included:
+        return {k: v for k, v in doc.items() if k in included or (k == "_id" and projection.get("_id") != 0)}
+    return {k: v for k, v in doc.items() if projection.get(k, 1)}
+
+
+def _apply_update(doc: Dict[str, Any], update: Dict[str, Any], inserting: bool = False):
+    for op, fields in update.items():
+        for key, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                doc[key] = copy.deepcopy(value)
+            elif op == "$inc":
+                doc[key] = doc.get(key, 0) + value
+            elif op == "$addToSet":
+                items = doc.setdefault(key, [])
+                if value not in items:
+                    items.append(value)
+            elif op == "$pull":
+                doc[key] = [item for item in doc.get(key, []) if item != value]
+            elif op == "$unset":
+                doc.pop(key, None)
+
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = docs
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda d: (_get(d, field) is None, _get(d, field)), reverse=order < 0)
+        return self
+
+    def skip(self, count: int):
+        self.docs = self.docs[count:]
+        return self
+
+    def limit(self, count: int):
+        if count:
+            self.docs = self.docs[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self.docs[:length] if length else list(self.docs)
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeResult:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs: List[Dict[str, Any]] = []
+        self.indexes: List[Any] = []
+
+    async def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+        return str(keys)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        docs = self.find(query or {}, projection)
+        if sort:
+            docs.sort(sort)
+        return docs.docs[0] if docs.docs else None
+
+    def find(self, query=None, projection=None):
+        return FakeCursor([_project(d, projection) for d in self.docs if _matches(d, query or {})])
+
+    async def count_documents(self, query=None):
+        return len([d for d in self.docs if _matches(d, query or {})])
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", next(_ids))
+        self.docs.append(copy.deepcopy(doc))
+        return FakeResult(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs):
+        for doc in docs:
+            await self.insert_one(doc)
+        return FakeResult(inserted_ids=[d["_id"] for d in docs])
+
+    async def update_one(self, query, update, upsert=False):
+        for doc in self.docs:
+            if _matches(doc, query):
+                _apply_update(doc, update)
+                return FakeResult(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$")}
+            _apply_update(doc, update, inserting=True)
+            await self.insert_one(doc)
+            return FakeResult(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return FakeResult(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update):
+        count = 0
+        for doc in self.docs:
+            if _matches(doc, query):
+                _apply_update(doc, update)
+                count += 1
+        return FakeResult(matched_count=count, modified_count=count)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=False):
+        for doc in self.docs:
+            if _matches(doc, query):
+                before = _project(doc, projection)
+                _apply_update(doc, update)
+                return _project(doc, projection) if return_document else before
+        if upsert:
+            doc = {k: v for k, v in query.items() if not k.startswith("$")}
+            _apply_update(doc, update, inserting=True)
+            await self.insert_one(doc)
+            return _project(doc, projection) if return_document else None
+        return None
+
+    async def delete_one(self, query):
+        for i, doc in enumerate(self.docs):
+            if _matches(doc, query):
+                del self.docs[i]
+                return FakeResult(deleted_count=1)
+        return FakeResult(deleted_count=0)
+
+    async def delete_many(self, query):
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not _matches(d, query)]
+        return FakeResult(deleted_count=before - len(self.docs))
+
+
+class FakeDB:
+    """Minimal async Mongo stand-in covering the calls made by server.py"""
+
+    def __init__(self):
+        self.collections: Dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self.collections.setdefault(name, FakeCollection())
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return getattr(self, name)
+
+
+class FakeChatBackend(ai_service.ChatBackend):
+    """Local fake LLM provider that streams a canned answer word by word"""
+
+    reply = "Bhavani leads with 42 sales this month."
+    delay = 0.01
+
+    async def send(self, text):
+        await asyncio.sleep(self.delay * 5)
+        return self.reply
+
+    async def stream(self, text):
+        for i, word in enumerate(self.reply.split(" ")):
+            await asyncio.sleep(self.delay)
+            yield word if i == 0 else f" {word}"
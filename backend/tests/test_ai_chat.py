@@ -0,0 +1,346 @@
+import asyncio
+import json
+
+import pytest
+
+import ai_service
+from tests.fakes import FakeChatBackend
+
+pytestmark = pytest.mark.anyio
+
+
+def parse_sse(body: str):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def test_chat_returns_full_response(api_client, fake_llm, fake_db):
+    res = await api_client.post("/api/ai/chat", json={"message": "Who is top?"})
+
+    assert res.status_code == 200
+    assert res.json()["response"] == FakeChatBackend.reply
+    saved = fake_db.chat_history.docs[0]
+    assert saved["ai_response"] == FakeChatBackend.reply
+    assert saved["latency_ms"] > 0
+
+
+async def test_chat_stream_forwards_tokens(api_client, fake_llm, fake_db):
+    res = await api_client.post("/api/ai/chat/stream", json={"message": "Who is top?", "session_id": "s1"})
+
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(res.text)
+    assert events[0] == ("session", {"session_id": "s1"})
+    tokens = [data["text"] for name, data in events if name == "token"]
+    assert len(tokens) == len(FakeChatBackend.reply.split(" "))
+    assert "".join(tokens) == FakeChatBackend.reply
+
+    name, done = events[-1]
+    assert name == "done"
+    assert 0 < done["ttft_ms"] <= done["latency_ms"]
+
+    saved = fake_db.chat_history.docs[0]
+    assert saved["session_id"] == "s1"
+    assert saved["ai_response"] == FakeChatBackend.reply
+    assert saved["ttft_ms"] == done["ttft_ms"]
+
+
+async def test_chat_stream_first_token_before_completion(api_client, fake_llm):
+    received = []
+    async with api_client.stream("POST", "/api/ai/chat/stream", json={"message": "hi"}) as res:
+        async for line in res.aiter_lines():
+            if line.startswith("event: "):
+                received.append(line[len("event: "):])
+                if received[-1] == "token":
+                    # The first token arrives while the rest is still being generated
+                    assert "done" not in received
+                    break
+    assert "token" in received
+
+
+async def test_chat_stream_reports_provider_error(api_client, fake_llm, fake_db, monkeypatch):
+    async def broken_stream(self, text):
+        raise RuntimeError("provider unavailable")
+        yield
+
+    monkeypatch.setattr(FakeChatBackend, "stream", broken_stream)
+    res = await api_client.post("/api/ai/chat/stream", json={"message": "hi"})
+
+    events = parse_sse(res.text)
+    assert events[-1] == ("error", {"detail": "provider unavailable"})
+    assert fake_db.chat_history.docs == []
+
+
+async def test_chat_requires_api_key(api_client, fake_db, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "EMERGENT_LLM_KEY", None)
+    res = await api_client.post("/api/ai/chat/stream", json={"message": "hi"})
+    assert res.status_code == 400
+
+
+async def test_follow_up_messages_reuse_session(api_client, fake_llm, fake_db, monkeypatch):
+    created = []
+    original_init = FakeChatBackend.__init__
+
+    def tracking_init(self, *args, **kwargs):
+        created.append(self)
+        original_init(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeChatBackend, "__init__", tracking_init)
+    for _ in range(3):
+        res = await api_client.post("/api/ai/chat", json={"message": "hi", "session_id": "s1"})
+        assert res.status_code == 200
+
+    assert len(created) == 1
+
+    # Changing the AI settings invalidates live sessions
+    res = await api_client.put("/api/settings/ai", params={"ai_provider": "fake", "ai_model": "fake-2"})
+    assert res.status_code == 200
+    await api_client.post("/api/ai/chat", json={"message": "hi", "session_id": "s1"})
+    assert len(created) == 2
+    assert created[-1].model == "fake-2"
+
+
+async def test_session_registry_is_bounded(fake_llm, fake_db):
+    registry = ai_service.ChatSessionRegistry(max_sessions=2, idle_ttl=60)
+    first = await registry.acquire(fake_db, "a", "u1")
+    await registry.acquire(fake_db, "b", "u1")
+    await registry.acquire(fake_db, "c", "u1")
+
+    assert len(registry) == 2
+    assert await registry.acquire(fake_db, "a", "u1") is not first
+    # A session is never handed to, or replaced by, a different user
+    owned = await registry.acquire(fake_db, "a", "u1")
+    with pytest.raises(ai_service.SessionForbidden):
+        await registry.acquire(fake_db, "a", "u2")
+    assert await registry.acquire(fake_db, "a", "u1") is owned
+
+    registry.idle_ttl = 0
+    registry.evict_idle()
+    assert len(registry) == 0
+
+
+async def test_chat_rejects_another_users_session(api_client, fake_llm):
+    res = await api_client.post("/api/ai/chat", json={"message": "hi", "session_id": "owned"})
+    assert res.status_code == 200
+    session = ai_service.chat_sessions.peek("owned")
+    session.user_id = "someone_else"
+
+    res = await api_client.post("/api/ai/chat", json={"message": "hi", "session_id": "owned"})
+    assert res.status_code == 403
+    res = await api_client.post("/api/ai/chat/stream", json={"message": "hi", "session_id": "owned"})
+    assert res.status_code == 403
+    assert ai_service.chat_sessions.peek("owned") is session
+
+
+async def test_repeated_question_served_from_cache(api_client, fake_llm, fake_db, monkeypatch):
+    from ai_cache import ai_response_cache
+    from metrics import AI_CACHE_SAVED_SECONDS
+
+    calls = []
+    original_send = FakeChatBackend.send
+
+    async def counting_send(self, text):
+        calls.append(text)
+        return await original_send(self, text)
+
+    monkeypatch.setattr(FakeChatBackend, "send", counting_send)
+    hits_before = ai_response_cache.hits
+    saved_before = AI_CACHE_SAVED_SECONDS.value()
+
+    first = await api_client.post("/api/ai/chat", json={"message": "Today's sales by branch?"})
+    second = await api_client.post("/api/ai/chat", json={"message": "  today's SALES by branch "})
+
+    assert first.json()["cached"] is False
+    assert second.json() == {**first.json(), "session_id": second.json()["session_id"], "cached": True}
+    assert len(calls) == 1
+    assert ai_response_cache.hits == hits_before + 1
+    assert AI_CACHE_SAVED_SECONDS.value() > saved_before
+    assert len(fake_db.ai_response_cache.docs) == 1
+
+    # Follow-ups depend on the conversation, so they always reach the model
+    session_id = second.json()["session_id"]
+    await api_client.post("/api/ai/chat", json={"message": "Today's sales by branch?", "session_id": session_id})
+    assert len(calls) == 2
+
+    stats = (await api_client.get("/api/ai/cache/stats")).json()
+    assert stats["hits"] >= 1 and stats["saved_latency_ms"] > 0
+
+
+def test_emergent_backend_remembers_cached_answers(monkeypatch):
+    contexts = []
+    monkeypatch.setattr(ai_service.EmergentChatBackend, "_new_chat", lambda self, system_message: contexts.append(system_message))
+    backend = ai_service.EmergentChatBackend("key", "s1", "You are helpful.", "gemini", "gemini-2.5-flash")
+
+    backend.remember("Sales today?", "Bhavani sold 4.")
+    assert "User: Sales today?\nAssistant: Bhavani sold 4." in contexts[-1]
+    backend.restore("Earlier: stock questions", [])
+    backend.remember("And Anthiyur?", "Anthiyur sold 2.")
+    assert "Earlier: stock questions" in contexts[-1] and "User: And Anthiyur?" in contexts[-1]
+    assert "Sales today?" not in contexts[-1]
+
+
+async def test_cache_key_tracks_snapshot_and_model(fake_db):
+    from ai_cache import AIResponseCache
+
+    cache = AIResponseCache(max_entries=2)
+    await cache.put(fake_db, "Top executive?", "snap1", "gemini/a", "prompt", "Ravi", 900.0)
+
+    assert await cache.get(fake_db, "top executive", "snap1", "gemini/a") == "Ravi"
+    assert await cache.get(fake_db, "top executive", "snap2", "gemini/a") is None
+    assert await cache.get(fake_db, "top executive", "snap1", "gemini/b") is None
+
+    await cache.put(fake_db, "q2", "snap1", "gemini/a", "prompt", "a2", 10.0)
+    await cache.put(fake_db, "q3", "snap1", "gemini/a", "prompt", "a3", 10.0)
+    assert len(fake_db.ai_response_cache.docs) == 2
+
+
+async def test_history_pages_and_compaction(api_client, fake_llm, fake_db, monkeypatch):
+    import ai_service
+    from chat_history import chat_history
+
+    monkeypatch.setattr(chat_history, "compact_after", 4)
+    monkeypatch.setattr(chat_history, "keep_recent", 2)
+    for i in range(5):
+        res = await api_client.post("/api/ai/chat", json={"message": f"question {i}", "session_id": "long"})
+        assert res.status_code == 200
+
+    page = (await api_client.get("/api/ai/history", params={"session_id": "long", "limit": 3})).json()
+    assert [t["user_message"] for t in page["data"]] == ["question 2", "question 3", "question 4"]
+    assert "question 0" in page["summary"] and "question 2" in page["summary"]
+
+    older = (await api_client.get(
+        "/api/ai/history", params={"session_id": "long", "limit": 3, "cursor": page["next_cursor"]}
+    )).json()
+    assert [t["user_message"] for t in older["data"]] == ["question 0", "question 1"]
+    assert older["next_cursor"] is None
+
+    # Every turn is covered by the TTL retention index
+    assert all(doc["expires_at"] for doc in fake_db.chat_history.docs)
+    # Other users can't read the session
+    fake_db.chat_history.docs[0]["user_id"] = "someone_else"
+    page = (await api_client.get("/api/ai/history", params={"session_id": "long", "limit": 10})).json()
+    assert len(page["data"]) == 4
+
+    # A worker that lost the session rebuilds it from summary + recent turns
+    restored = []
+    monkeypatch.setattr(FakeChatBackend, "restore", lambda self, summary, turns: restored.append((summary, turns)))
+    ai_service.chat_sessions.invalidate()
+    await api_client.post("/api/ai/chat", json={"message": "question 5", "session_id": "long"})
+    summary, turns = restored[0]
+    assert "question 0" in summary
+    assert [t["user_message"] for t in turns] == ["question 3", "question 4"]
+
+
+async def test_compacted_session_is_grounded_again(api_client, fake_llm, monkeypatch):
+    from datetime import datetime, timezone
+
+    import server
+    from chat_history import chat_history
+
+    monkeypatch.setattr(chat_history, "compact_after", 4)
+    monkeypatch.setattr(chat_history, "keep_recent", 2)
+    monkeypatch.setattr(server.business_context, "snapshot", lambda: (7, "Bhavani: sold 3 this month"))
+    monkeypatch.setattr(server.business_context, "_built_at", datetime.now(timezone.utc))
+    prompts = []
+
+    async def send(self, text):
+        prompts.append(text)
+        return self.reply
+
+    monkeypatch.setattr(FakeChatBackend, "send", send)
+    for i in range(6):
+        await api_client.post("/api/ai/chat", json={"message": f"question {i}", "session_id": "grounded"})
+
+    # The fifth turn triggers compaction, which rebuilds the history without the snapshot
+    grounded = ["Bhavani: sold 3" in prompt for prompt in prompts]
+    assert grounded == [True, False, False, False, False, True]
+
+
+async def test_history_rejects_bad_cursor(api_client):
+    res = await api_client.get("/api/ai/history", params={"session_id": "x", "cursor": "%%%"})
+    assert res.status_code == 400
+
+
+def litellm_backend(monkeypatch, acompletion):
+    litellm = pytest.importorskip("litellm")
+    monkeypatch.setattr(litellm, "acompletion", acompletion)
+    backend = ai_service.LiteLLMChatBackend("key", "s1", "You are helpful.", "openai", "gpt-4o-mini")
+    backend.remember("Earlier question", "Earlier answer")
+    return backend
+
+
+def chunk(text):
+    from types import SimpleNamespace
+
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+async def test_litellm_history_records_complete_exchanges(monkeypatch):
+    from types import SimpleNamespace
+
+    sent = []
+
+    async def acompletion(model, messages, api_key, stream=False):
+        sent.append(list(messages))
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="42 sold."))])
+
+        async def chunks():
+            for text in ("Bhavani ", "leads."):
+                yield chunk(text)
+        return chunks()
+
+    backend = litellm_backend(monkeypatch, acompletion)
+    assert await backend.send("Sales?") == "42 sold."
+    assert [part async for part in backend.stream("Top branch?")] == ["Bhavani ", "leads."]
+
+    assert sent[0][-1] == {"role": "user", "content": "Sales?"}
+    assert sent[1][-3:-1] == [{"role": "user", "content": "Sales?"}, {"role": "assistant", "content": "42 sold."}]
+    assert backend.messages[-2:] == [
+        {"role": "user", "content": "Top branch?"}, {"role": "assistant", "content": "Bhavani leads."}
+    ]
+    assert len(backend.messages) == 7
+
+
+async def test_litellm_history_is_clean_after_failure_or_cancel(monkeypatch):
+    started = asyncio.Event()
+
+    async def acompletion(model, messages, api_key, stream=False):
+        if not stream:
+            raise RuntimeError("provider down")
+
+        async def chunks():
+            yield chunk("Partial ")
+            if messages[-1]["content"] == "fail":
+                raise RuntimeError("stream dropped")
+            started.set()
+            await asyncio.sleep(60)
+            yield chunk("never")
+        return chunks()
+
+    backend = litellm_backend(monkeypatch, acompletion)
+    history = list(backend.messages)
+
+    with pytest.raises(RuntimeError):
+        await backend.send("Sales?")
+    assert backend.messages == history
+
+    with pytest.raises(RuntimeError):
+        async for _ in backend.stream("fail"):
+            pass
+    assert backend.messages == history
+
+    async def consume():
+        return [part async for part in backend.stream("slow")]
+
+    task = asyncio.create_task(consume())
+    await started.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert backend.messages == history
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from ai_context import BusinessContextBuilder
+from sheets_service import SheetsService
+
+pytestmark = pytest.mark.anyio
+
+MONTH = datetime.now(timezone.utc).strftime('%Y-%m')
+SOLD_CSV = (
+    "Customer Name,Mobile No,Vehicle Model,Sales Date,Executive Name\n"
+    f"A,900,Jupiter,{MONTH}-02,Ravi\n"
+    f"B,901,Apache,{MONTH}-03,Ravi\n"
+    "C,902,Jupiter,2020-01-05,Kumar\n"
+)
+
+
+class Session:
+    context_version = None
+
+
+@pytest.fixture
+def service(monkeypatch):
+    service = SheetsService()
+    downloads = []
+
+    def fake_download(sheet_id, gid=0):
+        downloads.append((sheet_id, gid))
+        return service.fake_csv
+
+    service.fake_csv = SOLD_CSV
+    service.downloads = downloads
+    monkeypatch.setattr(service, "_download", fake_download)
+    return service
+
+
+async def test_snapshot_follows_sheet_changes(service):
+    builder = BusinessContextBuilder()
+    service.add_listener(builder.on_sheet_change)
+
+    await service.get_tab('Bhavani', 'Sold')
+    # Summarized in a worker thread, then swapped in
+    assert builder.snapshot() == (0, "")
+    await builder.settled()
+    version, text = builder.snapshot()
+    assert "Bhavani: sold 2 this month / 3 total" in text
+    assert "Ravi (2)" in text
+
+    # Same content again: no new version, no resummarizing
+    service.CACHE_TTL = 0
+    await service.get_tab('Bhavani', 'Sold')
+    await builder.settled()
+    assert builder.snapshot()[0] == version
+
+    service.fake_csv = SOLD_CSV + f"D,903,Apache,{MONTH}-04,Kumar\n"
+    await service.get_tab('Bhavani', 'Sold')
+    await builder.settled()
+    new_version, text = builder.snapshot()
+    assert new_version > version
+    assert "sold 3 this month / 4 total" in text
+
+
+async def test_ground_reuses_cached_snapshot(service):
+    builder = BusinessContextBuilder()
+    service.add_listener(builder.on_sheet_change)
+    await service.get_tab('Bhavani', 'Sold')
+    await builder.settled()
+    downloads = len(service.downloads)
+
+    session = Session()
+    prompt = builder.ground("Top executive?", session)
+    assert prompt.endswith("Question: Top executive?")
+    assert "Ravi" in prompt
+    # The session already has this snapshot, so follow-ups are sent as-is
+    assert builder.ground("And last month?", session) == "And last month?"
+    assert len(service.downloads) == downloads
+
+
+def test_snapshot_respects_token_budget():
+    builder = BusinessContextBuilder(token_budget=40)
+    for i in range(20):
+        builder.on_sheet_change(f"Branch{i:02d}", 'Stock', [{'Vehicle Model': 'Jupiter'}] * i)
+    builder.update_service_reports('Bhavani', [
+        {'Technician': 'Ravi K', 'Veh Tot': '12', 'date': '2026-01-01'}
+    ])
+
+    _, text = builder.snapshot()
+    assert 0 < len(text) <= 40 * 4
+    assert text.startswith("Stock on hand:")
@@ -0,0 +1,101 @@
+import io
+import time
+import zipfile
+
+import pytest
+
+from analytics_export import AnalyticsExport, ExportUnavailable
+from sheets_service import UpstreamHealth
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def sold(name, day):
+    return {"Customer Name": name, "Sales Date": day, "Vehicle Model": "Jupiter"}
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    import server
+
+    service = server.sheets_service
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    return service
+
+
+@pytest.mark.anyio
+async def test_export_rewrites_only_changed_partitions(sheets, fake_db, tmp_path):
+    export = AnalyticsExport(sheets, str(tmp_path))
+    rows = [sold("A", "05/01/2026"), sold("B", "2026-01-20"), sold("C", "03/02/2026"), sold("D", "")]
+    sheets._store("Bhavani", "Sold", rows, "d1", time.monotonic())
+    fake_db.service_reports.docs.append({"Technician": "Ravi", "Paid": "4", "branch": "Bhavani", "date": "2026-02-11"})
+
+    first = await export.export(fake_db)
+    assert first["written"] == 4  # Sold 2026-01, 2026-02, undated + one service month
+    january = tmp_path / "sheets/tab=Sold/branch=Bhavani/month=2026-01/part.parquet"
+    table = pq.read_table(january)
+    assert table.column("Customer Name").to_pylist() == ["A", "B"]
+    assert [d.isoformat() for d in table.column("row_date").to_pylist()] == ["2026-01-05", "2026-01-20"]
+    assert (tmp_path / "service_reports/branch=Bhavani/month=2026-02/part.parquet").exists()
+
+    # Nothing changed: the tab is skipped by digest, service months by fingerprint
+    again = await export.export(fake_db)
+    assert (again["written"], again["skipped_tabs"], again["removed"]) == (0, 1, 0)
+
+    # An edit in February rewrites February alone; the undated row's deletion drops its partition
+    written_at = january.stat().st_mtime_ns
+    sheets._store("Bhavani", "Sold", rows[:2] + [sold("C", "04/02/2026")], "d2", time.monotonic())
+    changed = await export.export(fake_db)
+    assert (changed["written"], changed["removed"]) == (1, 1)
+    assert january.stat().st_mtime_ns == written_at
+    assert not (tmp_path / "sheets/tab=Sold/branch=Bhavani/month=undated").joinpath("part.parquet").exists()
+
+    # A new worker picks the manifest up from disk
+    months = [p["month"] for p in AnalyticsExport(sheets, str(tmp_path)).partitions(dataset="sheets")]
+    assert months == ["2026-01", "2026-02"]
+
+
+@pytest.mark.anyio
+async def test_arrow_format_and_disabled_export(sheets, fake_db, tmp_path):
+    sheets._store("Bhavani", "Stock", [{"Model": "Jupiter", "Qty": "3"}], "s1", time.monotonic())
+    export = AnalyticsExport(sheets, str(tmp_path), fmt="arrow")
+    await export.export(fake_db)
+    path = tmp_path / "sheets/tab=Stock/branch=Bhavani/month=undated/part.arrow"
+    with pa.memory_map(str(path)) as source:
+        assert pa.ipc.open_file(source).read_all().column("Qty").to_pylist() == ["3"]
+
+    with pytest.raises(ExportUnavailable):
+        await AnalyticsExport(sheets, "").export(fake_db)
+
+
+@pytest.mark.anyio
+async def test_export_downloads_stream_files_and_archives(api_client, sheets, fake_db, tmp_path, monkeypatch):
+    import server
+
+    export = AnalyticsExport(sheets, str(tmp_path))
+    monkeypatch.setattr(server, "analytics_export", export)
+    sheets._store("Bhavani", "Sold", [sold("A", "2026-01-05"), sold("B", "2026-03-01")], "d1", time.monotonic())
+
+    res = await api_client.post("/api/export/run")
+    assert res.json()["written"] == 2
+
+    res = await api_client.get("/api/export/partitions", params={"from_month": "2026-02"})
+    partitions = res.json()["partitions"]
+    assert [(p["month"], p["rows"]) for p in partitions] == [("2026-03", 1)]
+
+    res = await api_client.get("/api/export/file", params={"path": partitions[0]["path"]})
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "application/vnd.apache.parquet"
+    assert pq.read_table(io.BytesIO(res.content)).column("Customer Name").to_pylist() == ["B"]
+    res = await api_client.get("/api/export/file", params={"path": "../manifest.json"})
+    assert res.status_code == 404
+
+    res = await api_client.get("/api/export/archive", params={"dataset": "sheets", "branch": "Bhavani"})
+    archive = zipfile.ZipFile(io.BytesIO(res.content))
+    assert sorted(archive.namelist()) == [
+        "sheets/tab=Sold/branch=Bhavani/month=2026-01/part.parquet",
+        "sheets/tab=Sold/branch=Bhavani/month=2026-03/part.parquet",
+    ]
+    assert pq.read_table(io.BytesIO(archive.read(archive.namelist()[0]))).num_rows == 1
@@ -0,0 +1,69 @@
+import io
+import urllib.request
+
+import pytest
+
+from benchmarks import run as bench
+from benchmarks.fake_pdf import s601_report
+from benchmarks.fake_sheets import FakeSheetsServer, synthetic_csv
+
+
+def test_fake_sheets_server_serves_registry_tabs():
+    from branch_registry import BranchRegistry
+
+    registry = BranchRegistry()
+    with FakeSheetsServer.for_registry(registry, rows=25) as fake:
+        sheet_id = registry.sheet_ids["Bhavani"]
+        url = f"{fake.url}/spreadsheets/d/{sheet_id}/export?format=csv&gid={registry.gids['Bhavani']['Stock']}"
+        body = urllib.request.urlopen(url).read().decode("utf-8")
+        lines = body.splitlines()
+        assert lines[0].startswith("Received Date,Vehicle Model,Colour")
+        assert len(lines) == 26
+        assert body.encode("utf-8") == synthetic_csv("Stock", 25, seed="Bhavani/Stock")
+
+
+def test_synthetic_pdf_parses_like_an_s601_report():
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(io.BytesIO(s601_report(technicians=120)))
+    text = "\n".join(page.extract_text() for page in reader.pages)
+    assert len(reader.pages) == 2
+    assert "Technician" in text and "Free" in text and "Paid" in text
+    assert sum(1 for line in text.splitlines() if line[:1].isdigit()) == 120
+
+
+@pytest.mark.anyio
+async def test_benchmark_run_covers_endpoints():
+    run = await bench.run_benchmark(
+        rows=50, branches=2, requests=6, concurrency=3, warmup=1,
+        scenarios=["auth.me", "auth.login", "sheets.sales_filtered", "dashboard.all_branches", "dashboard.batch", "service.upload_pdf"]
+    )
+    assert set(run["results"]) == {"auth.me", "auth.login", "sheets.sales_filtered", "dashboard.all_branches", "dashboard.batch", "service.upload_pdf"}
+    for stats in run["results"].values():
+        assert stats["errors"] == 0
+        assert 0 < stats["p50_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+        assert stats["throughput_rps"] > 0
+    # Warm cache: the measured dashboard loads never went upstream
+    assert run["results"]["dashboard.all_branches"]["upstream_requests"] == 0
+    assert run["results"]["dashboard.batch"]["upstream_requests"] == 0
+
+
+def test_regressions_are_flagged_against_matching_runs():
+    params = {"rows": 1000, "mode": "warm"}
+    old = {"params": params, "run_at": "t0", "results": {"sheets.sales": {"p50_ms": 10.0, "p99_ms": 20.0}}}
+    other = {"params": {"rows": 5000, "mode": "warm"}, "run_at": "t1", "results": {}}
+    new = {"params": params, "results": {"sheets.sales": {"p50_ms": 10.4, "p99_ms": 30.0}}}
+
+    assert bench.find_baseline([old, other], params) is old
+    regressions = bench.compare(new, old, threshold=0.15)
+    assert [(r["scenario"], r["metric"]) for r in regressions] == [("sheets.sales", "p99_ms")]
+    assert bench.percentile([1, 2, 3, 4], 50) == 2
+    assert bench.percentile([1, 2, 3, 4], 99) == 4
+
+
+def test_date_range_benchmark_agrees_with_the_linear_filter():
+    from benchmarks import date_range
+
+    report = date_range.run(rows=500, years=2, repeat=1)
+    assert set(report["results"]) == {"today", "this_week", "this_month", "last_90_days", "this_year"}
+    assert report["results"]["this_year"]["matches"] > report["results"]["today"]["matches"]
@@ -0,0 +1,155 @@
+import json
+
+import pytest
+
+from branch_registry import BranchRegistry
+from sheet_sync import SheetSyncScheduler
+from sheets_service import SheetsService, UpstreamHealth
+
+pytestmark = pytest.mark.anyio
+
+
+def write_config(path, branches):
+    path.write_text(json.dumps(branches))
+
+
+async def test_file_registry_hot_reloads(tmp_path):
+    config = tmp_path / "branches.json"
+    write_config(config, {"Erode": {"sheet_id": "sheet-erode", "tabs": {"Sold": 0, "Stock": 7}}})
+    registry = BranchRegistry(config_file=str(config), default_interval=60)
+    service = SheetsService(registry=registry)
+    assert "Bhavani" in service.get_branches()
+
+    assert await registry.reload()
+    assert registry.source == "file"
+    assert service.get_branches() == ["Erode"]
+    assert service.BRANCH_GIDS == {"Erode": {"Sold": 0, "Stock": 7}}
+
+    # Unchanged content is not a new version
+    version = registry.version
+    assert not await registry.reload()
+    assert registry.version == version
+
+    write_config(config, {
+        "Erode": {"sheet_id": "sheet-erode", "tabs": {"Sold": 0}, "refresh_interval": 30, "priority": 2},
+        "Gobi": {"sheet_id": "sheet-gobi", "tabs": {"Sold": {"gid": 0, "refresh_interval": 600}}, "enabled": False},
+        "Broken": {"tabs": {"Sold": 0}}
+    })
+    assert await registry.reload()
+    assert service.get_branches() == ["Erode"]
+    assert registry.tab("Erode", "Sold") == {"gid": 0, "refresh_interval": 30, "priority": 2}
+    assert registry.branches["Gobi"]["tabs"]["Sold"]["refresh_interval"] == 600
+    assert "Broken" not in registry.branches
+
+
+async def test_registry_api_stores_branches_in_mongo(api_client, fake_db, monkeypatch):
+    import server
+
+    registry = BranchRegistry()
+    monkeypatch.setattr(server, "branch_registry", registry)
+
+    res = await api_client.put("/api/branches/registry/Erode", json={
+        "sheet_id": "sheet-erode",
+        "tabs": {"Sold": 0, "Stock": {"gid": 11, "refresh_interval": 300}},
+        "priority": 5
+    })
+    assert res.status_code == 200
+    assert registry.source == "mongo"
+    # The first edit keeps the built-in branches registered
+    assert len(fake_db.branch_registry.docs) == 6
+    assert registry.tab("Erode", "Stock") == {"gid": 11, "refresh_interval": 300, "priority": 5}
+
+    res = await api_client.get("/api/branches/registry")
+    assert {b["name"] for b in res.json()["branches"]} >= {"Erode", "Bhavani"}
+
+    res = await api_client.put("/api/branches/registry/Erode", json={"sheet_id": "", "tabs": {}})
+    assert res.status_code == 422
+
+    assert (await api_client.delete("/api/branches/registry/Bhavani")).status_code == 200
+    assert "Bhavani" not in registry.sheet_ids
+    assert (await api_client.delete("/api/branches/registry/Bhavani")).status_code == 404
+
+    fake_db.users.docs[0]["role"] = "user"
+    assert (await api_client.get("/api/branches/registry")).status_code == 403
+
+
+async def test_deleted_branch_drops_out_of_derived_views(api_client, fake_db, monkeypatch):
+    import server
+
+    registry = BranchRegistry()
+    registry.add_listener(server.sheets_service.prune)
+    service = server.sheets_service
+    monkeypatch.setattr(server, "branch_registry", registry)
+    monkeypatch.setattr(service, "registry", registry)
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    gids = registry.gids["Bhavani"]
+    month = server._current_month()
+    csv = {
+        gids["Enquiry"]: f"Enquiry Date,Mobile No,Vehicle Model,Executive Name\n{month}-01,9840012345,Jupiter,Ravi\n",
+        gids["Sold"]: f"Sales Date,Mobile No,Vehicle Model,Executive Name\n{month}-02,9840012345,Jupiter,Ravi\n",
+        gids["Stock"]: f"Received Date,Vehicle Model,Colour\n{month}-01,Jupiter,Black\n",
+    }
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: csv.get(gid, "Date\n") if sheet_id == registry.sheet_ids["Bhavani"] else "Date\n")
+    for engine in (server.funnel_engine, server.target_tracker, server.inventory, server.business_context):
+        engine.__init__()
+
+    async def views():
+        funnel = (await api_client.get("/api/funnel")).json()
+        board = (await api_client.get("/api/targets/leaderboard")).json()["data"]
+        stock = (await api_client.get("/api/inventory/summary")).json()
+        await server.business_context.settled()
+        return funnel["branches"], [row["branch"] for row in board], stock["branches"], server.business_context.snapshot()[1]
+
+    funnel, board, stock, context = await views()
+    assert "Bhavani" in funnel and board == ["Bhavani"] and stock["Bhavani"]["total"] == 1 and "Bhavani" in context
+    assert ("Bhavani", "Sold") in server.tab_dates._index
+
+    assert (await api_client.delete("/api/branches/registry/Bhavani")).status_code == 200
+    funnel, board, stock, context = await views()
+    assert "Bhavani" not in funnel and board == [] and "Bhavani" not in stock and "Bhavani" not in context
+    assert (await api_client.get("/api/inventory/locate", params={"model": "Jupiter"})).json()["branches"] == {}
+    await server.tab_dates.settled()
+    assert not any(branch == "Bhavani" for branch, _ in server.tab_dates._index)
+
+
+async def test_scheduler_adapts_to_busy_and_quiet_branches(tmp_path, monkeypatch):
+    config = tmp_path / "branches.json"
+    write_config(config, {
+        "Busy": {"sheet_id": "busy", "tabs": {"Sold": 0}, "refresh_interval": 60},
+        "Quiet": {"sheet_id": "quiet", "tabs": {"Sold": 0}, "refresh_interval": 60, "priority": 3}
+    })
+    registry = BranchRegistry(config_file=str(config))
+    await registry.reload()
+    service = SheetsService(registry=registry)
+    sales = {"busy": 0}
+
+    def fake_download(sheet_id, gid=0):
+        if sheet_id == "busy":
+            sales["busy"] += 1
+        return "Customer Name\n" + "".join(f"C{i}\n" for i in range(sales.get(sheet_id, 1)))
+
+    monkeypatch.setattr(service, "_download", fake_download)
+    scheduler = SheetSyncScheduler(service, registry, min_interval=15, max_factor=4, step=2)
+    scheduler.sync_plan()
+
+    # Nothing cached yet: everything is due, higher priority first
+    assert scheduler.due(float("inf")) == [("Quiet", "Sold"), ("Busy", "Sold")]
+
+    for _ in range(4):
+        for key in list(service._cache):
+            service._cache[key]["fetched_at"] -= 1000  # the interval has elapsed
+        await scheduler.refresh("Busy", "Sold")
+        await scheduler.refresh("Quiet", "Sold")
+
+    busy, quiet = scheduler._tabs[("Busy", "Sold")], scheduler._tabs[("Quiet", "Sold")]
+    assert busy["interval"] == 15
+    assert quiet["interval"] == 240
+    assert service.tab_ttl("Busy", "Sold") < service.tab_ttl("Quiet", "Sold")
+
+    # Dropping a branch from the registry unschedules it and frees its cache
+    write_config(config, {"Busy": {"sheet_id": "busy", "tabs": {"Sold": 0}, "refresh_interval": 60}})
+    await registry.reload()
+    scheduler.sync_plan()
+    assert list(scheduler._tabs) == [("Busy", "Sold")]
+    assert service.peek_tab("Quiet", "Sold") is None
@@ -0,0 +1,126 @@
+import pytest
+
+from funnel import FunnelEngine, TabIndex
+from sheets_service import UpstreamHealth
+
+ENQUIRIES = [
+    {"Enquiry Date": "2026-01-02", "Customer Name": "Arjun", "Mobile No": "98400 12345", "Vehicle Model": "Jupiter", "Executive Name": "Ravi"},
+    {"Enquiry Date": "2026-01-05", "Customer Name": "Meena", "Mobile No": "9840054321", "Vehicle Model": "Raider 125", "Executive Name": "Ravi"},
+    {"Enquiry Date": "03/01/2026", "Customer Name": "Gopal", "Mobile No": "9000000001", "Vehicle Model": "Ronin", "Executive Name": "Kumar"},
+    {"Enquiry Date": "2026-01-10", "Customer Name": "Mani", "Mobile No": "9000000002", "Vehicle Model": "XL100", "Executive Name": "Kumar"},
+    # Repeat enquiry from the same customer for the same model: still one journey
+    {"Enquiry Date": "2026-01-04", "Customer Name": "Arjun", "Mobile No": "+91 9840012345", "Vehicle Model": "jupiter ", "Executive Name": "Ravi"},
+]
+BOOKINGS = [
+    {"Booking Date": "2026-01-04", "Mobile No": "9840012345", "Vehicle Model": "Jupiter"},
+    {"Booking Date": "2026-01-06", "Mobile No": "9840054321", "Vehicle Model": "Raider 125"},
+]
+SOLD = [
+    {"Sales Date": "2026-01-12", "Mobile No": "9840012345", "Vehicle Model": "Jupiter", "Executive Name": "Ravi"},
+    # Enquired about a Ronin, bought an Apache: matched on mobile alone
+    {"Sales Date": "2026-02-20", "Mobile No": "9000000001", "Vehicle Model": "Apache RTR 160", "Executive Name": "Kumar"},
+    # Walk-in with no enquiry
+    {"Sales Date": "2026-01-15", "Mobile No": "9111111111", "Vehicle Model": "NTorq 125", "Executive Name": "Kumar"},
+]
+
+
+def build_engine():
+    engine = FunnelEngine()
+    engine.on_sheet_change("Bhavani", "Enquiry", ENQUIRIES)
+    engine.on_sheet_change("Bhavani", "Bookings", BOOKINGS)
+    engine.on_sheet_change("Bhavani", "Sold", SOLD)
+    return engine
+
+
+def test_index_normalizes_mobile_and_model():
+    index = TabIndex("Enquiry", ENQUIRIES)
+    assert len(index.by_key[("9840012345", "jupiter")]) == 2
+    assert [entry[0].isoformat() for entry in index.by_key[("9840012345", "jupiter")]] == ["2026-01-02", "2026-01-04"]
+    assert index.rows == 5
+
+
+def test_funnel_joins_enquiries_bookings_and_sales():
+    summary = build_engine().summary()
+    assert (summary["enquiries"], summary["booked"], summary["sold"]) == (4, 2, 2)
+    assert summary["conversion_rate"] == 50.0
+    assert summary["booking_to_sale"] == 50.0
+    assert summary["unmatched_sales"] == 1 and summary["unmatched_bookings"] == 0
+    # Arjun: 10 days from first enquiry, Gopal: 48 days
+    assert summary["time_to_convert"]["buckets"] == {"0-7": 0, "8-15": 1, "16-30": 0, "31-60": 1, "61+": 0}
+
+    executives = {row["executive"]: row for row in summary["executives"]}
+    assert (executives["Ravi"]["enquiries"], executives["Ravi"]["sold"]) == (2, 1)
+    assert (executives["Kumar"]["enquiries"], executives["Kumar"]["sold"]) == (2, 1)
+    assert summary["branches"]["Bhavani"]["enquiries"] == 4
+
+
+def test_drop_offs_and_incremental_updates():
+    engine = build_engine()
+    assert [row["customer"] for row in engine.drop_offs(stage="enquiry")["data"]] == ["Mani"]
+    assert [row["customer"] for row in engine.drop_offs(stage="booked")["data"]] == ["Meena"]
+
+    first = engine.summary()
+    assert engine.summary() is first  # memoized until the next change
+
+    engine.on_sheet_change("Bhavani", "Sold", SOLD + [{"Sales Date": "2026-01-20", "Mobile No": "9840054321", "Vehicle Model": "Raider 125"}])
+    assert engine.summary()["sold"] == 3
+    assert engine.drop_offs(stage="booked")["total"] == 0
+    # Other tabs are ignored
+    engine.on_sheet_change("Bhavani", "Stock", [{"Vehicle Model": "Jupiter"}])
+    assert engine.summary()["sold"] == 3
+
+
+@pytest.mark.anyio
+async def test_sheet_changes_are_indexed_off_the_event_loop():
+    engine = FunnelEngine()
+    engine.on_sheet_change("Bhavani", "Enquiry", ENQUIRIES[:1])
+    engine.on_sheet_change("Bhavani", "Enquiry", ENQUIRIES)
+    engine.on_sheet_change("Bhavani", "Sold", SOLD)
+    assert engine.version == 0  # queued, not built inline
+
+    await engine.settled()
+    # The two Enquiry changes coalesce into one reindex of the newest rows
+    assert engine.version == 2
+    assert engine.summary("Bhavani")["enquiries"] == 4
+
+
+@pytest.mark.anyio
+async def test_funnel_endpoint_loads_tabs(api_client, monkeypatch):
+    import server
+
+    service = server.sheets_service
+    gids = service.BRANCH_GIDS["Bhavani"]
+    csv = {
+        gids["Enquiry"]: "Enquiry Date,Customer Name,Mobile No,Vehicle Model,Executive Name\n2026-01-02,Arjun,9840012345,Jupiter,Ravi\n2026-01-03,Meena,9840054321,Ronin,Ravi\n",
+        gids["Bookings"]: "Booking Date,Mobile No,Vehicle Model\n2026-01-04,9840012345,Jupiter\n",
+        gids["Sold"]: "Sales Date,Mobile No,Vehicle Model\n2026-01-09,9840012345,Jupiter\n",
+    }
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: csv.get(gid, "Date\n") if sheet_id == service.BRANCH_SHEETS["Bhavani"] else "Date\n")
+    server.funnel_engine.__init__()
+
+    res = await api_client.get("/api/funnel", params={"branch": "Bhavani"})
+    assert res.status_code == 200
+    body = res.json()
+    assert (body["enquiries"], body["booked"], body["sold"], body["conversion_rate"]) == (2, 1, 1, 50.0)
+    assert body["time_to_convert"]["median_days"] == 7
+
+    res = await api_client.get("/api/funnel/drop-offs", params={"branch": "Bhavani"})
+    assert [row["customer"] for row in res.json()["data"]] == ["Meena"]
+    assert (await api_client.get("/api/funnel/drop-offs", params={"stage": "lost"})).status_code == 422
+
+
+def test_dates_follow_each_column_format():
+    engine = FunnelEngine()
+    # DD-Mon-YYYY enquiries, month-first sales (02/03/2026 is February 3rd there)
+    engine.on_sheet_change("Bhavani", "Enquiry", [
+        {"Enquiry Date": "05-Jan-2026", "Mobile No": "9840012345", "Vehicle Model": "Jupiter"},
+    ])
+    engine.on_sheet_change("Bhavani", "Sold", [
+        {"Sales Date": "02/03/2026", "Mobile No": "9840012345", "Vehicle Model": "Jupiter"},
+        {"Sales Date": "01/25/2026", "Mobile No": "9000000001", "Vehicle Model": "Ronin"},
+    ])
+    summary = engine.summary("Bhavani", start_date="2026-01-01", end_date="2026-01-31")
+    assert (summary["enquiries"], summary["sold"]) == (1, 1)
+    assert summary["time_to_convert"]["median_days"] == 29
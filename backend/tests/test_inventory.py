@@ -0,0 +1,112 @@
+from datetime import date
+
+import pytest
+
+from inventory import InventoryAnalytics
+from sheets_service import UpstreamHealth
+
+TODAY = date(2026, 3, 31)
+STOCK = [
+    {"Received Date": "2026-03-20", "Vehicle Model": "Jupiter", "Colour": "Black"},
+    {"Received Date": "2026-01-15", "Vehicle Model": "Jupiter", "Colour": "White"},
+    {"Received Date": "2025-08-01", "Vehicle Model": "Ronin", "Colour": "Red"},
+    {"Received Date": "2025-08-01", "Vehicle Model": "Ronin", "Colour": "Red"},
+    {"Received Date": "2026-02-01", "Vehicle Model": "Ronin", "Colour": "Red", "Status": "Delivered"},
+]
+SOLD = [
+    {"Sales Date": "2026-03-10", "Vehicle Model": "Jupiter"},
+    {"Sales Date": "2026-03-12", "Vehicle Model": "jupiter"},
+    {"Sales Date": "2026-03-15", "Vehicle Model": "Jupiter"},
+    {"Sales Date": "2025-12-01", "Vehicle Model": "Ronin"},
+]
+
+
+def build():
+    analytics = InventoryAnalytics(low_stock=2, overstock_days=90, window_days=30)
+    analytics.apply("Bhavani", "Stock", STOCK, today=TODAY)
+    analytics.apply("Bhavani", "Sold", SOLD, today=TODAY)
+    return analytics
+
+
+def test_summary_counts_ages_and_sell_through():
+    summary = build().summary(today=TODAY)["branches"]["Bhavani"]
+    assert summary["total"] == 4
+    assert sorted(m["model"] for m in summary["models"]) == ["Jupiter", "Ronin"]
+    jupiter = next(m for m in summary["models"] if m["model"] == "Jupiter")
+    assert jupiter["colours"] == {"Black": 1, "White": 1}
+    # 3 sold in the window against 2 on hand
+    assert jupiter["sell_through"] == 60.0
+    assert summary["age_buckets"] == {"0-30": 1, "31-60": 0, "61-90": 1, "91-180": 0, "180+": 2}
+
+
+def test_alerts_are_raised_and_cleared_incrementally():
+    analytics = build()
+    assert sorted((a["model"], a["type"]) for a in analytics.alerts()) == [("Jupiter", "low_stock"), ("Ronin", "overstock")]
+    # Before the sales loaded Jupiter looked overstocked
+    assert sorted((e["model"], e["type"], e["change"]) for e in analytics.events[-2:]) == [
+        ("Jupiter", "low_stock", "raised"), ("Jupiter", "overstock", "cleared")
+    ]
+    seen = len(analytics.events)
+
+    # Jupiter restocked: its low-stock alert clears, Ronin's stays untouched
+    restock = STOCK + [{"Received Date": "2026-03-30", "Vehicle Model": "Jupiter", "Colour": "Black"}] * 3
+    analytics.apply("Bhavani", "Stock", restock, today=TODAY)
+    assert [(a["model"], a["type"]) for a in analytics.alerts()] == [("Ronin", "overstock")]
+    assert [(e["model"], e["type"], e["change"]) for e in analytics.events[seen:]] == [("Jupiter", "low_stock", "cleared")]
+
+
+def test_cross_branch_lookup_tracks_changes():
+    analytics = build()
+    analytics.apply("Anthiyur", "Stock", [{"Vehicle Model": "Jupiter", "Colour": "black"}] * 2, today=TODAY)
+    assert analytics.locate("jupiter", "Black") == {"Bhavani": 1, "Anthiyur": 2}
+    assert analytics.locate("Jupiter") == {"Bhavani": 2, "Anthiyur": 2}
+
+    analytics.apply("Bhavani", "Stock", STOCK[1:], today=TODAY)
+    assert analytics.locate("Jupiter", "Black") == {"Anthiyur": 2}
+    analytics.apply("Anthiyur", "Stock", [], today=TODAY)
+    assert analytics.locate("Jupiter", "Black") == {}
+
+
+@pytest.mark.anyio
+async def test_inventory_endpoints(api_client, monkeypatch):
+    import server
+
+    service = server.sheets_service
+    gids = service.BRANCH_GIDS["Bhavani"]
+    csv = {
+        gids["Stock"]: "Received Date,Vehicle Model,Colour\n2026-01-01,Jupiter,Black\n2026-01-02,Jupiter,Black\n",
+        gids["Sold"]: "Sales Date,Vehicle Model\n2026-01-05,Jupiter\n",
+    }
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: csv.get(gid, "Date\n") if sheet_id == service.BRANCH_SHEETS["Bhavani"] else "Date\n")
+    server.inventory.__init__()
+
+    res = await api_client.get("/api/inventory/locate", params={"model": "Jupiter", "colour": "Black"})
+    assert res.json()["branches"] == {"Bhavani": 2}
+    summary = (await api_client.get("/api/inventory/summary", params={"branch": "Bhavani"})).json()
+    assert summary["branches"]["Bhavani"]["models"][0]["on_hand"] == 2
+    assert (await api_client.get("/api/inventory/alerts")).status_code == 200
+    assert (await api_client.get("/api/inventory/locate")).status_code == 422
+
+
+def test_ageing_reads_named_month_dates():
+    analytics = InventoryAnalytics()
+    analytics.apply("Bhavani", "Stock", [
+        {"Received Date": "20-Mar-2026", "Vehicle Model": "Jupiter"},
+        {"Received Date": "01-Aug-2025", "Vehicle Model": "Ronin"},
+    ], today=TODAY)
+    buckets = analytics.summary(today=TODAY)["branches"]["Bhavani"]["age_buckets"]
+    assert (buckets["0-30"], buckets["180+"]) == (1, 1)
+
+
+@pytest.mark.anyio
+async def test_sheet_changes_are_scanned_off_the_event_loop():
+    analytics = InventoryAnalytics()
+    analytics.on_sheet_change("Bhavani", "Stock", STOCK)
+    analytics.on_sheet_change("Bhavani", "Enquiry", STOCK)
+    assert analytics.locate("Jupiter") == {}
+
+    await analytics.settled()
+    assert analytics.version == 1
+    assert analytics.locate("Jupiter") == build().locate("Jupiter")
@@ -0,0 +1,66 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_auth import FakeAuthProvider
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def provider(monkeypatch):
+    import server
+
+    fake = FakeAuthProvider(latency=0.05).start()
+    monkeypatch.setattr(server, "AUTH_SESSION_URL", fake.session_url)
+    await server.close_auth_http_client()
+    yield fake
+    await server.close_auth_http_client()
+    fake.stop()
+
+
+async def test_login_upserts_user_and_reuses_connections(api_client, fake_db, provider):
+    for i in range(5):
+        res = await api_client.post("/api/auth/session", json={"session_id": f"meena:{i}"})
+        assert res.status_code == 200
+        body = res.json()
+        assert body["user"]["email"] == "meena@example.com"
+        assert body["session_token"] == f"st_meena:{i}"
+        assert "access_token" in body
+
+    users = [u for u in fake_db.users.docs if u["email"] == "meena@example.com"]
+    assert len(users) == 1
+    assert users[0]["role"] == "user" and users[0]["user_id"].startswith("user_")
+    assert len([s for s in fake_db.user_sessions.docs if s["user_id"] == users[0]["user_id"]]) == 5
+    # One pooled keep-alive connection served every login
+    assert provider.requests == 5
+    assert provider.connections == 1
+
+
+async def test_settings_lookup_overlaps_the_provider_call(api_client, fake_db, provider, monkeypatch):
+    fake_db.app_settings.docs.append({"setting_id": "global", "allowed_emails": ["meena@example.com"]})
+    find_one = fake_db.app_settings.find_one
+
+    async def slow_find_one(*args, **kwargs):
+        await asyncio.sleep(0.05)
+        return await find_one(*args, **kwargs)
+
+    monkeypatch.setattr(fake_db.app_settings, "find_one", slow_find_one)
+    await api_client.post("/api/auth/session", json={"session_id": "meena"})  # warm the pool
+
+    started = time.perf_counter()
+    res = await api_client.post("/api/auth/session", json={"session_id": "meena:again"})
+    elapsed = time.perf_counter() - started
+    assert res.status_code == 200
+    # Sequential would be >= 100 ms (50 ms provider + 50 ms settings)
+    assert elapsed < 0.095
+
+    res = await api_client.post("/api/auth/session", json={"session_id": "intruder"})
+    assert res.status_code == 403
+    assert not any(u["email"] == "intruder@example.com" for u in fake_db.users.docs)
+
+
+async def test_unknown_session_is_rejected(api_client, provider):
+    res = await api_client.post("/api/auth/session", json={"session_id": ""})
+    assert res.status_code == 401
@@ -0,0 +1,111 @@
+import re
+
+import pytest
+
+from metrics import MetricsRegistry
+from sheets_service import UpstreamHealth
+
+pytestmark = pytest.mark.anyio
+
+CSV = "Customer Name,Sales Date,Executive Name\nA,2026-01-02,Ravi\nB,2026-01-03,Kumar\n"
+
+
+def sample(text, name, **labels):
+    """Value of one sample line in the exposition text (None if absent)"""
+    label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    pattern = re.escape(name + (f"{{{label_text}}}" if labels else "")) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_histogram_exposition_is_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("op_seconds", "Op latency", ["op"], buckets=(0.1, 1.0))
+    errors = registry.counter("op_errors_total", "Op errors", ["op"])
+    for value in (0.05, 0.5, 0.7, 3.0):
+        latency.observe(value, op='read "x"')
+    errors.inc(op="read")
+
+    text = registry.render()
+    assert "# TYPE op_seconds histogram" in text
+    assert sample(text, "op_seconds_bucket", op='read \\"x\\"', le="0.1") == 1
+    assert sample(text, "op_seconds_bucket", op='read \\"x\\"', le="1") == 3
+    assert sample(text, "op_seconds_bucket", op='read \\"x\\"', le="+Inf") == 4
+    assert sample(text, "op_seconds_sum", op='read \\"x\\"') == pytest.approx(4.25)
+    assert sample(text, "op_errors_total", op="read") == 1
+
+    with pytest.raises(ValueError):
+        latency.observe(1.0)
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    import server
+
+    service = server.sheets_service
+    monkeypatch.setattr(service, "health", UpstreamHealth(down_after=1, base_backoff=60))
+    monkeypatch.setattr(service, "_cache", {})
+    monkeypatch.setattr(service, "_tab_ttl", {})
+    monkeypatch.setattr(service, "_schedule_probe", lambda: None)
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: CSV)
+    return service
+
+
+async def test_api_requests_feed_metrics(api_client, sheets, monkeypatch):
+    res = await api_client.get("/api/sheets/sales-data", params={"branch": "Bhavani"})
+    assert res.status_code == 200 and res.json()["total"] == 2
+    await api_client.get("/api/sheets/sales-data", params={"branch": "Bhavani"})
+
+    # Upstream outage: the cached copy is served and counted as a fallback
+    def failing(sheet_id, gid=0):
+        raise RuntimeError("HTTP 503")
+
+    monkeypatch.setattr(sheets, "_download", failing)
+    assert len(await sheets.get_tab("Bhavani", "Sold", max_age=0)) == 2
+    assert await sheets.get_tab("Anthiyur", "Sold", max_age=0) == []
+
+    res = await api_client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = res.text
+
+    route = {"method": "GET", "route": "/api/sheets/sales-data", "status": "200"}
+    assert sample(text, "http_request_duration_seconds_count", **route) >= 2
+    assert sample(text, "sheets_download_seconds_count", branch="Bhavani", tab="Sold") >= 1
+    assert sample(text, "sheets_parse_seconds_count", branch="Bhavani", tab="Sold") >= 1
+    assert sample(text, "sheets_csv_rows", branch="Bhavani", tab="Sold") == 2
+    assert sample(text, "sheets_csv_bytes", branch="Bhavani", tab="Sold") == len(CSV)
+    assert sample(text, "sheets_cache_lookups_total", result="hit") >= 1
+    assert sample(text, "sheets_fetch_errors_total", branch="Bhavani", tab="Sold") >= 1
+    assert sample(text, "sheets_fallbacks_total", branch="Bhavani", tab="Sold", reason="fetch_error") >= 1
+    assert sample(text, "sheets_fallbacks_total", branch="Anthiyur", tab="Sold", reason="circuit_open") >= 1
+    assert sample(text, "mongo_query_seconds_count", operation="session_lookup") >= 2
+    assert sample(text, "mongo_query_seconds_count", operation="user_lookup") >= 2
+
+    # The metrics endpoint itself isn't an /api route
+    assert 'route="/metrics"' not in text
+
+
+async def test_unknown_routes_and_errors_are_labelled(api_client):
+    await api_client.get("/api/no/such/route/123")
+    text = (await api_client.get("/metrics")).text
+    assert sample(text, "http_request_duration_seconds_count", method="GET", route="unmatched", status="404") >= 1
+
+
+async def test_metrics_token(api_client, monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-secret")
+    assert (await api_client.get("/metrics")).status_code == 401
+    res = await api_client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert res.status_code == 200
+
+
+async def test_llm_latency_and_cache_lookups(api_client, fake_llm):
+    await api_client.post("/api/ai/chat", json={"message": "Top model?"})
+    await api_client.post("/api/ai/chat/stream", json={"message": "Top branch?"})
+
+    text = (await api_client.get("/metrics")).text
+    labels = {"provider": "fake", "model": "fake-1"}
+    assert sample(text, "llm_request_seconds_count", **labels, mode="chat") >= 1
+    assert sample(text, "llm_request_seconds_count", **labels, mode="stream") >= 1
+    assert sample(text, "llm_time_to_first_token_seconds_count", **labels) >= 1
+    assert sample(text, "ai_cache_lookups_total", result="miss") >= 2
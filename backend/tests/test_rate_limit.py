@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from metrics import ADMISSION_REJECTIONS
+from rate_limit import AdmissionController, RateLimited, RouteLimits
+
+pytestmark = pytest.mark.anyio
+
+
+def test_token_bucket_is_per_user_and_refills(monkeypatch):
+    import rate_limit
+
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    controller = AdmissionController({"sheets": RouteLimits(rate_per_min=60, burst=2, max_concurrent=0, max_queue=0)})
+
+    controller.check_rate("user:a", "sheets")
+    controller.check_rate("user:a", "sheets")
+    with pytest.raises(RateLimited) as rejected:
+        controller.check_rate("user:a", "sheets")
+    assert rejected.value.reason == "rate_limited"
+    assert rejected.value.retry_after == pytest.approx(1.0)
+    # Another user has a bucket of their own
+    controller.check_rate("user:b", "sheets")
+
+    now[0] += 1.0
+    controller.check_rate("user:a", "sheets")
+
+
+async def test_concurrency_cap_queues_then_rejects():
+    controller = AdmissionController(
+        {"pdf": RouteLimits(rate_per_min=0, burst=0, max_concurrent=1, max_queue=1)}, queue_timeout=0.2
+    )
+    await controller.acquire("pdf")
+    queued = asyncio.create_task(controller.acquire("pdf"))
+    await asyncio.sleep(0)
+    assert controller.queued("pdf") == 1
+
+    with pytest.raises(RateLimited) as rejected:
+        await controller.acquire("pdf")
+    assert rejected.value.reason == "queue_full"
+
+    controller.release("pdf")
+    await queued
+    assert controller.queued("pdf") == 0
+
+    # Nobody releases: the queued request gives up after queue_timeout
+    with pytest.raises(RateLimited) as rejected:
+        await controller.acquire("pdf")
+    assert rejected.value.reason == "queue_timeout"
+    assert controller.queued("pdf") == 0
+
+
+async def test_rate_limited_requests_get_429_with_retry_after(api_client, monkeypatch):
+    import server
+
+    limits = dict(server.admission.limits, sheets=RouteLimits(rate_per_min=6, burst=2, max_concurrent=4, max_queue=4))
+    monkeypatch.setattr(server.admission, "limits", limits)
+    before = ADMISSION_REJECTIONS.value(route_class="sheets", reason="rate_limited")
+    # Authenticate once so the session is rated on its own rather than by IP
+    assert (await api_client.get("/api/auth/me")).status_code == 200
+
+    assert (await api_client.get("/api/sheets/branches")).status_code == 200
+    assert (await api_client.get("/api/sheets/branches")).status_code == 200
+    res = await api_client.get("/api/sheets/branches")
+    assert res.status_code == 429
+    assert res.headers["Retry-After"] == "10"
+    assert res.json()["reason"] == "rate_limited"
+    assert ADMISSION_REJECTIONS.value(route_class="sheets", reason="rate_limited") == before + 1
+
+    # Other route classes and unclassed routes are unaffected
+    assert (await api_client.get("/api/auth/me")).status_code == 200
+
+
+def test_only_verified_sessions_get_their_own_bucket():
+    from starlette.requests import Request
+
+    from rate_limit import user_key
+
+    def request(credential):
+        return Request({
+            "type": "http", "method": "GET", "path": "/api/sheets/branches", "client": ("10.0.0.7", 5000),
+            "headers": [(b"authorization", f"Bearer {credential}".encode())],
+        })
+
+    controller = AdmissionController({"sheets": RouteLimits(rate_per_min=60, burst=2, max_concurrent=0, max_queue=0)})
+    # Fresh junk credentials all count against the client IP
+    keys = {user_key(request(f"junk-{i}"), controller) for i in range(50)}
+    assert keys == {"ip:10.0.0.7"}
+    controller.check_rate(user_key(request("junk-1"), controller), "sheets")
+    controller.check_rate(user_key(request("junk-2"), controller), "sheets")
+    with pytest.raises(RateLimited):
+        controller.check_rate(user_key(request("junk-3"), controller), "sheets")
+    assert len(controller._buckets) == 1
+
+    # A session authentication accepted is rated on its own
+    controller.note_session("real-session")
+    key = user_key(request("real-session"), controller)
+    assert key.startswith("session:")
+    controller.check_rate(key, "sheets")
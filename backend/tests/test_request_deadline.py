@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from request_deadline import FetchAborted, check_fetch, set_deadline
+from sheets_service import SheetsService, UpstreamHealth
+
+pytestmark = pytest.mark.anyio
+
+CSV = "Customer Name,Sales Date\nA,2026-01-02\nB,2026-01-03\n"
+
+
+class SlowUpstream:
+    """Takes `seconds` to answer, checking between 'chunks' whether it is still wanted"""
+
+    def __init__(self, seconds=0.3):
+        self.seconds = seconds
+        self.calls = 0
+        self.aborted = threading.Event()
+
+    def __call__(self, sheet_id, gid=0):
+        self.calls += 1
+        until = time.monotonic() + self.seconds
+        while time.monotonic() < until:
+            try:
+                check_fetch()
+            except FetchAborted:
+                self.aborted.set()
+                raise
+            time.sleep(0.01)
+        return CSV
+
+
+@pytest.fixture
+def upstream():
+    return SlowUpstream()
+
+
+@pytest.fixture
+def service(upstream, monkeypatch):
+    service = SheetsService()
+    service.health = UpstreamHealth()
+    monkeypatch.setattr(service, "_download", upstream)
+    return service
+
+
+async def test_detached_reader_leaves_the_shared_fetch_running(service, upstream):
+    leaving = asyncio.create_task(service.get_tab("Bhavani", "Sold"))
+    staying = asyncio.create_task(service.get_tab("Bhavani", "Sold"))
+    await asyncio.sleep(0.05)
+    leaving.cancel()
+
+    assert len(await staying) == 2
+    assert leaving.cancelled()
+    assert upstream.calls == 1 and not upstream.aborted.is_set()
+
+
+async def test_fetch_is_cancelled_when_its_last_reader_leaves(service, upstream):
+    reader = asyncio.create_task(service.get_tab("Bhavani", "Sold"))
+    await asyncio.sleep(0.05)
+    reader.cancel()
+
+    assert await asyncio.to_thread(upstream.aborted.wait, 1)
+    await asyncio.sleep(0.05)
+    assert service.peek_tab("Bhavani", "Sold") is None
+    # Abandoning a fetch is not an upstream failure
+    assert service.health.state == UpstreamHealth.HEALTHY
+    assert service._inflight == {}
+
+
+async def test_deadline_serves_the_cached_copy(service, upstream):
+    await service.get_tab("Bhavani", "Sold")
+
+    async def request():
+        set_deadline(0.1)
+        return await service.get_tab("Bhavani", "Sold", max_age=0)
+
+    started = time.perf_counter()
+    rows = await asyncio.create_task(request())
+    assert time.perf_counter() - started < 0.25
+    assert len(rows) == 2
+    assert await asyncio.to_thread(upstream.aborted.wait, 1)
+
+
+async def test_client_disconnect_cancels_the_request(fake_db, monkeypatch):
+    import server
+
+    upstream = SlowUpstream(seconds=2)
+    monkeypatch.setattr(server.sheets_service, "_download", upstream)
+    monkeypatch.setattr(server.sheets_service, "health", UpstreamHealth())
+    monkeypatch.setattr(server.sheets_service, "_cache", {})
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api/sheets/sales-data", "raw_path": b"/api/sheets/sales-data",
+        "query_string": b"branch=Bhavani", "root_path": "", "server": ("testserver", 80), "client": ("test", 1),
+        "headers": [(b"host", b"testserver"), (b"authorization", b"Bearer test_session_token")]
+    }
+    incoming = [{"type": "http.request", "body": b"", "more_body": False}]
+    sent = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop()
+        await asyncio.sleep(0.1)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    started = time.perf_counter()
+    await server.app(scope, receive, send)
+    assert time.perf_counter() - started < 1
+    assert sent == []
+    assert await asyncio.to_thread(upstream.aborted.wait, 1)
@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from sheets_service import UpstreamHealth
+
+pytestmark = pytest.mark.anyio
+
+CSV = "Customer Name,Sales Date,Executive Name\n" + "".join(
+    f"C{i},2026-01-{i % 28 + 1:02d},{'Ravi' if i % 2 else 'Kumar'}\n" for i in range(2000)
+)
+
+
+def parse_server_timing(header):
+    phases = {}
+    for entry in header.split(","):
+        name, dur = entry.strip().split(";dur=")
+        phases[name] = float(dur)
+    return phases
+
+
+@pytest.fixture
+def sheets(monkeypatch):
+    import server
+
+    service = server.sheets_service
+
+    def slow_download(sheet_id, gid=0):
+        time.sleep(0.02)
+        return CSV
+
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    monkeypatch.setattr(service, "_tab_ttl", {})
+    monkeypatch.setattr(service, "_download", slow_download)
+    return service
+
+
+async def test_server_timing_breaks_down_phases(api_client, sheets):
+    res = await api_client.get("/api/sheets/sales-data", params={
+        "branch": "Bhavani", "executive": "Ravi", "start_date": "2026-01-01", "end_date": "2026-01-31"
+    })
+    assert res.status_code == 200
+    assert res.json()["total"] == 1000
+
+    phases = parse_server_timing(res.headers["Server-Timing"])
+    assert list(phases) == ["auth", "sheets", "parse", "filter", "serialize", "total"]
+    assert phases["sheets"] >= 20
+    assert all(value > 0 for value in phases.values())
+    assert phases["total"] >= phases["auth"] + phases["sheets"]
+
+    # Cached on the second call: no download or parse phase
+    res = await api_client.get("/api/sheets/sales-data", params={"branch": "Bhavani"})
+    phases = parse_server_timing(res.headers["Server-Timing"])
+    assert "sheets" not in phases and "parse" not in phases
+    assert {"auth", "filter", "serialize", "total"} <= set(phases)
+
+
+async def test_admin_profile_is_stored(api_client, sheets, fake_db):
+    res = await api_client.get("/api/sheets/sales-data", params={"branch": "Bhavani", "profile": "1"})
+    assert res.status_code == 200
+    profile_id = res.headers["X-Profile-Id"]
+
+    stored = fake_db.request_profiles.docs[0]
+    assert stored["profile_id"] == profile_id
+    assert stored["path"] == "/api/sheets/sales-data"
+    assert stored["samples"] > 0
+    assert "serialize" in stored["server_timing"]
+
+    res = await api_client.get(f"/api/admin/profiles/{profile_id}", params={"format": "folded"})
+    assert res.status_code == 200
+    # Collapsed stacks: "frame;frame;... count"
+    first = res.text.splitlines()[0]
+    assert first.startswith(("event-loop;", "worker-thread;"))
+    assert int(first.rsplit(" ", 1)[1]) > 0
+
+    listed = (await api_client.get("/api/admin/profiles")).json()["data"]
+    assert listed[0]["profile_id"] == profile_id
+    assert "folded" not in listed[0]
+
+
+async def test_profile_ignored_for_non_admins(api_client, sheets, fake_db):
+    fake_db.users.docs[0]["role"] = "user"
+    res = await api_client.get("/api/sheets/sales-data", params={"branch": "Bhavani", "profile": "1"})
+    assert res.status_code == 200
+    assert "X-Profile-Id" not in res.headers
+    assert "Server-Timing" in res.headers
+    assert fake_db.request_profiles.docs == []
@@ -0,0 +1,80 @@
+import pytest
+
+from session_tokens import SessionTokens, session_id
+from tests.conftest import TEST_SESSION_TOKEN, TEST_USER
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_token_authenticates_without_database(api_client, fake_db):
+    res = await api_client.get("/api/auth/me")
+    assert res.status_code == 200
+    token = res.headers["X-Access-Token"]
+
+    # With the token, neither sessions nor users are consulted
+    fake_db.user_sessions.docs.clear()
+    fake_db.users.docs.clear()
+    res = await api_client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert res.status_code == 200
+    assert res.json()["user_id"] == TEST_USER["user_id"]
+    assert res.json()["role"] == "admin"
+    assert "X-Access-Token" not in res.headers
+
+
+async def test_expired_token_is_refreshed_from_the_session(api_client, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server.session_tokens, "ttl", -10)
+    expired = server.session_tokens.issue(TEST_USER, TEST_SESSION_TOKEN)
+    monkeypatch.setattr(server.session_tokens, "ttl", 900)
+
+    res = await api_client.get("/api/auth/me", headers={"Authorization": f"Bearer {expired}"})
+    assert res.status_code == 401
+
+    res = await api_client.get("/api/auth/me", headers={
+        "Authorization": "",
+        "Cookie": f"session_token={TEST_SESSION_TOKEN}; access_token={expired}"
+    })
+    assert res.status_code == 200
+    fresh = res.headers["X-Access-Token"]
+    assert fresh != expired
+    assert server.session_tokens.verify(fresh)["sid"] == session_id(TEST_SESSION_TOKEN)
+
+
+async def test_logout_revokes_outstanding_tokens(api_client, fake_db):
+    import server
+
+    token = (await api_client.get("/api/auth/me")).headers["X-Access-Token"]
+    res = await api_client.post("/api/auth/logout", headers={
+        "Cookie": f"session_token={TEST_SESSION_TOKEN}; access_token={token}"
+    })
+    assert res.status_code == 200
+    assert fake_db.user_sessions.docs == []
+    res = await api_client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"})
+    assert res.status_code == 401
+
+    # Another worker learns about the revocation on its next sync
+    other = SessionTokens(ttl=900, secret=server.session_tokens.secret)
+    assert other.verify(token) is not None
+    await other.sync_revocations(fake_db)
+    assert other.verify(token) is None
+    server.session_tokens._revoked.clear()
+
+
+async def test_tokens_need_a_strong_explicit_secret(api_client, monkeypatch):
+    import jwt
+    import server
+    from auth import DEFAULT_JWT_SECRET
+
+    assert not SessionTokens(ttl=900, secret="").enabled
+    assert not SessionTokens(ttl=900, secret="short").enabled
+    assert not SessionTokens(ttl=900, secret=DEFAULT_JWT_SECRET).enabled
+
+    # Token mode off: a token signed with the committed default gets nobody in
+    monkeypatch.setattr(server.session_tokens, "secret", DEFAULT_JWT_SECRET)
+    forged = jwt.encode({"sub": "intruder", "role": "admin", "sid": "x"}, DEFAULT_JWT_SECRET, algorithm="HS256")
+    res = await api_client.get("/api/auth/me", headers={"Authorization": f"Bearer {forged}"})
+    assert res.status_code == 401
+    res = await api_client.get("/api/auth/me")
+    assert res.status_code == 200
+    assert "X-Access-Token" not in res.headers
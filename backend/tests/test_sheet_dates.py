@@ -0,0 +1,115 @@
+from datetime import date
+
+import pytest
+
+from sheet_dates import NO_DATE, DateNormalizer
+from sheets_service import UpstreamHealth
+
+
+def day(y, m, d):
+    return date(y, m, d).toordinal()
+
+
+def test_formats_are_detected_per_column():
+    normalizer = DateNormalizer()
+    # 03/04 alone is ambiguous; 25/04 settles the column as day-first
+    assert normalizer.detect_format(["03/04/2026", "25/04/2026"]) == "%d/%m/%Y"
+    assert normalizer.detect_format(["04/25/2026", "03/04/2026"]) == "%m/%d/%Y"
+    assert normalizer.detect_format(["05-Jan-2026", "17-Feb-2026"]) == "%d-%b-%Y"
+    assert normalizer.detect_format(["", None]) is None
+
+    assert normalizer.parse("03/04/2026", "%m/%d/%Y") == day(2026, 3, 4)
+    assert normalizer.parse("03/04/2026") == day(2026, 4, 3)
+    assert normalizer.parse("2026-01-05 10:30:00") == day(2026, 1, 5)
+    assert normalizer.parse("05/01/26") == day(2026, 1, 5)
+    assert normalizer.parse("soon") == NO_DATE
+
+
+def test_row_days_take_the_first_filled_column():
+    rows = [
+        {"Sales Date": "05/01/2026", "Date": ""},
+        {"Sales Date": "", "Date": "2026-02-07"},
+        {"Sales Date": "", "Date": ""},
+    ]
+    days = DateNormalizer().row_days(rows, ("Sales Date", "Date"))
+    assert list(days) == [day(2026, 1, 5), day(2026, 2, 7), NO_DATE]
+
+
+@pytest.mark.anyio
+async def test_date_filters_work_across_sheet_formats(api_client, monkeypatch):
+    import server
+
+    service = server.sheets_service
+    gids = service.BRANCH_GIDS
+    csv = {
+        ("Bhavani", gids["Bhavani"]["Sold"]): "Customer Name,Sales Date\nA,05/01/2026\nB,20/02/2026\nC,\n",
+        ("Anthiyur", gids["Anthiyur"]["Sold"]): "Customer Name,Sales Date\nD,12-Jan-2026\nE,2026-03-01\n",
+    }
+    by_sheet = {service.BRANCH_SHEETS[name]: name for name in ("Bhavani", "Anthiyur")}
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: csv.get((by_sheet.get(sheet_id), gid), "Date\n"))
+
+    res = await api_client.get("/api/sheets/sales-data", params={"start_date": "2026-01-01", "end_date": "2026-01-31"})
+    # Undated rows pass, as before
+    assert sorted(r["Customer Name"] for r in res.json()["data"]) == ["A", "C", "D"]
+    await server.tab_dates.settled()
+    assert server.tab_dates.select("Bhavani", "Sold", service.peek_tab("Bhavani", "Sold"), day(2026, 1, 1), day(2026, 1, 31)) is not None
+
+
+@pytest.mark.anyio
+async def test_index_answers_ranges_like_the_linear_filter():
+    import random
+
+    from sheet_dates import TabDates
+    from sheet_queries import DATE_FIELDS, filter_rows
+
+    rng = random.Random(7)
+    rows = []
+    for i in range(2000):
+        d = date.fromordinal(day(2022, 1, 1) + rng.randrange(4 * 365))
+        value = rng.choice([d.isoformat(), d.strftime("%d/%m/%Y"), ""])
+        rows.append({"Sales Date": value, "Customer Name": f"c{i}"})
+    index = TabDates(DateNormalizer(), DATE_FIELDS)
+    index.apply("Bhavani", "Sold", rows)
+
+    for start, end in [("2024-02-29", "2024-02-29"), ("2023-06-01", "2023-06-30"), ("2021-01-01", "2030-01-01")]:
+        linear = await filter_rows(rows, "Sold", start_date=start, end_date=end)
+        indexed = index.select("Bhavani", "Sold", rows, date.fromisoformat(start).toordinal(), date.fromisoformat(end).toordinal())
+        assert indexed == linear
+    # A stale copy of the tab is not answered from the index
+    assert index.select("Bhavani", "Sold", list(rows), 1, 2) is None
+
+
+@pytest.mark.anyio
+async def test_linear_filter_reads_dates_in_the_detected_column_format():
+    from sheet_dates import TabDates
+    from sheet_queries import DATE_FIELDS, filter_rows
+
+    # Month-first column: 03/05/2025 is March 5th here
+    rows = [{"Sales Date": value, "Customer Name": str(i)}
+            for i, value in enumerate(["01/31/2025", "02/15/2025", "03/05/2025", "12/25/2024"])]
+    index = TabDates(DateNormalizer(), DATE_FIELDS)
+    index.apply("Bhavani", "Sold", rows)
+
+    indexed = index.select("Bhavani", "Sold", rows, day(2025, 3, 1), day(2025, 3, 31))
+    linear = await filter_rows(rows, "Sold", start_date="2025-03-01", end_date="2025-03-31")
+    # A copy of the rows (as_of, stale index) detects the same format itself
+    copied = await filter_rows(list(rows), "Sold", start_date="2025-03-01", end_date="2025-03-31")
+    assert [r["Sales Date"] for r in indexed] == ["03/05/2025"]
+    assert linear == indexed == copied
+
+
+@pytest.mark.anyio
+async def test_index_is_built_off_the_event_loop():
+    from sheet_dates import TabDates
+    from sheet_queries import DATE_FIELDS
+
+    rows = [{"Sales Date": "2025-03-05"}, {"Sales Date": "2025-04-01"}]
+    index = TabDates(DateNormalizer(), DATE_FIELDS)
+    index.on_sheet_change("Bhavani", "Sold", rows)
+    # Not swapped in yet: callers filter row by row meanwhile
+    assert index.select("Bhavani", "Sold", rows, day(2025, 3, 1), day(2025, 3, 31)) is None
+
+    await index.settled()
+    assert index.select("Bhavani", "Sold", rows, day(2025, 3, 1), day(2025, 3, 31)) == rows[:1]
@@ -0,0 +1,157 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from sheet_history import SheetHistory, apply_splices, diff_rows
+from tests.fakes import FakeDB
+
+T0 = datetime(2026, 3, 1, 9, 0, tzinfo=timezone.utc)
+
+
+def row(i, **extra):
+    return {"Customer Name": f"c{i}", "Sales Date": "2026-03-01", **extra}
+
+
+def at(minutes):
+    return (T0 + timedelta(minutes=minutes)).timestamp()
+
+
+def test_splices_rebuild_every_kind_of_edit():
+    rng = random.Random(3)
+    rows = [row(i) for i in range(200)]
+    for _ in range(300):
+        new = list(rows)
+        action = rng.choice(["append", "edit", "delete", "insert", "shuffle"])
+        if action == "append":
+            new.extend(row(1000 + rng.randrange(1000)) for _ in range(rng.randrange(1, 5)))
+        elif action == "edit" and new:
+            for _ in range(rng.randrange(1, 4)):
+                i = rng.randrange(len(new))
+                new[i] = {**new[i], "Status": rng.choice(["Sold", "Lost"])}
+        elif action == "delete" and new:
+            del new[rng.randrange(len(new))]
+        elif action == "insert":
+            new.insert(rng.randrange(len(new) + 1), row(5000 + rng.randrange(1000)))
+        else:
+            rng.shuffle(new)
+        assert apply_splices(rows, diff_rows(rows, new)) == new
+        rows = new
+
+    # Appends and in-place edits only carry the changed rows
+    base = [row(i) for i in range(100)]
+    assert diff_rows(base, base + [row(100)]) == [(100, 0, [row(100)])]
+    edited = list(base)
+    edited[10] = row(10, Status="Lost")
+    edited[50] = row(50, Status="Sold")
+    assert diff_rows(base, edited) == [(10, 1, [edited[10]]), (50, 1, [edited[50]])]
+
+
+@pytest.mark.anyio
+async def test_versions_store_deltas_and_rebuild_any_point_in_time():
+    db = FakeDB()
+    history = SheetHistory(sheets=None, checkpoint_every=3, part_rows=4, cache_versions=0)
+    versions = []
+    rows = [row(i) for i in range(10)]
+    for minute in range(7):
+        if minute:
+            rows = rows + [row(100 + minute)]
+            rows[minute] = row(minute, Status="Lost")
+        versions.append(rows)
+        assert await history.record(db, "Bhavani", "Sold", rows, f"d{minute}", at(minute * 10)) == minute + 1
+
+    docs = db.sheet_versions.docs
+    kinds = sorted({(d["version"], d["kind"]) for d in docs})
+    assert [kind for _, kind in kinds] == ["checkpoint", "delta", "delta"] * 2 + ["checkpoint"]
+    # Checkpoints are split into parts; a delta holds just the appended and edited rows
+    assert len([d for d in docs if d["version"] == 1]) == 3
+    assert sum(len(s[2]) for d in docs if d["version"] == 2 for s in d["splices"]) == 2
+
+    # Same digest or an older fetch (a startup snapshot) adds nothing
+    assert await history.record(db, "Bhavani", "Sold", rows, "d6", at(100)) is None
+    assert await history.record(db, "Bhavani", "Sold", versions[2], "old", at(5)) is None
+
+    # A fresh process rebuilds every version from Mongo alone
+    reader = SheetHistory(sheets=None, checkpoint_every=3, cache_versions=2)
+    assert await reader.rows_as_of(db, "Bhavani", "Sold", T0 - timedelta(minutes=1)) is None
+    for minute, expected in enumerate(versions):
+        as_of = T0 + timedelta(minutes=minute * 10 + 5)
+        assert await reader.rows_as_of(db, "Bhavani", "Sold", as_of) == expected
+    # Naive times are read as UTC
+    assert await reader.rows_as_of(db, "Bhavani", "Sold", datetime(2026, 3, 1, 9, 15)) == versions[1]
+
+    # ... and keeps recording deltas after the latest version
+    rows = versions[-1] + [row(999)]
+    assert await reader.record(db, "Bhavani", "Sold", rows, "d7", at(70)) == 8
+    assert {d["kind"] for d in db.sheet_versions.docs if d["version"] == 8} == {"delta"}
+    assert await SheetHistory(sheets=None).rows_as_of(db, "Bhavani", "Sold", T0 + timedelta(hours=2)) == rows
+
+
+@pytest.mark.anyio
+async def test_sheet_endpoints_answer_as_of(api_client, fake_db, monkeypatch):
+    import server
+
+    history = server.sheet_history
+    monkeypatch.setattr(history, "_heads", {})
+    monkeypatch.setattr(history, "_versions", type(history._versions)())
+    before = [
+        {"Customer Name": "A", "Sales Date": "2026-02-01", "Branch": "Bhavani"},
+        {"Customer Name": "B", "Sales Date": "2026-02-03", "Branch": "Bhavani"},
+    ]
+    after = [before[0], {"Customer Name": "C", "Sales Date": "2026-02-04", "Branch": "Bhavani"}]
+    await history.record(fake_db, "Bhavani", "Sold", before, "v1", at(0))
+    await history.record(fake_db, "Bhavani", "Sold", after, "v2", at(60))
+
+    params = {"branch": "Bhavani", "as_of": (T0 + timedelta(minutes=30)).isoformat()}
+    res = await api_client.get("/api/sheets/sales-data", params=params)
+    assert [r["Customer Name"] for r in res.json()["data"]] == ["A", "B"]
+
+    res = await api_client.post("/api/sheets/batch", json={
+        "as_of": (T0 + timedelta(hours=2)).isoformat(),
+        "queries": [
+            {"id": "now", "tab": "Sold", "branch": "Bhavani"},
+            {"id": "then", "tab": "Sold", "branch": "Bhavani", "as_of": params["as_of"], "aggregate": {}},
+            {"id": "before", "tab": "Sold", "branch": "Bhavani", "as_of": "2020-01-01T00:00:00Z"},
+        ],
+    })
+    results = {r["id"]: r for r in res.json()["results"]}
+    assert [r["Customer Name"] for r in results["now"]["data"]] == ["A", "C"]
+    assert results["then"]["aggregate"]["count"] == 2
+    assert results["before"]["total"] == 0
+
+    enquiry = [{"Customer Name": "A", "Mobile No": "9876543210", "Vehicle Model": "Jupiter", "Enquiry Date": "2026-01-20"}]
+    await history.record(fake_db, "Bhavani", "Enquiry", enquiry, "e1", at(10))
+    res = await api_client.get("/api/funnel", params=params)
+    assert res.json()["enquiries"] == 1
+    res = await api_client.get("/api/funnel", params={**params, "as_of": T0.isoformat()})
+    assert res.json()["enquiries"] == 0
+
+
+@pytest.mark.anyio
+async def test_inventory_and_target_views_answer_as_of(api_client, fake_db, monkeypatch):
+    import server
+
+    history = server.sheet_history
+    monkeypatch.setattr(history, "_heads", {})
+    monkeypatch.setattr(history, "_versions", type(history._versions)())
+    stock = [{"Vehicle Model": "Jupiter", "Colour": "Black", "Received Date": "2026-02-20"}]
+    await history.record(fake_db, "Bhavani", "Stock", stock * 3, "s1", at(0))
+    await history.record(fake_db, "Bhavani", "Stock", stock, "s2", at(60))
+    sold = [{"Sales Date": "2026-02-27", "Executive Name": "Ravi", "Vehicle Model": "Jupiter"}]
+    await history.record(fake_db, "Bhavani", "Sold", sold, "d1", at(10))
+    await history.record(fake_db, "Bhavani", "Sold", sold * 4, "d2", at(70))
+
+    then = (T0 + timedelta(minutes=30)).isoformat()
+    res = await api_client.get("/api/inventory/locate", params={"model": "Jupiter", "as_of": then})
+    assert res.json()["branches"] == {"Bhavani": 3}
+    summary = (await api_client.get("/api/inventory/summary", params={"as_of": then})).json()
+    assert summary["branches"]["Bhavani"]["age_buckets"]["0-30"] == 3
+    res = await api_client.get("/api/inventory/locate", params={"model": "Jupiter", "as_of": (T0 + timedelta(hours=2)).isoformat()})
+    assert res.json()["branches"] == {"Bhavani": 1}
+
+    progress = (await api_client.get("/api/targets/progress", params={"month": "2026-02", "as_of": then})).json()
+    assert progress["company"]["sales"]["actual"] == 1
+    board = (await api_client.get("/api/targets/leaderboard", params={"as_of": (T0 + timedelta(hours=2)).isoformat()})).json()
+    assert board["month"] == "2026-03"
+    progress = (await api_client.get("/api/targets/progress", params={"month": "2026-02", "as_of": (T0 + timedelta(hours=2)).isoformat()})).json()
+    assert progress["company"]["sales"]["actual"] == 4
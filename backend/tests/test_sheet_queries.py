@@ -0,0 +1,57 @@
+import pytest
+
+from sheet_queries import aggregate, filter_rows, parse_amount
+from sheets_service import UpstreamHealth
+
+pytestmark = pytest.mark.anyio
+
+SOLD = [
+    {"Customer Name": "Arun", "Mobile No": "98400", "Vehicle Model": "Jupiter", "Sales Date": "2026-01-05", "Executive Name": "Ravi", "Document Charges": "Rs. 1,200"},
+    {"Customer Name": "Bala", "Mobile No": "98401", "Vehicle Model": "Ronin", "Date": "2026-02-10", "Executive Name": "Meena", "Document Charges": "800"},
+    {"Customer Name": "Chitra", "Mobile No": "98402", "Vehicle Model": "Jupiter", "Executive Name": "Ravi", "Document Charges": ""},
+]
+
+
+async def test_filters_follow_each_tabs_rules():
+    assert [r["Customer Name"] for r in await filter_rows(SOLD, "Sold", start_date="2026-01-01", end_date="2026-01-31")] == ["Arun", "Chitra"]
+    assert [r["Customer Name"] for r in await filter_rows(SOLD, "Sold", search="JUPITER", executive="Ravi")] == ["Arun", "Chitra"]
+    # Sold searches customer/mobile/model only; other tabs search the whole record
+    assert await filter_rows(SOLD, "Sold", search="meena") == []
+    assert len(await filter_rows(SOLD, "Enquiry", search="meena")) == 1
+
+
+def test_aggregates():
+    assert parse_amount("Rs. 1,200") == 1200.0 and parse_amount("") == 0.0
+    assert aggregate(SOLD, group_by="Vehicle Model", sums=["Document Charges"]) == {
+        "count": 3, "sums": {"Document Charges": 2000.0}, "groups": {"Jupiter": 2, "Ronin": 1}
+    }
+
+
+async def test_batch_runs_sub_queries_in_one_request(api_client, monkeypatch):
+    import server
+
+    service = server.sheets_service
+    gids = service.BRANCH_GIDS["Bhavani"]
+    csv = {
+        gids["Sold"]: "Sales Date,Vehicle Model,Executive Name\n2026-01-05,Jupiter,Ravi\n2026-02-01,Ronin,Meena\n",
+        gids["Enquiry"]: "Enquiry Date,Vehicle Model\n2026-01-02,Jupiter\n",
+    }
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: csv.get(gid, "Date\n") if sheet_id == service.BRANCH_SHEETS["Bhavani"] else "Date\n")
+
+    res = await api_client.post("/api/sheets/batch", json={"queries": [
+        {"id": "sold", "tab": "Sold", "branch": "Bhavani", "executive": "Ravi"},
+        {"id": "enq", "tab": "Enquiry", "branch": "Bhavani"},
+        {"id": "models", "tab": "Sold", "aggregate": {"group_by": "Vehicle Model"}},
+    ]})
+    assert res.status_code == 200
+    sold, enquiry, models = res.json()["results"]
+    assert (sold["id"], sold["total"], sold["data"][0]["Vehicle Model"]) == ("sold", 1, "Jupiter")
+    assert enquiry["total"] == 1 and enquiry["data"][0]["Branch"] == "Bhavani"
+    # Every branch merged, aggregated instead of returned
+    assert "data" not in models
+    assert models["aggregate"] == {"count": 2, "groups": {"Jupiter": 1, "Ronin": 1}}
+
+    res = await api_client.post("/api/sheets/batch", json={"queries": [{"tab": "Payroll"}]})
+    assert res.status_code == 422
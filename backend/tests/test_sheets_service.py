@@ -0,0 +1,270 @@
+import pytest
+
+from sheets_service import SheetsService, UpstreamHealth
+
+pytestmark = pytest.mark.anyio
+
+CSV = "Customer Name,Sales Date\nA,2026-01-02\nB,2026-01-03\n"
+
+
+class FlakyUpstream:
+    def __init__(self):
+        self.calls = 0
+        self.failing = False
+
+    def __call__(self, sheet_id, gid=0):
+        self.calls += 1
+        if self.failing:
+            raise RuntimeError("HTTP 503")
+        return CSV
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    return FlakyUpstream()
+
+
+@pytest.fixture
+def service(upstream, monkeypatch):
+    service = SheetsService()
+    service.health = UpstreamHealth(down_after=2, base_backoff=60, max_backoff=600)
+    monkeypatch.setattr(service, "_download", upstream)
+    monkeypatch.setattr(service, "_schedule_probe", lambda: None)
+    return service
+
+
+async def test_reads_do_not_probe_before_downloading(service, upstream):
+    rows = await service.get_sales_data('Bhavani')
+    assert len(rows) == 2
+    assert upstream.calls == 1
+
+
+async def test_circuit_opens_and_serves_cache(service, upstream):
+    await service.get_tab('Bhavani', 'Sold')
+    upstream.failing = True
+
+    # degraded: still tries upstream, but keeps the last good copy
+    rows = await service.get_tab('Bhavani', 'Sold', max_age=0)
+    assert len(rows) == 2
+    assert service.health.state == UpstreamHealth.DEGRADED
+
+    await service.get_tab('Bhavani', 'Sold', max_age=0)
+    assert service.health.state == UpstreamHealth.DOWN
+    assert not service.connected
+    calls = upstream.calls
+
+    # down: fail fast from cache, or empty, without touching the upstream
+    assert len(await service.get_tab('Bhavani', 'Sold', max_age=0)) == 2
+    assert await service.get_tab('Anthiyur', 'Sold') == []
+    assert upstream.calls == calls
+
+
+async def test_half_open_trial_backs_off_then_recovers(service, upstream):
+    upstream.failing = True
+    await service.get_tab('Bhavani', 'Sold')
+    await service.get_tab('Bhavani', 'Sold')
+    assert service.health.state == UpstreamHealth.DOWN
+
+    # Backoff elapsed: exactly one trial goes through, and failing it doubles the backoff
+    service.health.next_probe_at = 0
+    await service.get_tab('Bhavani', 'Sold')
+    assert service.health.backoff == 120
+    calls = upstream.calls
+    await service.get_tab('Bhavani', 'Sold')
+    assert upstream.calls == calls
+
+    upstream.failing = False
+    service.health.next_probe_at = 0
+    assert await service.connect()
+    assert service.health.state == UpstreamHealth.HEALTHY
+    assert service.health.backoff == 60
+    assert service.peek_tab('Bhavani', 'Sold')
+
+
+async def test_snapshot_restores_warm_cache(service, upstream, tmp_path, monkeypatch):
+    import asyncio
+    import json
+    import os
+
+    service.SNAPSHOT_PATH = str(tmp_path / "sheets.snap")
+    rows = [{"Customer Name": f"C{i}", "Sales Date": "2026-01-02", "Vehicle Model": "Jupiter"} for i in range(500)]
+    upstream_csv = "Customer Name,Sales Date,Vehicle Model\n" + "".join(
+        f"{r['Customer Name']},{r['Sales Date']},{r['Vehicle Model']}\n" for r in rows
+    )
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: upstream_csv)
+    await service.get_tab('Bhavani', 'Sold')
+    await asyncio.to_thread(service.save_snapshot)
+
+    cached = service.peek_tab('Bhavani', 'Sold')
+    assert os.path.getsize(service.SNAPSHOT_PATH) < len(json.dumps(cached)) / 5
+
+    # A fresh process starts warm without touching the upstream
+    restarted = SheetsService()
+    restarted.SNAPSHOT_PATH = service.SNAPSHOT_PATH
+    restarted_upstream = FlakyUpstream()
+    monkeypatch.setattr(restarted, "_download", restarted_upstream)
+    seen = []
+    restarted.add_listener(lambda branch, tab, data: seen.append((branch, tab, len(data))))
+
+    assert await restarted.load_snapshot() == 1
+    assert seen == [('Bhavani', 'Sold', 500)]
+    assert await restarted.get_tab('Bhavani', 'Sold') == cached
+    assert restarted_upstream.calls == 0
+
+    # Once past the TTL the snapshot copy is still served, and refreshed behind the request
+    restarted.CACHE_TTL = 0
+    assert await restarted.get_tab('Bhavani', 'Sold') == cached
+    await asyncio.gather(*restarted._refreshing.values())
+    assert restarted_upstream.calls == 1
+    assert len(restarted.peek_tab('Bhavani', 'Sold')) == 2
+
+
+async def test_snapshot_with_other_format_is_ignored(service, tmp_path, monkeypatch):
+    import sheet_snapshot
+
+    service.SNAPSHOT_PATH = str(tmp_path / "sheets.snap")
+    monkeypatch.setattr(sheet_snapshot, "FORMAT_VERSION", 0)
+    sheet_snapshot.write_snapshot(service.SNAPSHOT_PATH, {
+        ('Bhavani', 'Sold'): {"rows": [{"a": "1"}], "digest": "x", "fetched_at": 0}
+    }, 0)
+    monkeypatch.setattr(sheet_snapshot, "FORMAT_VERSION", 1)
+
+    assert await service.load_snapshot() == 0
+    assert service.peek_tab('Bhavani', 'Sold') is None
+
+
+WORKER = """
+import asyncio, os, sys, time
+from sheets_service import SheetsService
+
+service = SheetsService()
+
+def slow_download(sheet_id, gid=0):
+    with open(os.environ["DOWNLOAD_LOG"], "a") as log:
+        log.write("x")
+    time.sleep(0.3)
+    return "Customer Name,Sales Date\\nA,2026-01-02\\n"
+
+service._download = slow_download
+rows = asyncio.run(service.get_tab("Bhavani", "Sold"))
+print(len(rows))
+"""
+
+
+def test_workers_share_one_upstream_fetch(tmp_path):
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    log = tmp_path / "downloads.log"
+    env = {
+        **os.environ,
+        "SHEETS_SHARED_CACHE_DIR": str(tmp_path / "shared"),
+        "SHEETS_SNAPSHOT_PATH": "",
+        "DOWNLOAD_LOG": str(log)
+    }
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", WORKER],
+            cwd=Path(__file__).resolve().parent.parent,
+            env=env,
+            stdout=subprocess.PIPE,
+            text=True
+        )
+        for _ in range(4)
+    ]
+    outputs = [w.communicate(timeout=60)[0].strip() for w in workers]
+
+    assert outputs == ["1"] * 4
+    assert log.read_text() == "x"
+
+
+async def test_circuit_open_worker_reads_shared_copy(service, upstream, tmp_path):
+    from shared_cache import SharedSheetCache
+
+    service.shared = SharedSheetCache(str(tmp_path))
+    other_worker = SharedSheetCache(str(tmp_path))
+    upstream.failing = True
+    await service.get_tab('Bhavani', 'Sold')
+    await service.get_tab('Bhavani', 'Sold')
+    assert service.health.state == UpstreamHealth.DOWN
+
+    # Another worker still reaches Google and publishes the tab
+    other_worker.fetch('Bhavani', 'Sold', 60, lambda: CSV, service._parse)
+    calls = upstream.calls
+    assert len(await service.get_tab('Bhavani', 'Sold')) == 2
+    assert upstream.calls == calls
+
+
+def test_shared_lock_wait_honours_the_fetch_budget(tmp_path):
+    import contextvars
+    import fcntl
+    import time
+
+    from request_deadline import FetchAborted, FetchBudget, use_fetch_budget
+    from shared_cache import SharedSheetCache
+
+    cache = SharedSheetCache(str(tmp_path), lock_wait=0.2, poll_interval=0.01)
+    downloads = []
+
+    def download():
+        downloads.append(1)
+        return CSV
+
+    parse = SheetsService()._parse
+    with open(cache._path('Bhavani', 'Sold') + ".lock", "a") as holder:
+        # Another worker holds the tab's lock and never finishes
+        fcntl.flock(holder, fcntl.LOCK_EX)
+        with pytest.raises(TimeoutError):
+            cache.fetch('Bhavani', 'Sold', 0, download, parse)
+
+        # Run as the fetch task would, with the budget in its context
+        budget = FetchBudget(time.monotonic() + 0.05)
+        context = contextvars.copy_context()
+        context.run(use_fetch_budget, budget)
+        with pytest.raises(FetchAborted):
+            context.run(cache.fetch, 'Bhavani', 'Sold', 0, download, parse)
+        fcntl.flock(holder, fcntl.LOCK_UN)
+
+        # With a copy on disk, a waiter that gives up answers from it
+        cache.fetch('Bhavani', 'Sold', 0, download, parse)
+        fcntl.flock(holder, fcntl.LOCK_EX)
+        budget.cancel()
+        data, downloaded = context.run(cache.fetch, 'Bhavani', 'Sold', 0, download, parse)
+        assert (len(data['rows']), downloaded) == (2, False)
+    assert len(downloads) == 1
+
+
+def test_forced_refreshes_are_single_flight_across_workers(tmp_path):
+    import fcntl
+    import threading
+    import time
+
+    from shared_cache import SharedSheetCache
+    from sheet_snapshot import write_snapshot
+
+    cache = SharedSheetCache(str(tmp_path), poll_interval=0.01)
+    parse = SheetsService()._parse
+    downloads = []
+
+    def download():
+        downloads.append(1)
+        return CSV
+
+    cache.fetch('Bhavani', 'Sold', 0, download, parse)
+    results = []
+    with open(cache._path('Bhavani', 'Sold') + ".lock", "a") as holder:
+        fcntl.flock(holder, fcntl.LOCK_EX)
+        waiter = threading.Thread(target=lambda: results.append(cache.fetch('Bhavani', 'Sold', 0, download, parse)))
+        waiter.start()
+        time.sleep(0.05)
+        # The lock holder's refresh lands while the other probe waits
+        rows = parse(CSV)
+        write_snapshot(cache._path('Bhavani', 'Sold'), {('Bhavani', 'Sold'): {"digest": "new", "fetched_at": time.time(), "rows": rows}}, time.time())
+        fcntl.flock(holder, fcntl.LOCK_UN)
+        waiter.join(5)
+
+    data, downloaded = results[0]
+    assert (data['digest'], downloaded) == ("new", False)
+    assert len(downloads) == 1
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from sheets_service import UpstreamHealth
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+HEAVY_MODULES = ["PyPDF2", "emergentintegrations", "litellm"]
+
+COLD_IMPORT = """
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed = time.perf_counter() - started
+print(json.dumps({"import_s": elapsed, "loaded": [m for m in %r if m in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+def test_cold_import_skips_heavy_modules(record_property):
+    result = subprocess.run(
+        [sys.executable, "-c", COLD_IMPORT],
+        cwd=BACKEND_DIR,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    measured = json.loads(result.stdout.strip().splitlines()[-1])
+    record_property("cold_import_s", round(measured["import_s"], 3))
+    print(f"cold import of server.py: {measured['import_s'] * 1000:.0f} ms")
+
+    assert measured["loaded"] == []
+    assert measured["import_s"] < 5
+
+
+@pytest.mark.anyio
+async def test_startup_does_not_wait_for_sheets(fake_db, monkeypatch, record_property):
+    import httpx
+    import server
+
+    probe_released = asyncio.Event()
+
+    async def slow_connect():
+        await probe_released.wait()
+        return True
+
+    async def no_tab_fetch(branch, tab, max_age=None):
+        return []
+
+    monkeypatch.setattr(server.sheets_service, "health", UpstreamHealth())
+    monkeypatch.setattr(server.sheets_service, "warmup_state", "pending")
+    monkeypatch.setattr(server.sheets_service, "connect", slow_connect)
+    monkeypatch.setattr(server.sheets_service, "get_tab", no_tab_fetch)
+    monkeypatch.setattr(server.sheet_sync, "run", asyncio.Event().wait)
+
+    started = time.perf_counter()
+    await server.startup_event()
+    startup_s = time.perf_counter() - started
+    record_property("startup_event_s", round(startup_s, 4))
+    assert startup_s < 0.1
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        res = await client.get("/api/health/ready")
+        assert res.status_code == 503
+        assert res.json()["sheets"]["warmup"] in ("pending", "probing")
+
+        probe_released.set()
+        while server.sheets_service.warmup_state != "ready":
+            await asyncio.sleep(0.01)
+
+        res = await client.get("/api/health/ready")
+        assert res.status_code == 200
+        assert res.json()["sheets"]["warmup"] == "ready"
+
+    # The registry watcher and sync scheduler run until shutdown
+    for task in server.app.state.background_tasks:
+        task.cancel()
+    await asyncio.gather(*server.app.state.background_tasks, return_exceptions=True)
@@ -0,0 +1,131 @@
+from datetime import date
+
+import pytest
+
+from sheets_service import UpstreamHealth
+from targets import TargetTracker, month_days
+
+SOLD = [
+    {"Sales Date": "2026-03-02", "Executive Name": "Ravi"},
+    {"Sales Date": "2026-03-05", "Executive Name": "Ravi"},
+    {"Sales Date": "04/03/2026", "Executive Name": "Kumar"},
+    {"Sales Date": "2026-02-27", "Executive Name": "Kumar"},
+]
+TODAY = date(2026, 3, 10)
+
+
+def test_counters_follow_sheet_changes():
+    tracker = TargetTracker()
+    tracker.on_sheet_change("Bhavani", "Sold", SOLD)
+    tracker.on_sheet_change("Anthiyur", "Sold", [{"Sales Date": "2026-03-07", "Executive Name": "Ravi"}])
+    tracker.put({"id": "t1", "month": "2026-03", "branch_id": "Bhavani", "executive_id": None,
+                 "enquiry_target": 0, "booking_target": 10, "sales_target": 20})
+
+    progress = tracker.progress("2026-03", today=TODAY)
+    assert progress["company"]["sales"]["actual"] == 4
+    bhavani = progress["branches"][1]
+    assert bhavani["branch"] == "Bhavani"
+    # 3 sales in 10 days of a 31-day month -> 9 projected
+    assert bhavani["sales"] == {"actual": 3, "target": 20, "achieved_pct": 15.0, "projected": 9, "projected_pct": 45.0}
+    assert bhavani["enquiry"]["achieved_pct"] is None
+    assert tracker.progress("2026-03", today=TODAY) is progress
+
+    # A row moves month and another executive drops out: counters adjust by the difference
+    tracker.on_sheet_change("Bhavani", "Sold", SOLD[:2] + [{"Sales Date": "2026-02-01", "Executive Name": "Kumar"}])
+    progress = tracker.progress("2026-03", today=TODAY)
+    assert progress["company"]["sales"]["actual"] == 3
+    assert [(e["branch"], e["executive"]) for e in progress["executives"]] == [("Anthiyur", "Ravi"), ("Bhavani", "Ravi")]
+    assert tracker.progress("2026-02", today=TODAY)["company"]["sales"]["actual"] == 1
+
+
+def test_leaderboard_ranks_by_achievement():
+    tracker = TargetTracker()
+    tracker.on_sheet_change("Bhavani", "Sold", SOLD)
+    tracker.on_sheet_change("Anthiyur", "Sold", [{"Sales Date": "2026-03-07", "Executive Name": "Ravi"}])
+    tracker.put({"id": "t1", "month": "2026-03", "branch_id": None, "executive_id": "Ravi",
+                 "enquiry_target": 0, "booking_target": 0, "sales_target": 10})
+    tracker.put({"id": "t2", "month": "2026-03", "branch_id": "Bhavani", "executive_id": "Kumar",
+                 "enquiry_target": 0, "booking_target": 0, "sales_target": 2})
+
+    board = tracker.leaderboard("2026-03", "sales", today=TODAY)
+    # Ravi's all-branch target counts both branches
+    assert [(row["executive"], row["branch"], row["actual"], row["achieved_pct"]) for row in board] == [
+        ("Kumar", "Bhavani", 1, 50.0), ("Ravi", None, 3, 30.0)
+    ]
+    assert month_days("2026-02", TODAY) == (28, 28)
+    assert month_days("2026-04", TODAY) == (0, 30)
+
+
+@pytest.mark.anyio
+async def test_target_crud_and_progress(api_client, fake_db, monkeypatch):
+    import server
+
+    service = server.sheets_service
+    sold_gid = service.BRANCH_GIDS["Bhavani"]["Sold"]
+    month = server._current_month()
+    csv = f"Sales Date,Executive Name\n{month}-01,Ravi\n{month}-01,Kumar\n"
+    monkeypatch.setattr(service, "health", UpstreamHealth())
+    monkeypatch.setattr(service, "_cache", {})
+    monkeypatch.setattr(service, "_download", lambda sheet_id, gid=0: csv if sheet_id == service.BRANCH_SHEETS["Bhavani"] and gid == sold_gid else "Date\n")
+    server.target_tracker.__init__()
+
+    body = {"month": month, "branch_id": "Bhavani", "executive_id": "Ravi", "enquiry_target": 5, "booking_target": 3, "sales_target": 4}
+    res = await api_client.post("/api/targets", json=body)
+    assert res.status_code == 200
+    target_id = res.json()["id"]
+    assert (await api_client.post("/api/targets", json=body)).status_code == 409
+    assert (await api_client.post("/api/targets", json={**body, "month": "2026-13"})).status_code == 422
+
+    res = await api_client.put(f"/api/targets/{target_id}", json={**body, "sales_target": 2})
+    assert res.json()["sales_target"] == 2
+    assert fake_db.targets.docs[0]["sales_target"] == 2
+
+    board = (await api_client.get("/api/targets/leaderboard")).json()["data"]
+    assert [(row["executive"], row["achieved_pct"]) for row in board] == [("Ravi", 50.0), ("Kumar", None)]
+    progress = (await api_client.get("/api/targets/progress", params={"month": month})).json()
+    assert progress["company"]["sales"]["actual"] == 2
+
+    assert (await api_client.delete(f"/api/targets/{target_id}")).status_code == 200
+    assert (await api_client.delete(f"/api/targets/{target_id}")).status_code == 404
+    assert (await api_client.get("/api/targets")).json()["total"] == 0
+
+    fake_db.users.docs[0]["role"] = "user"
+    assert (await api_client.post("/api/targets", json=body)).status_code == 403
+
+
+def test_actuals_read_month_first_and_named_month_dates():
+    tracker = TargetTracker()
+    tracker.on_sheet_change("Bhavani", "Sold", [
+        {"Sales Date": "03/05/2026", "Executive Name": "Ravi"},
+        {"Sales Date": "03/25/2026", "Executive Name": "Ravi"},
+    ])
+    tracker.on_sheet_change("Bhavani", "Enquiry", [{"Enquiry Date": "12-Mar-2026", "Executive Name": "Ravi"}])
+    company = tracker.progress("2026-03", today=TODAY)["company"]
+    assert (company["sales"]["actual"], company["enquiry"]["actual"]) == (2, 1)
+
+
+@pytest.mark.anyio
+async def test_targets_written_by_other_workers(api_client, fake_db, monkeypatch):
+    from pymongo.errors import DuplicateKeyError
+
+    import server
+
+    server.target_tracker.__init__(reload_interval=0)
+    body = {"month": "2026-03", "branch_id": "Bhavani", "enquiry_target": 5, "booking_target": 3, "sales_target": 4}
+    assert (await api_client.get("/api/targets")).json()["total"] == 0
+
+    # Another worker stores a target: this one sees it on its next reload
+    fake_db.targets.docs.append({"id": "t-other", "executive_id": None, **body})
+    targets = (await api_client.get("/api/targets")).json()["data"]
+    assert [t["id"] for t in targets] == ["t-other"]
+    fake_db.targets.docs.clear()
+    assert (await api_client.get("/api/targets")).json()["total"] == 0
+
+    # A duplicate the local copy cannot know about is caught by the unique scope index
+    async def duplicate(doc):
+        raise DuplicateKeyError("E11000 duplicate key")
+
+    monkeypatch.setattr(fake_db.targets, "insert_one", duplicate)
+    res = await api_client.post("/api/targets", json=body)
+    assert res.status_code == 409
+    assert res.json()["detail"] == "A target for this scope already exists"
@@ -10,6 +10,8 @@ import { Button } from './ui/button';
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from './ui/select';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
+import { fetchBranches, useBranches } from '../hooks/use-branches';
+import { dayToIso, inDateRange, toDay, weekKey } from '../lib/dates';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -48,7 +50,7 @@ const Dashboard = ({ user, onLogout }) => {
   const [drillDownData, setDrillDownData] = useState(null);
   const [drillDownTitle, setDrillDownTitle] = useState('');
 
-  const branches = ['Kumarapalayam', 'Kavindapadi', 'Ammapettai', 'Anthiyur', 'Bhavani'];
+  const branches = useBranches();
 
   useEffect(() => {
     const savedBranch = localStorage.getItem('selectedBranch') || 'all';
@@ -73,39 +75,20 @@ const Dashboard = ({ user, onLogout }) => {
     
     setLoading(true);
     try {
-      if (selectedBranch === 'all') {
-        // Fetch data from all branches
-        const allBranches = ['Kumarapalayam', 'Kavindapadi', 'Ammapettai', 'Anthiyur', 'Bhavani'];
-        const results = await Promise.all(
-          allBranches.map(async (branch) => {
-            const [salesRes, enquiryRes, bookingsRes] = await Promise.all([
-              axios.get(`${API}/sheets/sales-data`, { params: { branch } }),
-              axios.get(`${API}/sheets/enquiry-data`, { params: { branch } }),
-              axios.get(`${API}/sheets/bookings-data`, { params: { branch } })
-            ]);
-            return {
-              sales: salesRes.data.data || [],
-              enquiry: enquiryRes.data.data || [],
-              bookings: bookingsRes.data.data || []
-            };
-          })
-        );
-        
-        // Combine all data
-        setSalesData(results.flatMap(r => r.sales));
-        setEnquiryData(results.flatMap(r => r.enquiry));
-        setBookingsData(results.flatMap(r => r.bookings));
-      } else {
-        // Fetch data from specific branch
-        const [salesRes, enquiryRes, bookingsRes] = await Promise.all([
-          axios.get(`${API}/sheets/sales-data`, { params: { branch: selectedBranch } }),
-          axios.get(`${API}/sheets/enquiry-data`, { params: { branch: selectedBranch } }),
-          axios.get(`${API}/sheets/bookings-data`, { params: { branch: selectedBranch } })
-        ]);
-        setSalesData(salesRes.data.data || []);
-        setEnquiryData(enquiryRes.data.data || []);
-        setBookingsData(bookingsRes.data.data || []);
-      }
+      // One batch request: 3 tabs for the selected branch, or for every branch
+      const branchList = selectedBranch === 'all' ? await fetchBranches() : [selectedBranch];
+      const queries = branchList.flatMap((branch) => [
+        { tab: 'Sold', branch },
+        { tab: 'Enquiry', branch },
+        { tab: 'Bookings', branch }
+      ]);
+      const response = await axios.post(`${API}/sheets/batch`, { queries });
+      const rowsFor = (tab) => response.data.results
+        .filter((result) => result.tab === tab)
+        .flatMap((result) => result.data || []);
+      setSalesData(rowsFor('Sold'));
+      setEnquiryData(rowsFor('Enquiry'));
+      setBookingsData(rowsFor('Bookings'));
       setLastSync(new Date());
     } catch (error) {
       console.error('Failed to fetch data:', error);
@@ -150,10 +133,7 @@ const Dashboard = ({ user, onLogout }) => {
     // Filter sales data
     let filteredSales = [...salesData];
     if (startDate && endDate) {
-      filteredSales = filteredSales.filter(record => {
-        const saleDate = record['Sales Date'];
-        return saleDate && saleDate >= startDate && saleDate <= endDate;
-      });
+      filteredSales = filteredSales.filter(record => inDateRange(record['Sales Date'], startDate, endDate));
     }
     if (selectedExecutive !== 'all') {
       filteredSales = filteredSales.filter(record => record['Executive Name'] === selectedExecutive);
@@ -165,19 +145,13 @@ const Dashboard = ({ user, onLogout }) => {
     // Filter enquiry data
     let filteredEnquiry = [...enquiryData];
     if (startDate && endDate) {
-      filteredEnquiry = filteredEnquiry.filter(record => {
-        const date = record['Date'] || record['Enquiry Date'];
-        return date && date >= startDate && date <= endDate;
-      });
+      filteredEnquiry = filteredEnquiry.filter(record => inDateRange(record['Date'] || record['Enquiry Date'], startDate, endDate));
     }
 
     // Filter bookings data
     let filteredBookings = [...bookingsData];
     if (startDate && endDate) {
-      filteredBookings = filteredBookings.filter(record => {
-        const date = record['Booking Date'] || record['Date'];
-        return date && date >= startDate && date <= endDate;
-      });
+      filteredBookings = filteredBookings.filter(record => inDateRange(record['Booking Date'] || record['Date'], startDate, endDate));
     }
 
     // Calculate stats
@@ -199,6 +173,7 @@ const Dashboard = ({ user, onLogout }) => {
     }, 0);
 
     setStats({ totalSales, totalEnquiries, totalBookings, conversionRate, totalDCCollected, totalDiscountOperated });
+    fetchFunnelConversion();
 
     // Calculate Sales Trend
     calculateTrend(filteredSales, 'Sales Date', 'Executive Name', setSalesTrendData);
@@ -210,6 +185,25 @@ const Dashboard = ({ user, onLogout }) => {
     calculateTrend(filteredBookings, 'Booking Date', 'Executive', setBookingsTrendData, true);
   };
 
+  // True conversion: enquiries matched to their sale by mobile number and model
+  const fetchFunnelConversion = async () => {
+    try {
+      const params = {};
+      if (selectedBranch !== 'all') params.branch = selectedBranch;
+      if (startDate && endDate) {
+        params.start_date = startDate;
+        params.end_date = endDate;
+      }
+      if (selectedExecutive !== 'all') params.executive = selectedExecutive;
+      const res = await axios.get(`${API}/funnel`, { params });
+      if (res.data.enquiries > 0) {
+        setStats(prev => ({ ...prev, conversionRate: res.data.conversion_rate.toFixed(1) }));
+      }
+    } catch (error) {
+      console.error('Failed to fetch funnel:', error);
+    }
+  };
+
   const calculateTrend = (data, dateField, groupField, setTrendData, simpleCount = false) => {
     const dateMap = {};
     const groups = new Set();
@@ -218,16 +212,15 @@ const Dashboard = ({ user, onLogout }) => {
       const group = simpleCount ? 'Count' : (record[groupField] || 'Unknown');
       groups.add(group);
       
-      let dateStr = record[dateField] || record['Date'] || '';
-      let groupKey = dateStr;
+      const dateStr = record[dateField] || record['Date'] || '';
+      // Day number parsed once per distinct string, whatever the sheet's date format
+      const day = toDay(dateStr);
+      let groupKey = day === null ? dateStr : dayToIso(day);
       
-      if (trendPeriod === 'weekly' && dateStr) {
-        const date = new Date(dateStr);
-        const startOfYear = new Date(date.getFullYear(), 0, 1);
-        const weekNum = Math.ceil((((date - startOfYear) / 86400000) + startOfYear.getDay() + 1) / 7);
-        groupKey = `W${weekNum}`;
-      } else if (trendPeriod === 'monthly' && dateStr) {
-        groupKey = dateStr.substring(0, 7);
+      if (trendPeriod === 'weekly' && day !== null) {
+        groupKey = weekKey(day);
+      } else if (trendPeriod === 'monthly' && day !== null) {
+        groupKey = groupKey.substring(0, 7);
       }
 
       if (groupKey) {
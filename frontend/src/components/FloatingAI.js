@@ -15,9 +15,31 @@ const FloatingAI = () => {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
   const [loading, setLoading] = useState(false);
-  const [sessionId, setSessionId] = useState(null);
+  const [sessionId, setSessionId] = useState(() => localStorage.getItem('aiSessionId'));
   const messagesEndRef = useRef(null);
 
+  useEffect(() => {
+    if (sessionId) {
+      localStorage.setItem('aiSessionId', sessionId);
+    } else {
+      localStorage.removeItem('aiSessionId');
+    }
+  }, [sessionId]);
+
+  // Reload the latest page of the saved conversation when the chat is opened
+  useEffect(() => {
+    if (!isOpen || !sessionId || messages.length) return;
+    axios.get(`${API}/ai/history`, { params: { session_id: sessionId } })
+      .then((response) => {
+        setMessages((response.data.data || []).flatMap((turn) => [
+          { role: 'user', content: turn.user_message },
+          { role: 'assistant', content: turn.ai_response }
+        ]));
+      })
+      .catch((error) => console.error('Failed to load chat history:', error));
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [isOpen]);
+
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
@@ -35,20 +57,57 @@ const FloatingAI = () => {
     setLoading(true);
 
     try {
-      const response = await axios.post(`${API}/ai/chat`, {
-        message: input,
-        session_id: sessionId
+      // Stream the reply as Server-Sent Events so tokens render as they arrive
+      const response = await fetch(`${API}/ai/chat/stream`, {
+        method: 'POST',
+        credentials: 'include',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ message: input, session_id: sessionId })
       });
-
-      // Store session ID for conversation continuity
-      if (response.data.session_id) {
-        setSessionId(response.data.session_id);
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP ${response.status}`);
       }
 
-      const aiMessage = { role: 'assistant', content: response.data.response };
-      setMessages((prev) => [...prev, aiMessage]);
+      setMessages((prev) => [...prev, { role: 'assistant', content: '' }]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const block of events) {
+          const eventLine = block.split('\n').find((line) => line.startsWith('event: '));
+          const dataLine = block.split('\n').find((line) => line.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          const event = eventLine.slice(7);
+          const data = JSON.parse(dataLine.slice(6));
+
+          if (event === 'session') {
+            // Store session ID for conversation continuity
+            setSessionId(data.session_id);
+          } else if (event === 'token') {
+            setLoading(false);
+            setMessages((prev) => {
+              const last = prev[prev.length - 1];
+              return [...prev.slice(0, -1), { ...last, content: last.content + data.text }];
+            });
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (error) {
       console.error('Chat error:', error);
+      setMessages((prev) => (
+        prev.length && prev[prev.length - 1].role === 'assistant' && !prev[prev.length - 1].content
+          ? prev.slice(0, -1)
+          : prev
+      ));
       const errorMessage = {
         role: 'assistant',
         content: '❌ Sorry, I encountered an error. Please check if the AI API key is configured in Settings, or try again later.'
@@ -10,6 +10,8 @@ import { Building2, DollarSign, Target, RefreshCw, Download, FileText, Users, Sh
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from './ui/select';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
+import { fetchBranches, useBranches } from '../hooks/use-branches';
+import { dayToIso, inDateRange, toDay, weekKey } from '../lib/dates';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -43,7 +45,7 @@ const GlobalDashboard = ({ user, onLogout }) => {
   const [enquiryTrendData, setEnquiryTrendData] = useState([]);
   const [bookingsTrendData, setBookingsTrendData] = useState([]);
 
-  const branches = ['Kumarapalayam', 'Kavindapadi', 'Ammapettai', 'Anthiyur', 'Bhavani'];
+  const branches = useBranches();
 
   const handleBranchSelect = (branch) => {
     setSelectedBranch(branch);
@@ -57,19 +59,19 @@ const GlobalDashboard = ({ user, onLogout }) => {
       const salesResults = {};
       const enquiryResults = {};
       const bookingsResults = {};
+      const branchList = await fetchBranches();
       
-      await Promise.all(
-        branches.map(async (branch) => {
-          const [salesRes, enquiryRes, bookingsRes] = await Promise.all([
-            axios.get(`${API}/sheets/sales-data`, { params: { branch } }),
-            axios.get(`${API}/sheets/enquiry-data`, { params: { branch } }),
-            axios.get(`${API}/sheets/bookings-data`, { params: { branch } })
-          ]);
-          salesResults[branch] = salesRes.data.data || [];
-          enquiryResults[branch] = enquiryRes.data.data || [];
-          bookingsResults[branch] = bookingsRes.data.data || [];
-        })
-      );
+      // Every branch's three tabs in one batch request
+      const queries = branchList.flatMap((branch) => [
+        { tab: 'Sold', branch },
+        { tab: 'Enquiry', branch },
+        { tab: 'Bookings', branch }
+      ]);
+      const response = await axios.post(`${API}/sheets/batch`, { queries });
+      const byTab = { Sold: salesResults, Enquiry: enquiryResults, Bookings: bookingsResults };
+      response.data.results.forEach((result) => {
+        byTab[result.tab][result.branch] = result.data || [];
+      });
       setAllBranchData(salesResults);
       setAllEnquiryData(enquiryResults);
       setAllBookingsData(bookingsResults);
@@ -108,18 +110,9 @@ const GlobalDashboard = ({ user, onLogout }) => {
       let branchBookings = allBookingsData[branch] || [];
 
       if (startDate && endDate) {
-        branchSales = branchSales.filter(record => {
-          const date = record['Sales Date'];
-          return date && date >= startDate && date <= endDate;
-        });
-        branchEnquiries = branchEnquiries.filter(record => {
-          const date = record['Date'] || record['Enquiry Date'];
-          return date && date >= startDate && date <= endDate;
-        });
-        branchBookings = branchBookings.filter(record => {
-          const date = record['Booking Date'] || record['Date'];
-          return date && date >= startDate && date <= endDate;
-        });
+        branchSales = branchSales.filter(record => inDateRange(record['Sales Date'], startDate, endDate));
+        branchEnquiries = branchEnquiries.filter(record => inDateRange(record['Date'] || record['Enquiry Date'], startDate, endDate));
+        branchBookings = branchBookings.filter(record => inDateRange(record['Booking Date'] || record['Date'], startDate, endDate));
       }
 
       filteredSales = [...filteredSales, ...branchSales.map(r => ({ ...r, Branch: branch }))];
@@ -156,16 +149,14 @@ const GlobalDashboard = ({ user, onLogout }) => {
 
     data.forEach(record => {
       const branch = record['Branch'] || 'Unknown';
-      let dateStr = record[dateField] || record['Date'] || '';
-      let groupKey = dateStr;
-
-      if (trendPeriod === 'weekly' && dateStr) {
-        const date = new Date(dateStr);
-        const startOfYear = new Date(date.getFullYear(), 0, 1);
-        const weekNum = Math.ceil((((date - startOfYear) / 86400000) + startOfYear.getDay() + 1) / 7);
-        groupKey = `W${weekNum}`;
-      } else if (trendPeriod === 'monthly' && dateStr) {
-        groupKey = dateStr.substring(0, 7);
+      const dateStr = record[dateField] || record['Date'] || '';
+      const day = toDay(dateStr);
+      let groupKey = day === null ? dateStr : dayToIso(day);
+
+      if (trendPeriod === 'weekly' && day !== null) {
+        groupKey = weekKey(day);
+      } else if (trendPeriod === 'monthly' && day !== null) {
+        groupKey = groupKey.substring(0, 7);
       }
 
       if (groupKey) {
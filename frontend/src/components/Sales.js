@@ -9,6 +9,7 @@ import { Search, Filter, Download, Calendar, RefreshCw, FileDown, X } from 'luci
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from './ui/select';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
+import { useBranches } from '../hooks/use-branches';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -30,7 +31,7 @@ const Sales = ({ user, onLogout }) => {
   const [drillDownData, setDrillDownData] = useState(null);
   const [drillDownTitle, setDrillDownTitle] = useState('');
 
-  const branches = ['Kumarapalayam', 'Kavindapadi', 'Ammapettai', 'Anthiyur', 'Bhavani'];
+  const branches = useBranches();
 
   useEffect(() => {
     const savedBranch = localStorage.getItem('selectedBranch') || 'Kumarapalayam';
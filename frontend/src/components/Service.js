@@ -9,6 +9,7 @@ import { Wrench, Upload, FileText, Calendar, Search, Download, RefreshCw, FileDo
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from './ui/select';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
+import { useBranches } from '../hooks/use-branches';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -24,7 +25,7 @@ const Service = ({ user, onLogout }) => {
   const [lastSync, setLastSync] = useState(null);
   const [message, setMessage] = useState({ type: '', text: '' });
   const fileInputRef = useRef(null);
-  const branches = ['Kumarapalayam', 'Kavindapadi', 'Ammapettai', 'Anthiyur', 'Bhavani'];
+  const branches = useBranches();
 
   useEffect(() => {
     const savedBranch = localStorage.getItem('selectedBranch') || 'Kumarapalayam';
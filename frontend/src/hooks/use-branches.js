@@ -0,0 +1,39 @@
+import { useEffect, useState } from 'react';
+import axios from 'axios';
+
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
+// One request per page load, shared by every component
+let branchesRequest = null;
+
+export function fetchBranches() {
+  if (!branchesRequest) {
+    branchesRequest = axios
+      .get(`${API}/sheets/branches`)
+      .then((res) => res.data.branches || [])
+      .catch((error) => {
+        console.error('Failed to load branches:', error);
+        branchesRequest = null;
+        return [];
+      });
+  }
+  return branchesRequest;
+}
+
+// Branch names from the backend branch registry
+export function useBranches() {
+  const [branches, setBranches] = useState([]);
+
+  useEffect(() => {
+    let active = true;
+    fetchBranches().then((list) => {
+      if (active) setBranches(list);
+    });
+    return () => {
+      active = false;
+    };
+  }, []);
+
+  return branches;
+}
@@ -0,0 +1,59 @@
+// Sheet dates come as ISO, DD/MM/YYYY, DD-Mon-YYYY, ... (see backend/sheet_dates.py).
+// toDay() turns one into a day number (days since 1970-01-01, UTC), caching
+// each distinct string so filtering and trend bucketing parse it only once.
+
+const MONTHS = { jan: 1, feb: 2, mar: 3, apr: 4, may: 5, jun: 6, jul: 7, aug: 8, sep: 9, oct: 10, nov: 11, dec: 12 };
+const PATTERNS = [
+  // YYYY-MM-DD, YYYY/MM/DD
+  [/^(\d{4})[-/](\d{1,2})[-/](\d{1,2})/, (m) => [m[1], m[2], m[3]]],
+  // DD/MM/YYYY, DD-MM-YYYY, DD.MM.YYYY (day first, as the sheets are Indian)
+  [/^(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})/, (m) => [m[3], m[2], m[1]]],
+  // DD-Mon-YYYY, DD Mon YYYY, DD-Month-YY
+  [/^(\d{1,2})[\s-]([A-Za-z]{3,})[\s-](\d{2,4})/, (m) => [m[3], MONTHS[m[2].slice(0, 3).toLowerCase()], m[1]]],
+];
+
+const cache = new Map();
+
+function parse(value) {
+  for (const [pattern, parts] of PATTERNS) {
+    const match = pattern.exec(value);
+    if (!match) continue;
+    let [year, month, day] = parts(match).map(Number);
+    if (year < 100) year += 2000;
+    if (!month || month > 12 || !day || day > 31) return null;
+    const time = Date.UTC(year, month - 1, day);
+    // Reject roll-overs like 31/02
+    if (new Date(time).getUTCDate() !== day) return null;
+    return time / 86400000;
+  }
+  return null;
+}
+
+export function toDay(value) {
+  if (!value) return null;
+  const text = String(value).trim();
+  if (!cache.has(text)) {
+    if (cache.size > 50000) cache.clear();
+    cache.set(text, parse(text));
+  }
+  return cache.get(text);
+}
+
+// YYYY-MM-DD of a day number
+export function dayToIso(day) {
+  return new Date(day * 86400000).toISOString().slice(0, 10);
+}
+
+// "W<n>" week of the year for a day number (weeks start on Sunday)
+export function weekKey(day) {
+  const startOfYear = Date.UTC(new Date(day * 86400000).getUTCFullYear(), 0, 1) / 86400000;
+  return `W${Math.ceil(((day - startOfYear) + new Date(startOfYear * 86400000).getUTCDay() + 1) / 7)}`;
+}
+
+// Whether a record's date lies in [startDate, endDate] (inclusive, ISO bounds);
+// records without a readable date are kept only when keepUndated is set
+export function inDateRange(value, startDate, endDate, keepUndated = false) {
+  const day = toDay(value);
+  if (day === null) return keepUndated;
+  return day >= toDay(startDate) && day <= toDay(endDate);
+}